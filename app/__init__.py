@@ -1,19 +1,80 @@
 # app/__init__.py
 
 import os
+from datetime import date
+from importlib import import_module
 from flask import Flask, render_template
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
+from app.tenancy import Tenancy, TenantSession
+from app.ratelimit import RateLimiter
+from app.caching import ResponseCache, cached
+from app.metrics import Metrics
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': TenantSession})
 login_manager = LoginManager()
+tenancy = Tenancy()
+limiter = RateLimiter()
+response_cache = ResponseCache()
+monitoring = Metrics()
+
+# Command-line maintenance jobs (run with `flask --app run <command>`): name -> "module:command"
+CLI_COMMANDS = {
+    'archive-appointments': 'app.archive:archive_appointments_command',
+    'restore-appointment': 'app.archive:restore_appointment_command',
+    'restore-archived': 'app.archive:restore_archived_command',
+    'roll-partitions': 'app.archive:roll_partitions_command',
+    'compile-templates': 'app.templating:compile_templates_command',
+    'send-reminders': 'app.notifications:send_reminders_command',
+    'snapshot-analytics': 'app.analytics:snapshot_analytics_command',
+}
+
+class LazyCommands(AppGroup):
+    """``app.cli`` that imports a command's module only when the command is run or listed.
+
+    Web workers never run them, so they do not pay for their imports on boot.
+    """
+
+    def __init__(self, lazy, **kwargs):
+        super().__init__(**kwargs)
+        self.lazy = lazy
+
+    def list_commands(self, ctx):
+        return sorted({*super().list_commands(ctx), *self.lazy})
+
+    def get_command(self, ctx, name):
+        if name in self.lazy and name not in self.commands:
+            module, attribute = self.lazy[name].split(':')
+            self.add_command(getattr(import_module(module), attribute), name)
+        return super().get_command(ctx, name)
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.cli = LazyCommands(CLI_COMMANDS)
+
+    if app.config['PROXY_FIX_HOPS']:
+        # Trust X-Forwarded-* from exactly that many proxies (see config.py)
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    if app.config['TEMPLATE_CACHE_DIR']:
+        # Set before the Jinja environment is first created (lazily, on first render)
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = {
+            **app.jinja_options,
+            'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR']),
+        }
 
     db.init_app(app)
+    tenancy.init_app(app)
+    limiter.init_app(app)
+    response_cache.init_app(app)
+    monitoring.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
@@ -21,6 +82,7 @@ def create_app(config_class=Config):
     with app.app_context():
         # Import parts of our application
         from . import models
+        models.define_appointment_partitions(app.config['PARTITION_FIRST_YEAR'], date.today().year)
 
         # Import and register blueprints
         # This line imports the variables we defined in app/routes/__init__.py
@@ -31,10 +93,18 @@ def create_app(config_class=Config):
         app.register_blueprint(patient_bp)
         app.register_blueprint(doctor_bp) # <-- This line registers our new module
 
-        # Create database tables for our models
-        db.create_all()
+        # With a shared bytecode cache, loading every template up front is cheap
+        # and keeps the first request after a deploy from compiling them
+        if app.config['TEMPLATE_CACHE_DIR']:
+            from app.templating import warm_templates
+            warm_templates(app)
+
+        # Create database tables for our models (skipped when setup_db.py manages the schema)
+        if app.config['AUTO_CREATE_TABLES']:
+            db.create_all()
 
     @app.route('/')
+    @cached(scope='public', max_age=60)
     def index():
         return render_template('index.html')
 
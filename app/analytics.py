@@ -0,0 +1,233 @@
+# app/analytics.py
+"""Columnar snapshots and vectorised analytics for the admin reports page.
+
+``flask snapshot-analytics`` (run nightly) copies appointments from every
+partition, plus patients and doctors, into one ``.npy`` file per column
+under ``ANALYTICS_DIR/<timestamp>/``, precomputes the all-time report into
+``report.json``, and then points ``ANALYTICS_DIR/LATEST`` at it.
+The reports page reads that JSON. Date-range drill-downs recompute from the
+memory-mapped columns, so the OLTP database is never scanned for reports.
+
+NumPy is imported inside the functions that need it, so registering the
+CLI command does not add it to worker startup.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db
+from app.bulk import appointment_select, read_columns
+from app.models import AGE_BANDS, BLOOD_GROUPS, Doctor, DoctorArchive, Patient, PatientArchive
+from app.tenancy import current_tenant, for_each_tenant
+
+STATUSES = ('Scheduled', 'Completed', 'Cancelled')
+LEAD_TIME_BINS = ((0, 1, '< 1 day'), (1, 7, '1-6 days'), (7, 30, '1-4 weeks'), (30, 10 ** 6, '1 month +'))
+BOOKABLE_HOURS_PER_WEEKDAY = 10  # 8 AM - 6 PM, as enforced by BookAppointmentForm
+_CHUNK = 50000
+
+
+# --- Snapshot export ---
+
+def _codes(values, labels):
+    import numpy as np
+    lookup = {label: code for code, label in enumerate(labels)}
+    return np.fromiter((lookup.get(v, -1) for v in values), dtype=np.int8, count=len(values))
+
+
+def _dates(values, unit):
+    import numpy as np
+    # NULLs become NaT
+    return np.array(values, dtype=f'datetime64[{unit}]')
+
+
+def snapshot_root(app):
+    root = app.config['ANALYTICS_DIR']
+    tenant = current_tenant()
+    return os.path.join(root, tenant) if tenant else root
+
+
+def export_snapshot(root, keep=3):
+    """Write a new snapshot plus its precomputed report; return its directory."""
+    import numpy as np
+    # Local time, like appointment_date, so that past appointments are judged correctly
+    taken_at = datetime.now()
+    directory = os.path.join(root, taken_at.strftime('%Y%m%dT%H%M%S'))
+    os.makedirs(directory)
+
+    # Converters in AppointmentRow column order
+    appointments = read_columns(appointment_select(), {
+        'id': lambda v: np.array(v, dtype=np.int64),
+        'patient_id': lambda v: np.array(v, dtype=np.int32),
+        'doctor_id': lambda v: np.array(v, dtype=np.int32),
+        'appointment_date': lambda v: _dates(v, 's'),
+        'status': lambda v: _codes(v, STATUSES),
+        'created_at': lambda v: _dates(v, 's'),
+    }, batch_size=_CHUNK)
+    # Deleted and archived patients/doctors are kept so historic appointments still resolve
+    patients = read_columns(
+        db.union_all(
+            db.select(Patient.id, Patient.date_of_birth, Patient.blood_group),
+            db.select(PatientArchive.id, PatientArchive.date_of_birth, PatientArchive.blood_group),
+        ).order_by('id').execution_options(include_deleted=True),
+        {
+            'id': lambda v: np.array(v, dtype=np.int32),
+            'date_of_birth': lambda v: _dates(v, 'D'),
+            'blood_group': lambda v: _codes(v, BLOOD_GROUPS),
+        },
+        batch_size=_CHUNK,
+    )
+    doctors = db.session.execute(
+        db.union_all(
+            db.select(Doctor.id, Doctor.first_name, Doctor.last_name),
+            db.select(DoctorArchive.id, DoctorArchive.first_name, DoctorArchive.last_name),
+        ).order_by('id').execution_options(include_deleted=True)
+    ).all()
+
+    for prefix, columns in (('appointment', appointments), ('patient', patients)):
+        for name, values in columns.items():
+            np.save(os.path.join(directory, f'{prefix}.{name}.npy'), values)
+    with open(os.path.join(directory, 'doctors.json'), 'w') as f:
+        json.dump({str(d.id): f'{d.first_name} {d.last_name}' for d in doctors}, f)
+
+    snapshot = Snapshot(directory)
+    with open(os.path.join(directory, 'report.json'), 'w') as f:
+        json.dump(compute_report(snapshot), f)
+
+    # Publish atomically, then drop old snapshots
+    pointer = os.path.join(root, 'LATEST')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(os.path.basename(directory))
+    os.replace(pointer + '.tmp', pointer)
+    snapshots = sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+    for old in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return directory
+
+
+# --- Reading snapshots ---
+
+class Snapshot:
+    """Memory-mapped columns of one snapshot directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.taken_at = datetime.strptime(os.path.basename(directory), '%Y%m%dT%H%M%S')
+
+    def column(self, table, name):
+        import numpy as np
+        return np.load(os.path.join(self.directory, f'{table}.{name}.npy'), mmap_mode='r')
+
+    @property
+    def doctor_names(self):
+        with open(os.path.join(self.directory, 'doctors.json')) as f:
+            return {int(k): v for k, v in json.load(f).items()}
+
+    @property
+    def report(self):
+        with open(os.path.join(self.directory, 'report.json')) as f:
+            return json.load(f)
+
+
+def latest_snapshot(root):
+    try:
+        with open(os.path.join(root, 'LATEST')) as f:
+            return Snapshot(os.path.join(root, f.read().strip()))
+    except FileNotFoundError:
+        return None
+
+
+# --- Aggregates ---
+
+def compute_report(snapshot, start=None, end=None):
+    """All report aggregates for appointments dated in [start, end)."""
+    import numpy as np
+    dates = snapshot.column('appointment', 'appointment_date')
+    mask = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        mask &= dates >= np.datetime64(start, 's')
+    if end is not None:
+        mask &= dates < np.datetime64(end, 's')
+
+    dates = dates[mask]
+    status = snapshot.column('appointment', 'status')[mask]
+    doctor_ids = snapshot.column('appointment', 'doctor_id')[mask]
+    patient_ids = snapshot.column('appointment', 'patient_id')[mask]
+    created = snapshot.column('appointment', 'created_at')[mask]
+    total = int(len(dates))
+    taken_at = np.datetime64(snapshot.taken_at, 's')
+
+    report = {'total': total, 'snapshot_taken_at': snapshot.taken_at.strftime('%Y-%m-%d %H:%M')}
+
+    # Status distribution and monthly volume
+    counts = np.bincount(status[status >= 0], minlength=len(STATUSES))
+    report['status'] = {label: int(n) for label, n in zip(STATUSES, counts) if n}
+    months, month_counts = np.unique(dates.astype('datetime64[M]'), return_counts=True)
+    report['monthly'] = {str(m): int(n) for m, n in zip(months, month_counts)}
+
+    # Cancellations and no-shows (past appointments never marked Completed)
+    cancelled = int(counts[STATUSES.index('Cancelled')])
+    past = dates < taken_at
+    no_shows = int(np.count_nonzero(past & (status == STATUSES.index('Scheduled'))))
+    past_total = int(np.count_nonzero(past))
+    report['cancellation_rate'] = cancelled / total if total else 0.0
+    report['no_show_rate'] = no_shows / past_total if past_total else 0.0
+
+    # Lead time between booking and appointment, in days
+    valid = ~np.isnat(created)
+    lead_days = (dates[valid] - created[valid]).astype('timedelta64[s]').astype(np.float64) / 86400
+    lead_days = lead_days[lead_days >= 0]
+    report['lead_time'] = {
+        'mean_days': float(lead_days.mean()) if len(lead_days) else 0.0,
+        'median_days': float(np.median(lead_days)) if len(lead_days) else 0.0,
+        'p90_days': float(np.percentile(lead_days, 90)) if len(lead_days) else 0.0,
+        'histogram': {label: int(np.count_nonzero((lead_days >= lo) & (lead_days < hi)))
+                      for lo, hi, label in LEAD_TIME_BINS},
+    }
+
+    # Per-doctor utilization: booked (not cancelled) hours / bookable hours in range
+    if total:
+        first = np.datetime64(start, 'D') if start else dates.min().astype('datetime64[D]')
+        last = np.datetime64(end, 'D') if end else dates.max().astype('datetime64[D]') + 1
+        bookable = max(int(np.busday_count(first, last)), 1) * BOOKABLE_HOURS_PER_WEEKDAY
+    else:
+        bookable = 1
+    booked = status != STATUSES.index('Cancelled')
+    ids, per_doctor = np.unique(doctor_ids, return_counts=True)
+    ids_booked, per_doctor_booked = np.unique(doctor_ids[booked], return_counts=True)
+    booked_lookup = dict(zip(ids_booked.tolist(), per_doctor_booked.tolist()))
+    names = snapshot.doctor_names
+    report['doctors'] = sorted((
+        {'doctor': names.get(doctor_id, f'#{doctor_id}'),
+         'appointments': appointments,
+         'utilization': booked_lookup.get(doctor_id, 0) / bookable}
+        for doctor_id, appointments in zip(ids.tolist(), per_doctor.tolist())
+    ), key=lambda row: row['utilization'], reverse=True)
+
+    # Demographics of the distinct patients seen in range
+    all_patient_ids = snapshot.column('patient', 'id')
+    seen = np.unique(patient_ids)
+    idx = np.searchsorted(all_patient_ids, seen)
+    idx = idx[(idx < len(all_patient_ids)) & (all_patient_ids[np.clip(idx, 0, len(all_patient_ids) - 1)] == seen)]
+    birth = snapshot.column('patient', 'date_of_birth')[idx]
+    blood = snapshot.column('patient', 'blood_group')[idx]
+    ages = (taken_at.astype('datetime64[D]') - birth).astype(np.int64) / 365.25
+    report['age_bands'] = {label: int(np.count_nonzero((ages >= lo) & (ages < hi)))
+                           for lo, hi, label in AGE_BANDS}
+    blood_counts = np.bincount(blood[blood >= 0], minlength=len(BLOOD_GROUPS))
+    report['blood_groups'] = {label: int(n) for label, n in zip(BLOOD_GROUPS, blood_counts)}
+    return report
+
+
+@click.command('snapshot-analytics')
+@with_appcontext
+@for_each_tenant()
+def snapshot_analytics_command():
+    """Export a columnar snapshot and precompute the admin reports."""
+    app = current_app._get_current_object()
+    root = snapshot_root(app)
+    os.makedirs(root, exist_ok=True)
+    directory = export_snapshot(root, keep=app.config['ANALYTICS_KEEP'])
+    click.echo(f'Snapshot written to {directory}.')
@@ -0,0 +1,190 @@
+# app/archive.py
+"""Moves finished appointments and deleted doctors/patients out of the hot tables.
+
+Keeping old Completed/Cancelled rows out of ``appointment`` keeps that table
+(and its indexes) small. They are moved into the ``appointment_<yyyy>`` table
+of their year, so a date-range query only reads the years it covers and a
+finished year is a table of its own. Soft-deleted doctors and patients follow into
+``doctor_archive`` and ``patient_archive`` once no live appointment refers
+to them. Rows can be moved back with ``restore_archived``.
+"""
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import (Appointment, AppointmentArchive, Doctor, DoctorArchive, Patient, PatientArchive,
+                        appointment_partition, appointment_partitions, partition_for)
+from app.tenancy import current_tenant_engine, for_each_tenant
+
+ARCHIVED_STATUSES = ('Completed', 'Cancelled')
+
+# Live model -> archive model. Archived rows keep their id, so the live table
+# must never hand it out again (see ``sqlite_autoincrement`` on the models).
+# ``AppointmentArchive`` stands for all of its yearly partitions.
+ARCHIVES = {Appointment: AppointmentArchive, Doctor: DoctorArchive, Patient: PatientArchive}
+
+# Live appointments point at these; a row they point at is never archived
+_REFERENCED_BY = {Doctor: Appointment.doctor_id, Patient: Appointment.patient_id}
+
+_COLUMNS = ('id', 'patient_id', 'doctor_id', 'appointment_date',
+            'reason', 'notes', 'status', 'created_at')
+
+
+def archive_appointments(before, batch_size=500, statuses=ARCHIVED_STATUSES):
+    """Archive appointments dated before ``before`` in batches.
+
+    Each batch is copied and deleted in its own transaction, so a long run
+    never holds a write lock on the whole table. Returns the number of rows moved.
+    """
+    moved = 0
+    while True:
+        rows = db.session.execute(
+            db.select(*[getattr(Appointment, c) for c in _COLUMNS])
+            .where(Appointment.appointment_date < before,
+                   Appointment.status.in_(statuses))
+            .order_by(Appointment.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        now = datetime.utcnow()
+        by_partition = {}
+        for row in rows:
+            by_partition.setdefault(partition_for(row.appointment_date), []).append(
+                dict(row._mapping, archived_at=now))
+        for partition, values in by_partition.items():
+            db.session.execute(db.insert(partition), values)
+        db.session.execute(
+            db.delete(Appointment).where(Appointment.id.in_([row.id for row in rows]))
+        )
+        db.session.commit()
+        moved += len(rows)
+    return moved
+
+
+def archive_deleted(model, before, batch_size=500):
+    """Archive ``model`` rows (Doctor or Patient) soft-deleted before ``before``.
+
+    Rows still referenced by a live appointment stay where they are; they
+    become eligible once those appointments have been archived. Batched like
+    ``archive_appointments``. Returns the number of rows moved.
+    """
+    table = model.__table__
+    reference = _REFERENCED_BY[model]
+    moved = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table)
+            .where(table.c.deleted_at < before,
+                   ~db.exists().where(reference == table.c.id))
+            .order_by(table.c.id)
+            .limit(batch_size)
+            .execution_options(include_deleted=True)
+        ).all()
+        if not rows:
+            break
+
+        now = datetime.utcnow()
+        db.session.execute(
+            db.insert(ARCHIVES[model]),
+            [dict(row._mapping, archived_at=now) for row in rows],
+        )
+        db.session.execute(db.delete(model).where(table.c.id.in_([row.id for row in rows])))
+        db.session.commit()
+        moved += len(rows)
+    return moved
+
+
+def restore_archived(model, row_id):
+    """Move one archived row of ``model`` back into the live table.
+
+    Restored doctors and patients are still soft-deleted, so they reappear in
+    the admin's deleted lists. An appointment brings its archived doctor and
+    patient back with it. Returns the live row, or None if nothing was archived.
+    """
+    archived = find_archived(model, row_id)
+    if archived is None:
+        return None
+    if model is Appointment:
+        for referenced, referenced_id in ((Doctor, archived.doctor_id), (Patient, archived.patient_id)):
+            if db.session.get(referenced, referenced_id, execution_options={'include_deleted': True}) is None:
+                restore_archived(referenced, referenced_id)
+    row = model(**{column.name: getattr(archived, column.name) for column in model.__table__.columns})
+    db.session.delete(archived)
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+def find_archived(model, row_id):
+    """The archived row of ``model`` with ``row_id``, searching every yearly partition."""
+    if model is not Appointment:
+        return db.session.get(ARCHIVES[model], row_id)
+    for partition in appointment_partitions(live=False):
+        archived = db.session.get(partition, row_id)
+        if archived is not None:
+            return archived
+    return None
+
+
+def restore_appointment(appointment_id):
+    """Move a single archived appointment back into the live table."""
+    return restore_archived(Appointment, appointment_id)
+
+
+@click.command('archive-appointments')
+@click.option('--days', default=365, show_default=True,
+              help='Archive finished appointments older than this many days.')
+@click.option('--deleted-days', default=30, show_default=True,
+              help='Archive doctors and patients deleted more than this many days ago.')
+@click.option('--batch-size', default=500, show_default=True)
+@with_appcontext
+@for_each_tenant()
+def archive_appointments_command(days, deleted_days, batch_size):
+    """Move old Completed/Cancelled appointments and deleted doctors/patients into the archive tables."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    moved = archive_appointments(cutoff, batch_size=batch_size)
+    click.echo(f'Archived {moved} appointments dated before {cutoff:%Y-%m-%d}.')
+    # After the appointments, so that patients whose history just moved can follow
+    deleted_cutoff = datetime.utcnow() - timedelta(days=deleted_days)
+    for model in (Doctor, Patient):
+        moved = archive_deleted(model, deleted_cutoff, batch_size=batch_size)
+        click.echo(f'Archived {moved} {model.__tablename__}s deleted before {deleted_cutoff:%Y-%m-%d}.')
+
+
+@click.command('roll-partitions')
+@click.option('--years', default=1, show_default=True, help='Create the partitions of this many coming years.')
+@with_appcontext
+@for_each_tenant()
+def roll_partitions_command(years):
+    """Create this year's appointment partition and those of the coming years."""
+    engine = current_tenant_engine() or db.engine
+    this_year = datetime.now().year
+    for year in range(this_year, this_year + years + 1):
+        appointment_partition(year).__table__.create(engine, checkfirst=True)
+    click.echo(f'Appointment partitions exist up to {this_year + years}.')
+
+
+@click.command('restore-appointment')
+@click.argument('appointment_id', type=int)
+@with_appcontext
+@for_each_tenant(default_all=False)
+def restore_appointment_command(appointment_id):
+    """Move an archived appointment back into the live table."""
+    if restore_appointment(appointment_id) is None:
+        raise click.ClickException(f'No archived appointment with id {appointment_id}.')
+    click.echo(f'Restored appointment {appointment_id}.')
+
+
+@click.command('restore-archived')
+@click.argument('kind', type=click.Choice(['appointment', 'doctor', 'patient']))
+@click.argument('row_id', type=int)
+@with_appcontext
+@for_each_tenant(default_all=False)
+def restore_archived_command(kind, row_id):
+    """Move an archived appointment, doctor or patient back into its live table."""
+    model = {'appointment': Appointment, 'doctor': Doctor, 'patient': Patient}[kind]
+    if restore_archived(model, row_id) is None:
+        raise click.ClickException(f'No archived {kind} with id {row_id}.')
+    click.echo(f'Restored {kind} {row_id}.')
@@ -0,0 +1,331 @@
+# app/asgi.py
+"""Async booking API for high-concurrency clinics, served under ASGI.
+
+Run it next to the Flask app with any ASGI server and route ``/api/`` to it::
+
+    uvicorn app.asgi:application --workers 2
+
+* ``GET  /api/doctors/<id>/availability?date=YYYY-MM-DD`` - free hourly slots
+* ``POST /api/appointments`` - JSON ``{"doctor_id", "appointment_date", "reason"}``
+
+Patients are authenticated with the Flask session cookie (log in through the
+normal site first); the tenant is resolved exactly as in ``app.tenancy``.
+Database access goes through SQLAlchemy's asyncio engine (``aiosqlite`` for
+SQLite, ``asyncpg`` for PostgreSQL) using the models in ``app.models``, so a
+waiting request costs a coroutine, not a thread.
+
+A slot is reserved by a single INSERT. The ``ux_appointment_doctor_slot``
+unique index makes the database reject the second booking of the same
+doctor and time, however many requests race for it. The loser gets 409.
+
+The Flask session hooks do not run here. Soft-deleted rows are therefore
+filtered explicitly, and a booking bumps the ``appointment`` cache version
+itself, after its commit, so the Flask workers stop serving cached pages
+that predate it.
+"""
+import asyncio
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlsplit
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app import create_app
+from app.caching import bump_versions
+from app.models import Appointment, Doctor, Patient
+from app.tenancy import TenantEngines, unscoped_user_id
+
+logger = logging.getLogger(__name__)
+
+# Same booking rules as BookAppointmentForm: weekdays, 8 AM - 6 PM, 24 hours' notice
+OPENING_HOUR = 8
+CLOSING_HOUR = 18
+NOTICE = timedelta(hours=24)
+MAX_BODY = 64 * 1024
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+
+def async_url(uri):
+    """The asyncio-driver equivalent of a synchronous database URI."""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver known for {backend!r} databases')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+class AsyncTenantEngines(TenantEngines):
+    """``TenantEngines`` for asyncio engines, bounded by ``TENANT_MAX_ENGINES`` the same way.
+
+    Only call ``get`` from a coroutine: evicted engines are disposed in a task.
+    """
+
+    def __init__(self, max_engines):
+        super().__init__(max_engines)
+        self._disposals = set()
+
+    def _create(self, uri):
+        url = async_url(uri)
+        options = {}
+        if url.get_backend_name() == 'sqlite':
+            # SQLite takes one writer at a time; queueing coroutines for a single
+            # connection beats failing them with "database is locked"
+            options = {'poolclass': AsyncAdaptedQueuePool, 'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60}
+        return create_async_engine(url, **options)
+
+    def _dispose(self, engine):
+        task = asyncio.get_running_loop().create_task(engine.dispose())
+        # Hold a reference until it is done, or the task may be garbage collected
+        self._disposals.add(task)
+        task.add_done_callback(self._disposals.discard)
+
+    async def dispose_all(self):
+        for _, engine in self.items():
+            await engine.dispose()
+        await asyncio.gather(*self._disposals)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class BookingAPI:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self._engines = AsyncTenantEngines(self.config['TENANT_MAX_ENGINES'])  # tenant (None when single-tenant)
+
+    # --- ASGI entry point ---
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        try:
+            status, payload, after = await self._dispatch(scope, receive)
+        except HTTPError as e:
+            status, payload, after = e.status, {'error': e.message}, None
+        except Exception:
+            logger.exception('Unhandled error in booking API')
+            status, payload, after = 500, {'error': 'Internal server error.'}, None
+
+        body = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'cache-control', b'no-store'),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+        if after is not None:
+            await after()  # Work the client does not need to wait for
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._engines.dispose_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, scope, receive):
+        parts = scope['path'].strip('/').split('/')
+        method = scope['method']
+        if method == 'GET' and len(parts) == 4 and parts[:2] == ['api', 'doctors'] and parts[3] == 'availability':
+            return await self.availability(scope, _int(parts[2]))
+        if method == 'POST' and parts == ['api', 'appointments']:
+            return await self.book(scope, receive)
+        raise HTTPError(404, 'Not found.')
+
+    # --- Views ---
+
+    async def availability(self, scope, doctor_id):
+        tenant, _ = self._authenticate(scope)
+        query = parse_qs(scope['query_string'].decode())
+        try:
+            day = date.fromisoformat(query['date'][0])
+        except (KeyError, ValueError):
+            raise HTTPError(400, 'Pass ?date=YYYY-MM-DD.')
+
+        opening = datetime.combine(day, time(OPENING_HOUR))
+        closing = datetime.combine(day, time(CLOSING_HOUR))
+        async with self.session(tenant) as session:
+            await self._available_doctor(session, doctor_id)
+            taken = set(await session.scalars(
+                select(Appointment.appointment_date)
+                .where(Appointment.doctor_id == doctor_id, Appointment.status == 'Scheduled',
+                       Appointment.appointment_date >= opening, Appointment.appointment_date < closing)
+            ))
+        earliest = datetime.now() + NOTICE
+        slots = [] if day.weekday() >= 5 else [
+            opening + timedelta(hours=hour) for hour in range(CLOSING_HOUR - OPENING_HOUR)
+        ]
+        free = [slot.strftime('%Y-%m-%dT%H:%M') for slot in slots if slot >= earliest and slot not in taken]
+        return 200, {'doctor_id': doctor_id, 'date': day.isoformat(), 'slots': free}, None
+
+    async def book(self, scope, receive):
+        _check_same_origin(scope)
+        tenant, user_id = self._authenticate(scope)
+        data = await _read_json(scope, receive)
+        doctor_id = _int(data.get('doctor_id'))
+        reason = (data.get('reason') or '').strip()
+        try:
+            when = datetime.strptime(data.get('appointment_date') or '', '%Y-%m-%dT%H:%M')
+        except (TypeError, ValueError):
+            raise HTTPError(400, 'appointment_date must look like 2025-01-31T09:00.')
+        if not reason:
+            raise HTTPError(400, 'Please give a reason for the appointment.')
+        _validate_slot(when)
+
+        async with self.session(tenant) as session:
+            # Same lookup as Patient.of_user: a deleted profile is refused, not ignored
+            profile = (await session.execute(
+                select(Patient.id, Patient.deleted_at).where(Patient.user_id == user_id)
+                .order_by(Patient.deleted_at.isnot(None), Patient.id).limit(1))).first()
+            if profile is None:
+                raise HTTPError(403, 'Please create your patient profile first.')
+            if profile.deleted_at is not None:
+                raise HTTPError(403, 'Your patient profile has been deactivated.')
+            patient_id = profile.id
+            await self._available_doctor(session, doctor_id)
+
+            appointment = Appointment(patient_id=patient_id, doctor_id=doctor_id, appointment_date=when,
+                                      reason=reason, status='Scheduled')
+            session.add(appointment)
+            try:
+                await session.flush()
+            except IntegrityError:
+                raise HTTPError(409, 'That time slot has just been booked. Please choose another time.')
+            await session.commit()
+            appointment_id = appointment.id
+
+        # After the session has returned its connection, as the Flask session's
+        # hooks do: concurrent bookings never wait on the cache_version row
+        await self._bump_versions(tenant, ['appointment'])
+
+        async def notify_booked():
+            await asyncio.to_thread(self._notify, tenant, appointment_id)
+
+        return 201, {'id': appointment_id, 'doctor_id': doctor_id,
+                     'appointment_date': when.strftime('%Y-%m-%dT%H:%M'), 'status': 'Scheduled'}, notify_booked
+
+    # --- Helpers ---
+
+    def engine(self, tenant):
+        uri = self.config['TENANT_DATABASES'][tenant] if tenant else self.config['SQLALCHEMY_DATABASE_URI']
+        return self._engines.get(tenant, uri)
+
+    def session(self, tenant):
+        return AsyncSession(self.engine(tenant), expire_on_commit=False)
+
+    async def _bump_versions(self, tenant, tables):
+        try:
+            async with self.engine(tenant).begin() as connection:
+                await connection.run_sync(bump_versions, tables)
+        except SQLAlchemyError:
+            # The booking is committed; only cached pages stay stale a while
+            logger.exception('Could not bump the cache versions of %s', ', '.join(tables))
+
+    def _authenticate(self, scope):
+        """Return ``(tenant, user id)`` from the Flask session cookie, or raise 401."""
+        headers = _headers(scope)
+        tenant = None
+        if self.config['TENANT_DATABASES']:
+            tenant = headers.get(self.config['TENANT_HEADER'].lower()) or \
+                headers.get('host', '').split(':', 1)[0].split('.', 1)[0]
+            if tenant not in self.config['TENANT_DATABASES']:
+                raise HTTPError(404, 'Not found.')
+
+        cookie = SimpleCookie(headers.get('cookie', '')).get(self.config['SESSION_COOKIE_NAME'])
+        if cookie is None:
+            raise HTTPError(401, 'Please log in.')
+        try:
+            session = self.serializer.loads(
+                cookie.value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            raise HTTPError(401, 'Please log in.')
+        # A session is only valid for the hospital it was created in (see scoped_user_id)
+        user_id = unscoped_user_id(session.get('_user_id'), tenant)
+        if user_id is None:
+            raise HTTPError(401, 'Please log in.')
+        return tenant, user_id
+
+    async def _available_doctor(self, session, doctor_id):
+        available = await session.scalar(
+            select(Doctor.id).where(Doctor.id == doctor_id, Doctor.is_available == True,  # noqa: E712
+                                    Doctor.deleted_at.is_(None)))
+        if available is None:
+            raise HTTPError(404, 'This doctor is not available for appointments.')
+
+    def _notify(self, tenant, appointment_id):
+        # Notifications use the synchronous session, so they run in a worker thread
+        from flask import g
+        from app.notifications import notify
+        with self.flask_app.app_context():
+            g.tenant = tenant
+            appointment = Appointment.query.get(appointment_id)
+            if appointment is not None:
+                notify(appointment, 'booked')
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def _check_same_origin(scope):
+    # The session cookie authenticates the request, so refuse cross-site posts
+    headers = _headers(scope)
+    if headers.get('content-type', '').split(';', 1)[0].strip() != 'application/json':
+        raise HTTPError(415, 'Send a JSON body.')
+    origin = headers.get('origin')
+    if origin and urlsplit(origin).netloc != headers.get('host'):
+        raise HTTPError(403, 'Cross-origin requests are not allowed.')
+
+
+async def _read_json(scope, receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY:
+            raise HTTPError(413, 'Request body too large.')
+        if not message.get('more_body'):
+            break
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, 'Invalid JSON.')
+    if not isinstance(data, dict):
+        raise HTTPError(400, 'Expected a JSON object.')
+    return data
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f'Invalid id {value!r}.')
+
+
+def _validate_slot(when):
+    if when < datetime.now() + NOTICE:
+        raise HTTPError(400, 'Appointments must be scheduled at least 24 hours in advance.')
+    if when.weekday() >= 5:
+        raise HTTPError(400, 'Appointments are only available on weekdays.')
+    if not OPENING_HOUR <= when.hour < CLOSING_HOUR or when.minute:
+        raise HTTPError(400, 'Appointments start on the hour between 8 AM and 6 PM.')
+
+
+application = BookingAPI(create_app())
@@ -0,0 +1,90 @@
+# app/bulk.py
+"""Lightweight read path for processing many appointments.
+
+ORM instances carry an identity map entry, instrumentation state and a
+``__dict__`` each. Jobs that only read millions of rows (exports,
+analytics, rescheduling) should use this module instead. It runs Core
+``select()`` statements and streams the results in batches, either as
+``__slots__`` records or as NumPy column arrays. Neither form is attached
+to the session, so memory stays flat no matter how many rows are read.
+"""
+from app import db
+from app.models import Appointment, appointment_rows
+
+BATCH_SIZE = 10000
+
+
+class AppointmentRow:
+    """Read-only view of one appointment (live or archived)."""
+
+    __slots__ = ('id', 'patient_id', 'doctor_id', 'appointment_date', 'status', 'created_at')
+
+    def __init__(self, id, patient_id, doctor_id, appointment_date, status, created_at):
+        self.id = id
+        self.patient_id = patient_id
+        self.doctor_id = doctor_id
+        self.appointment_date = appointment_date
+        self.status = status
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f'<AppointmentRow {self.id} {self.appointment_date} {self.status}>'
+
+
+def stream(statement, batch_size=BATCH_SIZE):
+    """Execute ``statement`` with a server-side cursor; yield lists of rows."""
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    yield from result.partitions()
+
+
+def iter_rows(statement, row_class, batch_size=BATCH_SIZE):
+    """Yield ``row_class(*row)`` for every row of ``statement``, streamed."""
+    for batch in stream(statement, batch_size):
+        for row in batch:
+            yield row_class(*row)
+
+
+def appointment_select(start=None, end=None, partitions=True):
+    """Core select of the ``AppointmentRow`` columns, optionally in [start, end).
+
+    With ``partitions`` the archive is included where the range needs it.
+    """
+    if partitions:
+        table = appointment_rows(start, end)
+        return db.select(*(table.c[name] for name in AppointmentRow.__slots__))
+    columns = Appointment.__table__.c
+    query = db.select(*(columns[name] for name in AppointmentRow.__slots__))
+    if start is not None:
+        query = query.where(columns.appointment_date >= start)
+    if end is not None:
+        query = query.where(columns.appointment_date < end)
+    return query
+
+
+def iter_appointments(start=None, end=None, partitions=True, batch_size=BATCH_SIZE):
+    """Stream ``AppointmentRow`` records ordered as stored."""
+    return iter_rows(appointment_select(start, end, partitions), AppointmentRow, batch_size)
+
+
+def column_batches(statement, converters, batch_size=BATCH_SIZE):
+    """Yield one ``{name: array}`` dict per batch of ``statement``.
+
+    ``converters`` maps a name to each selected column, in order, with a
+    function turning a tuple of values into an array.
+    """
+    for batch in stream(statement, batch_size):
+        columns = zip(*batch)
+        yield {name: convert(values) for (name, convert), values in zip(converters.items(), columns)}
+
+
+def read_columns(statement, converters, batch_size=BATCH_SIZE):
+    """All of ``statement`` as one array per column, built batch by batch."""
+    import numpy as np
+    parts = {name: [] for name in converters}
+    for batch in column_batches(statement, converters, batch_size):
+        for name, values in batch.items():
+            parts[name].append(values)
+    return {
+        name: np.concatenate(parts[name]) if parts[name] else convert(())
+        for name, convert in converters.items()
+    }
@@ -0,0 +1,242 @@
+# app/caching.py
+"""Response caching and conditional GETs for pages that rarely change.
+
+Views opt in with a decorator naming the tables their page is built from::
+
+    @cached(tables=('patient', 'appointment'), scope='user')
+
+The cache key is the endpoint, its URL and query arguments, the tenant,
+the user (for ``scope='user'``), and the current *version* of each listed
+table. Committing a change to a table bumps its version (see
+``_record_changes``), so stale entries are never served again; they age
+out of the LRU instead. Every cached response carries an ``ETag``, so a
+browser revalidating a page it already has gets an empty ``304``.
+
+``scope='public'`` pages are shared by all anonymous visitors; logged-in
+users get their own copy because the navigation bar differs.
+
+Versions live in the ``cache_version`` table of each tenant's database, so
+a change committed by any worker, the ASGI app or a CLI job invalidates the
+pages cached by every process. They are bumped right after the commit, in a
+short transaction of their own, so concurrent writers do not queue on the
+``cache_version`` row lock for the length of each other's transactions.
+A page rendered between the commit and the bump is cached under the old
+version, which nobody asks for once the bump lands; if the bump itself fails,
+pages go stale until ``RESPONSE_CACHE_TIMEOUT``. Reading the versions costs
+one primary-key lookup per cached request. The responses themselves stay in a per-process
+``MemoryCache`` unless ``RESPONSE_CACHE_STORAGE`` names a shared store.
+"""
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import current_app, has_app_context, request, session
+from flask_login import current_user
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.utils import import_string
+from app.tenancy import current_tenant
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """Per-process LRU of responses."""
+
+    def __init__(self, max_entries=1000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.store = None
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+        app.config.setdefault('RESPONSE_CACHE_STORAGE', 'app.caching.MemoryCache')
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1000)
+        app.config.setdefault('RESPONSE_CACHE_TIMEOUT', 300)
+
+        self.enabled = app.config['RESPONSE_CACHE_ENABLED']
+        self.store = import_string(app.config['RESPONSE_CACHE_STORAGE'])(
+            app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_TIMEOUT'])
+        app.extensions['response_cache'] = self
+
+        session = app.extensions['sqlalchemy'].session
+        for name, listener in _LISTENERS:
+            if not event.contains(session, name, listener):
+                event.listen(session, name, listener)
+
+    def versions(self, tables):
+        """Current version of each of ``tables`` in the current tenant's database."""
+        from app import db
+        from app.models import CacheVersion
+        if not tables:
+            return ()
+        found = dict(db.session.execute(
+            select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(tables))
+        ).all())
+        return tuple(found.get(table, 0) for table in tables)
+
+
+def bump_versions(connection, tables):
+    """Increment the ``cache_version`` rows of ``tables`` in the connection's transaction.
+
+    Takes a plain connection so the ASGI app can call it through ``run_sync``.
+    """
+    from app.models import CacheVersion
+    table = CacheVersion.__table__
+    # Only the dialect in use is imported; each costs tens of milliseconds at boot
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        upsert = None
+    # Always in the same order, so two commits touching the same tables cannot deadlock
+    for name in sorted(set(tables)):
+        if upsert is not None:
+            connection.execute(upsert(table).values(name=name, version=1).on_conflict_do_update(
+                index_elements=[table.c.name], set_={'version': table.c.version + 1}))
+        elif not connection.execute(
+                update(table).where(table.c.name == name).values(version=table.c.version + 1)).rowcount:
+            connection.execute(insert(table).values(name=name, version=1))
+
+
+def cached(tables=(), scope='user', max_age=0):
+    """Cache the view's successful GET responses; see the module docstring.
+
+    Place it below the route's access checks so they still run on every
+    request. ``max_age`` lets browsers reuse a ``public`` page without
+    asking; otherwise they revalidate each time and usually get a 304.
+    """
+    if scope not in ('public', 'user'):
+        raise ValueError(f'Unknown cache scope {scope!r}')
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions['response_cache']
+            # Pages that show flashed messages must be rendered (and consume them)
+            if not cache.enabled or request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            tenant = current_tenant()
+            user = current_user.get_id() if current_user.is_authenticated else None
+            key = (tenant, request.endpoint, tuple(sorted(request.view_args.items())),
+                   tuple(sorted(request.args.items(multi=True))),
+                   user,  # public pages are only shared between anonymous visitors
+                   cache.versions(tables))
+
+            entry = cache.store.get(key)
+            if entry is None:
+                cache.misses += 1
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.blake2b(body, digest_size=16).hexdigest())
+                cache.store.set(key, entry)
+            else:
+                cache.hits += 1
+                body, mimetype, _ = entry
+                response = current_app.response_class(body, mimetype=mimetype)
+
+            response.set_etag(entry[2])
+            if scope == 'public' and user is None:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+            else:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+# --- Invalidation on commit ---
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _record_changes(session, flush_context):
+    tables = _changed_tables(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            tables.add(table.name)
+
+
+def _record_bulk_changes(execute_state):
+    # session.execute(update(...)) and friends bypass the flush
+    if execute_state.is_update or execute_state.is_delete or execute_state.is_insert:
+        table = getattr(execute_state.statement, 'table', None)
+        if table is not None:
+            _changed_tables(execute_state.session).add(table.name)
+
+
+def _mark_committed(session):
+    tables = session.info.pop('changed_tables', None)
+    if tables and has_app_context() and 'response_cache' in current_app.extensions:
+        session.info['committed_tables'] = (session.get_bind(), tables)
+
+
+def _invalidate(session, transaction):
+    # Runs once the session has given its connection back to the pool, so the
+    # bump takes that connection instead of waiting for a second one
+    if transaction.parent is not None or 'committed_tables' not in session.info:
+        return
+    engine, tables = session.info.pop('committed_tables')
+    try:
+        with engine.begin() as connection:
+            bump_versions(connection, tables)
+    except SQLAlchemyError:
+        # The change itself is committed; failing the caller now would only mislead it
+        logger.exception('Could not bump the cache versions of %s', ', '.join(sorted(tables)))
+
+
+def _discard_changes(session):
+    session.info.pop('changed_tables', None)
+
+
+_LISTENERS = (
+    ('after_flush', _record_changes),
+    ('do_orm_execute', _record_bulk_changes),
+    ('after_commit', _mark_committed),
+    ('after_transaction_end', _invalidate),
+    ('after_rollback', _discard_changes),
+)
@@ -1,10 +1,4 @@
-import os
-
-class Config:
-    # Secret key for session management
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-for-development'
-    
-    # Database configuration
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'hospital.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
+# app/config.py
+# The application is configured from the top-level config.py; this module only
+# re-exports it so both import paths load the same settings.
+from config import Config  # noqa: F401
@@ -0,0 +1,308 @@
+# app/metrics.py
+"""Health checks and Prometheus metrics.
+
+* ``/healthz`` - liveness: the process answers; touches nothing else
+* ``/readyz``  - readiness: ``SELECT 1`` against the database, bounded by
+  ``READINESS_TIMEOUT`` seconds
+* ``/metrics`` - Prometheus text format: requests and latency per endpoint,
+  connection pool usage, response cache and rate limiter counters, and
+  users active within ``METRICS_SESSION_WINDOW`` seconds
+
+Each thread counts into its own dictionaries, so the request path takes no
+lock; a scrape sums them. The dictionaries of threads that have exited are
+folded into a shared total, so servers that start a thread per request do
+not grow the registry. With several worker processes set ``METRICS_DIR``:
+every worker then writes its totals to ``<METRICS_DIR>/<pid>.json`` at most
+every ``METRICS_WRITE_INTERVAL`` seconds (and on exit), and ``/metrics``
+adds up all files, whichever worker answers. Counters of exited workers
+keep counting towards the totals; gauges only come from recently written
+files. Empty the directory when deploying.
+"""
+import atexit
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import Lock, current_thread, local
+from flask import Response, current_app, g, request
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app.tenancy import current_tenant, current_tenant_engine, tenant_optional
+
+# Prometheus' default latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+class _ThreadCounters(local):
+    # __init__ runs once in every thread that records a request
+    def __init__(self, register):
+        self.requests = {}  # (endpoint, method, status) -> count
+        self.latency = {}  # endpoint -> [count per bucket..., +Inf count, sum of seconds]
+        register(self.requests, self.latency)
+
+
+def _add_counters(requests, latency, thread_requests, thread_latency):
+    for key, count in thread_requests.copy().items():
+        requests[key] = requests.get(key, 0) + count
+    for endpoint, histogram in thread_latency.copy().items():
+        total = latency.get(endpoint, [0] * len(histogram))
+        latency[endpoint] = [a + b for a, b in zip(total, histogram)]
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self._registry = []  # (thread, requests, latency) of each thread that has counted
+        self._finished = ({}, {})  # requests and latency of threads that have exited
+        self._lock = Lock()
+        self._counters = _ThreadCounters(self._register)
+        self._seen = {}  # "tenant|user id" -> last request (wall clock)
+        self._written = 0.0
+        self._ping = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_DIR', None)
+        app.config.setdefault('METRICS_WRITE_INTERVAL', 5)
+        app.config.setdefault('METRICS_SESSION_WINDOW', 900)
+        app.config.setdefault('READINESS_TIMEOUT', 2.0)
+
+        app.extensions['metrics'] = self
+        # First, so requests that tenancy (404) or rate limiting (429) stop are timed too
+        app.before_request_funcs.setdefault(None, []).insert(0, _start_timer)
+        app.after_request(self._record)
+        app.add_url_rule('/healthz', 'healthz', healthz)
+        app.add_url_rule('/readyz', 'readyz', readyz)
+        app.add_url_rule('/metrics', 'metrics', metrics)
+        if app.config['METRICS_DIR']:
+            os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+            atexit.register(self.write, app)
+
+    # --- Request path ---
+
+    def _record(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'  # keeps 404 scans from adding label values
+
+        counters = self._counters
+        key = (endpoint, request.method, response.status_code)
+        counters.requests[key] = counters.requests.get(key, 0) + 1
+        histogram = counters.latency.get(endpoint)
+        if histogram is None:
+            histogram = counters.latency[endpoint] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(BUCKETS, elapsed)] += 1
+        histogram[-1] += elapsed
+
+        # Only a user the request already loaded: current_user would query for one
+        # on every static file, health check and rejected request
+        user = g.get('_login_user')
+        if user is not None and user.is_authenticated:
+            self._seen[f'{current_tenant()}|{user.get_id()}'] = time.time()
+
+        app = current_app._get_current_object()
+        if app.config['METRICS_DIR'] and time.monotonic() - self._written > app.config['METRICS_WRITE_INTERVAL']:
+            self._written = time.monotonic()
+            self.write(app)
+        return response
+
+    def _register(self, requests, latency):
+        with self._lock:
+            self._fold_finished()
+            self._registry.append((current_thread(), requests, latency))
+
+    def _fold_finished(self):
+        # Called with the lock held. An exited thread never touches its counters again
+        alive = []
+        for thread, requests, latency in self._registry:
+            if thread.is_alive():
+                alive.append((thread, requests, latency))
+            else:
+                _add_counters(*self._finished, requests, latency)
+        self._registry = alive
+
+    # --- Collection ---
+
+    def snapshot(self, app):
+        """This process's counters and gauges, as JSON-serialisable data."""
+        with self._lock:
+            self._fold_finished()
+            threads = list(self._registry)
+            requests, latency = {}, {}
+            _add_counters(requests, latency, *self._finished)
+        for _, thread_requests, thread_latency in threads:
+            _add_counters(requests, latency, thread_requests, thread_latency)
+
+        cutoff = time.time() - app.config['METRICS_SESSION_WINDOW']
+        for key, seen in list(self._seen.items()):
+            if seen < cutoff:
+                self._seen.pop(key, None)
+
+        cache = app.extensions.get('response_cache')
+        limiter = app.extensions.get('ratelimit')
+        return {
+            'written': time.time(),
+            'requests': [[*key, count] for key, count in requests.items()],
+            'latency': latency,
+            'counters': {
+                'cache_hits': cache.hits if cache else 0,
+                'cache_misses': cache.misses if cache else 0,
+                'ratelimit_rejected': limiter.rejected if limiter else 0,
+            },
+            'gauges': {
+                'pool': _pool_usage(app),
+                'ratelimit_keys': len(limiter.store) if limiter and hasattr(limiter.store, '__len__') else 0,
+            },
+            'sessions': list(self._seen),
+        }
+
+    def write(self, app):
+        path = os.path.join(app.config['METRICS_DIR'], f'{os.getpid()}.json')
+        with app.app_context():  # Also called at exit, outside any request
+            snapshot = self.snapshot(app)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def collect(self, app):
+        """Snapshots of this process and, with ``METRICS_DIR``, every other worker."""
+        snapshots = [self.snapshot(app)]
+        if app.config['METRICS_DIR']:
+            own = os.path.join(app.config['METRICS_DIR'], f'{os.getpid()}.json')
+            for path in glob.glob(os.path.join(app.config['METRICS_DIR'], '*.json')):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # Being replaced right now
+        return snapshots
+
+    def render(self, app):
+        snapshots = self.collect(app)
+        stale = time.time() - 3 * app.config['METRICS_WRITE_INTERVAL']
+        live = [s for s in snapshots if s['written'] >= stale]
+
+        requests, latency, counters = {}, {}, {}
+        for s in snapshots:
+            for endpoint, method, status, count in s['requests']:
+                key = (endpoint, method, status)
+                requests[key] = requests.get(key, 0) + count
+            for endpoint, histogram in s['latency'].items():
+                total = latency.setdefault(endpoint, [0] * len(histogram))
+                latency[endpoint] = [a + b for a, b in zip(total, histogram)]
+            for name, value in s['counters'].items():
+                counters[name] = counters.get(name, 0) + value
+
+        lines = [
+            '# HELP hospital_http_requests_total HTTP requests by endpoint, method and status.',
+            '# TYPE hospital_http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'hospital_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP hospital_http_request_duration_seconds Time spent handling requests, by endpoint.',
+            '# TYPE hospital_http_request_duration_seconds histogram',
+        ]
+        for endpoint, histogram in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, '+Inf'), histogram):
+                cumulative += count
+                lines.append(f'hospital_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'hospital_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram[-1]:.6f}')
+            lines.append(f'hospital_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+
+        pool = {}
+        for s in live:
+            for database, usage in s['gauges']['pool'].items():
+                for state, value in usage.items():
+                    pool[database, state] = pool.get((database, state), 0) + value
+        lines += [
+            '# HELP hospital_db_pool_connections Database connections by pool state.',
+            '# TYPE hospital_db_pool_connections gauge',
+        ]
+        lines += [f'hospital_db_pool_connections{{database="{database}",state="{state}"}} {value}'
+                  for (database, state), value in sorted(pool.items())]
+
+        hits, misses = counters.get('cache_hits', 0), counters.get('cache_misses', 0)
+        lines += [
+            '# HELP hospital_response_cache_requests_total Cacheable requests by result.',
+            '# TYPE hospital_response_cache_requests_total counter',
+            f'hospital_response_cache_requests_total{{result="hit"}} {hits}',
+            f'hospital_response_cache_requests_total{{result="miss"}} {misses}',
+            '# HELP hospital_response_cache_hit_ratio Share of cacheable requests served from the cache.',
+            '# TYPE hospital_response_cache_hit_ratio gauge',
+            f'hospital_response_cache_hit_ratio {hits / (hits + misses) if hits + misses else 0:.4f}',
+            '# HELP hospital_ratelimit_rejected_total Requests rejected by the rate limiter.',
+            '# TYPE hospital_ratelimit_rejected_total counter',
+            f"hospital_ratelimit_rejected_total {counters.get('ratelimit_rejected', 0)}",
+            '# HELP hospital_ratelimit_tracked_keys Clients currently tracked by the rate limiter.',
+            '# TYPE hospital_ratelimit_tracked_keys gauge',
+            f"hospital_ratelimit_tracked_keys {sum(s['gauges']['ratelimit_keys'] for s in live)}",
+            '# HELP hospital_active_sessions Users who made a request within METRICS_SESSION_WINDOW.',
+            '# TYPE hospital_active_sessions gauge',
+            f"hospital_active_sessions {len({key for s in live for key in s['sessions']})}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def ping(self, engine, timeout):
+        """Run ``SELECT 1`` on ``engine``; raise TimeoutError after ``timeout`` seconds.
+
+        A single worker thread runs the pings, so a hung database cannot pile
+        up probe threads; further probes simply time out as well.
+        """
+        if self._ping is None:
+            self._ping = ThreadPoolExecutor(1, thread_name_prefix='readyz')
+        self._ping.submit(_select_one, engine).result(timeout=timeout)
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _select_one(engine):
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def _pool_usage(app):
+    engines = [('default', app.extensions['sqlalchemy'].engine)]
+    engines += app.extensions['tenancy'].items()
+    usage = {}
+    for name, engine in engines:
+        pool = engine.pool
+        if hasattr(pool, 'checkedout'):  # QueuePool and friends; NullPool/StaticPool hold nothing
+            usage[name] = {'checked_out': pool.checkedout(), 'idle': pool.checkedin()}
+    return usage
+
+
+# --- Views ---
+
+@tenant_optional
+def healthz():
+    return Response('ok\n', mimetype='text/plain')
+
+
+@tenant_optional
+def readyz():
+    # The hospital named in the request, if any, else the default database
+    engine = current_tenant_engine() or current_app.extensions['sqlalchemy'].engine
+    try:
+        current_app.extensions['metrics'].ping(engine, current_app.config['READINESS_TIMEOUT'])
+    except TimeoutError:
+        return Response('database timeout\n', 503, mimetype='text/plain')
+    except SQLAlchemyError:
+        return Response('database unavailable\n', 503, mimetype='text/plain')
+    return Response('ok\n', mimetype='text/plain')
+
+
+@tenant_optional
+def metrics():
+    app = current_app._get_current_object()
+    return Response(app.extensions['metrics'].render(app), mimetype='text/plain; version=0.0.4')
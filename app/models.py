@@ -1,8 +1,56 @@
 # app/models.py
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from sqlalchemy import Integer, case, cast, event, extract, func, union_all
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import declared_attr, foreign, with_loader_criteria
+from sqlalchemy.sql.expression import FunctionElement
 from app import db, login_manager
+from app.tenancy import current_tenant, scoped_user_id, unscoped_user_id
+
+
+class SoftDeleteMixin:
+    """Rows are flagged with ``deleted_at`` instead of being removed.
+
+    Top-level SELECTs hide flagged rows automatically (see ``_filter_soft_deleted``).
+    Pass ``execution_options(include_deleted=True)`` to see them again.
+    """
+    # Deliberately not indexed: nearly every row is NULL, and an index here
+    # tempts SQLite into driving joins from the patient/doctor table.
+    deleted_at = db.Column(db.DateTime)
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    def soft_delete(self):
+        self.deleted_at = datetime.utcnow()
+
+    def restore(self):
+        self.deleted_at = None
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _filter_soft_deleted(execute_state):
+    # Relationship and column loads are left alone so that existing appointments
+    # keep resolving their (possibly deleted) doctor and patient.
+    if (
+        not execute_state.is_select
+        or execute_state.is_relationship_load
+        or execute_state.is_column_load
+        or execute_state.execution_options.get('include_deleted', False)
+    ):
+        return
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(
+            SoftDeleteMixin,
+            lambda cls: cls.deleted_at.is_(None),
+            include_aliases=True,
+            propagate_to_loaders=False,
+        )
+    )
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,11 +74,69 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def get_id(self):
+        # Stored in the session and the remember cookie, so it carries the tenant
+        return scoped_user_id(self.id, current_tenant())
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    # The id is only meaningful inside the tenant that issued it
+    user_id = unscoped_user_id(id, current_tenant())
+    if user_id is None:
+        return None
+    return User.query.get(user_id)
+
+# Used by the admin patient filters and the analytics reports
+BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-')
+# (low, high, label)
+AGE_BANDS = ((0, 18, '0-17'), (18, 35, '18-34'), (35, 50, '35-49'), (50, 65, '50-64'), (65, 200, '65+'))
+
+
+class years_since(FunctionElement):
+    """Whole years from a date column to today, computed by the database."""
+    type = Integer()
+    name = 'years_since'
+    inherit_cache = True
+
+
+@compiles(years_since)
+def _years_since(element, compiler, **kw):
+    # Standard SQL: subtract the years, less one if the birthday is still to come
+    (born,) = element.clauses
+    today = func.current_date()
+    month_day = lambda day: extract('month', day) * 100 + extract('day', day)  # noqa: E731
+    years = (extract('year', today) - extract('year', born)
+             - case((month_day(today) < month_day(born), 1), else_=0))
+    return compiler.process(cast(years, Integer), **kw)
+
+
+@compiles(years_since, 'sqlite')
+def _years_since_sqlite(element, compiler, **kw):
+    # SQLite has no date arithmetic: subtract the years, less one if the birthday is still to come
+    (born,) = element.clauses
+    now = lambda fmt: func.strftime(fmt, 'now', 'localtime')  # noqa: E731
+    years = (cast(now('%Y'), Integer) - cast(func.strftime('%Y', born), Integer)
+             - cast(now('%m-%d') < func.strftime('%m-%d', born), Integer))
+    return compiler.process(years, **kw)
+
+
+@compiles(years_since, 'postgresql')
+def _years_since_postgresql(element, compiler, **kw):
+    (born,) = element.clauses
+    return compiler.process(cast(func.date_part('year', func.age(born)), Integer), **kw)
+
+
+def _years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - years, day=28)
+
+
+class Doctor(SoftDeleteMixin, db.Model):
+    # Archived doctors keep their id (see DoctorArchive)
+    __table_args__ = {'sqlite_autoincrement': True}
 
-class Doctor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     # Add the user_id foreign key
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=True)
@@ -45,19 +151,30 @@ class Doctor(db.Model):
     # Relationships
     appointments = db.relationship('Appointment', backref='doctor', lazy='dynamic')
 
-    @property
+    @hybrid_property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
+    @full_name.expression
+    def full_name(cls):
+        return cls.first_name + ' ' + cls.last_name
+
     def __repr__(self):
         return f'<Doctor {self.full_name}>'
 
-class Patient(db.Model):
+class Patient(SoftDeleteMixin, db.Model):
+    # Admin list sorts and filters (see admin.manage_patients)
+    __table_args__ = (
+        db.Index('ix_patient_name', 'last_name', 'first_name'),
+        # Archived patients keep their id (see PatientArchive)
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
-    date_of_birth = db.Column(db.Date, nullable=False)
+    date_of_birth = db.Column(db.Date, nullable=False, index=True)
     gender = db.Column(db.String(10))
     blood_group = db.Column(db.String(5))
     contact_number = db.Column(db.String(20))
@@ -65,33 +182,312 @@ class Patient(db.Model):
     address = db.Column(db.Text)
     
     # ADD THIS LINE
-    registration_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    registration_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     # Relationships
     appointments = db.relationship('Appointment', backref='patient', lazy='dynamic')
     
-    @property
+    @hybrid_property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
+
+    @full_name.expression
+    def full_name(cls):
+        return cls.first_name + ' ' + cls.last_name
     
-    @property
+    @hybrid_property
     def age(self):
         today = datetime.today()
         return today.year - self.date_of_birth.year - ((today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
+
+    @age.expression
+    def age(cls):
+        return years_since(cls.date_of_birth)
+
+    @classmethod
+    def of_user(cls, user_id):
+        """The profile of ``user_id``, including a deleted one (a live profile wins).
+
+        Callers must check ``is_deleted``: treating a deleted profile as missing
+        would let its user create a second one. An archived profile is returned
+        as a (deleted) ``PatientArchive``.
+        """
+        profile = (cls.query.execution_options(include_deleted=True).filter_by(user_id=user_id)
+                   .order_by(cls.deleted_at.isnot(None), cls.id).first())
+        if profile is None:
+            profile = PatientArchive.query.filter_by(user_id=user_id).first()
+        return profile
+
+    @classmethod
+    def aged(cls, low, high=None, today=None):
+        """Filter for ``low <= age < high`` as a ``date_of_birth`` range, so it can use the index."""
+        today = today or date.today()
+        clause = cls.date_of_birth <= _years_before(today, low)
+        if high is not None:
+            clause = clause & (cls.date_of_birth > _years_before(today, high))
+        return clause
     
     def __repr__(self):
         return f'<Patient {self.full_name}>'
         
 # ... (Appointment model is unchanged)
 class Appointment(db.Model):
+    # Every dashboard filters by doctor or patient and then by date range.
+    __table_args__ = (
+        db.Index('ix_appointment_doctor_date', 'doctor_id', 'appointment_date'),
+        db.Index('ix_appointment_patient_date', 'patient_id', 'appointment_date'),
+        # A doctor's time slot can only be held by one Scheduled appointment. The
+        # database enforces it, so concurrent bookings cannot both succeed.
+        # PostgreSQL gets the same WHERE from _scheduled_slots_only.
+        db.Index('ux_appointment_doctor_slot', 'doctor_id', 'appointment_date', unique=True,
+                 sqlite_where=db.text("status = 'Scheduled'")),
+        # Ids must never be handed out twice: archived rows keep theirs, and
+        # notifications are keyed by them. Plain SQLite reuses the highest free id.
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
-    appointment_date = db.Column(db.DateTime, nullable=False)
+    appointment_date = db.Column(db.DateTime, nullable=False, index=True)
     reason = db.Column(db.Text)
     notes = db.Column(db.Text) # This field will be used by doctors
     status = db.Column(db.String(20), default='Scheduled')  # Scheduled, Completed, Cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Appointment {self.id}: {self.patient.full_name} with Dr. {self.doctor.full_name}>'
\ No newline at end of file
+        return f'<Appointment {self.id}: {self.patient.full_name} with Dr. {self.doctor.full_name}>'
+
+
+def _scheduled_slots_only(index, connection, **kw):
+    # Given when the index is created: postgresql_where= on the Index itself
+    # would import the whole PostgreSQL dialect every time the models load
+    if connection.dialect.name == 'postgresql':
+        index.dialect_options['postgresql']['where'] = db.text("status = 'Scheduled'")
+
+
+event.listen(next(index for index in Appointment.__table__.indexes if index.name == 'ux_appointment_doctor_slot'),
+             'before_create', _scheduled_slots_only)
+
+
+class AppointmentArchive(db.Model):
+    """Cold storage for finished appointments moved out of the hot table.
+
+    Each year has its own ``appointment_<yyyy>`` table (see
+    ``appointment_partition``). There are no foreign keys here on purpose:
+    archived rows must survive even if the doctor or patient they point at
+    is later purged.
+    """
+    __abstract__ = True
+
+    id = db.Column(db.Integer, primary_key=True)  # Same id the row had in ``appointment``
+    patient_id = db.Column(db.Integer, nullable=False, index=True)
+    doctor_id = db.Column(db.Integer, nullable=False, index=True)
+    appointment_date = db.Column(db.DateTime, nullable=False, index=True)
+    reason = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Read-only links so templates can treat archived rows like live ones. The
+    # doctor or patient may have been archived as well.
+    @declared_attr
+    def live_doctor(cls):
+        return db.relationship('Doctor', primaryjoin=lambda: foreign(cls.doctor_id) == Doctor.id, viewonly=True)
+
+    @declared_attr
+    def live_patient(cls):
+        return db.relationship('Patient', primaryjoin=lambda: foreign(cls.patient_id) == Patient.id, viewonly=True)
+
+    @declared_attr
+    def archived_doctor(cls):
+        return db.relationship('DoctorArchive', primaryjoin=lambda: foreign(cls.doctor_id) == DoctorArchive.id,
+                               viewonly=True)
+
+    @declared_attr
+    def archived_patient(cls):
+        return db.relationship('PatientArchive', primaryjoin=lambda: foreign(cls.patient_id) == PatientArchive.id,
+                               viewonly=True)
+
+    is_archived = True
+
+    @property
+    def doctor(self):
+        return self.live_doctor or self.archived_doctor
+
+    @property
+    def patient(self):
+        return self.live_patient or self.archived_patient
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.id}>'
+
+
+class DoctorArchive(db.Model):
+    """Deleted doctors moved out of ``doctor`` once no live appointment needs them."""
+    __tablename__ = 'doctor_archive'
+
+    id = db.Column(db.Integer, primary_key=True)  # Same id the row had in ``doctor``
+    user_id = db.Column(db.Integer, index=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    specialization = db.Column(db.String(100), nullable=False)
+    contact_number = db.Column(db.String(20))
+    email = db.Column(db.String(120))
+    is_available = db.Column(db.Boolean)
+    deleted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    is_archived = True
+    is_deleted = True
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def __repr__(self):
+        return f'<DoctorArchive {self.id}>'
+
+
+class PatientArchive(db.Model):
+    """Deleted patients moved out of ``patient`` once no live appointment needs them."""
+    __tablename__ = 'patient_archive'
+
+    id = db.Column(db.Integer, primary_key=True)  # Same id the row had in ``patient``
+    user_id = db.Column(db.Integer, index=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    date_of_birth = db.Column(db.Date, nullable=False)
+    gender = db.Column(db.String(10))
+    blood_group = db.Column(db.String(5))
+    contact_number = db.Column(db.String(20))
+    email = db.Column(db.String(120))
+    address = db.Column(db.Text)
+    registration_date = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    is_archived = True
+    is_deleted = True
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def __repr__(self):
+        return f'<PatientArchive {self.id}>'
+
+
+class Notification(db.Model):
+    """One sent (or in-flight) notification; ``key`` makes sending idempotent."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), unique=True, nullable=False)  # e.g. "42:reminder_24h:3:202501310900"
+    appointment_id = db.Column(db.Integer, nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    # The doctor and time the message was about
+    doctor_id = db.Column(db.Integer)
+    appointment_date = db.Column(db.DateTime)
+    recipient = db.Column(db.String(120))
+    sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Notification {self.key}>'
+
+
+class CacheVersion(db.Model):
+    """Version of a table's contents, bumped on every commit that changes it.
+
+    Kept in the database so every worker, the ASGI app and the CLI jobs agree
+    on it (see app/caching.py).
+    """
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+
+# --- Appointment partitions ---
+# ``appointment`` holds bookings of any date until app/archive.py moves finished
+# ones into the ``appointment_<yyyy>`` table of their year. The first year's
+# table also takes anything older, and the last year's anything newer, so each
+# date belongs to exactly one yearly partition.
+
+_partitions = {}  # year -> AppointmentArchive subclass
+
+def appointment_partition(year):
+    """The archive model of ``year``, defining it (and its table) on first use.
+
+    A new table is only created by ``create_all`` or ``flask roll-partitions``.
+    """
+    model = _partitions.get(year)
+    if model is None:
+        model = type(f'AppointmentArchive{year}', (AppointmentArchive,), {
+            '__tablename__': f'appointment_{year}',
+            'year': year,
+            '__module__': __name__,
+        })
+        _partitions[year] = model
+    return model
+
+def define_appointment_partitions(first_year, last_year):
+    """Define the yearly partitions ``first_year`` to ``last_year`` inclusive."""
+    for year in range(first_year, last_year + 1):
+        appointment_partition(year)
+
+def _partition_year(year):
+    years = sorted(_partitions)
+    return min(max(year, years[0]), years[-1])
+
+def partition_for(when):
+    """The archive model an appointment dated ``when`` is moved into."""
+    return _partitions[_partition_year(when.year)]
+
+def appointment_partitions(start=None, end=None, live=True):
+    """Return the appointment models that can hold rows dated in [start, end).
+
+    The live table can hold any date; the yearly tables are picked from the
+    bounds alone, without querying the database.
+    """
+    partitions = [Appointment] if live else []
+    if not _partitions:
+        return partitions
+    years = sorted(_partitions)
+    first = years[0] if start is None else _partition_year(start.year)
+    # ``end`` is exclusive: a range ending at midnight on 1 January needs nothing from that year
+    last = years[-1] if end is None else _partition_year((end - timedelta(microseconds=1)).year)
+    partitions.extend(_partitions[year] for year in years if first <= year <= last)
+    return partitions
+
+def _in_range(model, query, start, end):
+    if start is not None:
+        query = query.filter(model.appointment_date >= start)
+    if end is not None:
+        query = query.filter(model.appointment_date < end)
+    return query
+
+def appointment_history(start=None, end=None, **filters):
+    """Appointments in [start, end) across all partitions, newest first.
+
+    Keyword arguments are passed to ``filter_by`` (e.g. ``doctor_id=3``).
+    """
+    results = []
+    for model in appointment_partitions(start, end):
+        results.extend(_in_range(model, model.query.filter_by(**filters), start, end).all())
+    results.sort(key=lambda appointment: appointment.appointment_date, reverse=True)
+    return results
+
+def appointment_rows(start=None, end=None, live=True):
+    """A subquery over every partition, for aggregate queries such as reports.
+
+    With ``live=False`` only the yearly archive tables are included.
+    """
+    selects = []
+    for model in appointment_partitions(start, end, live):
+        query = db.select(model.id, model.patient_id, model.doctor_id,
+                          model.appointment_date, model.status, model.created_at)
+        selects.append(_in_range(model, query, start, end))
+    if len(selects) == 1:
+        return selects[0].subquery('appointment_rows')
+    return union_all(*selects).subquery('appointment_rows')
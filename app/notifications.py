@@ -0,0 +1,380 @@
+# app/notifications.py
+"""Appointment notifications: booking/cancellation notices and reminders.
+
+Every message has an idempotency key naming the appointment, the kind of
+message and the doctor and time it is about (see ``notification_key``).
+Keys are claimed in the ``notification`` table *before* sending, so
+re-running the reminder job, or two jobs racing, never sends the same
+message twice, while an appointment that moves gets reminded of its new
+time. Keys for failed sends are released again so the next run retries them.
+
+Messages go out through a channel selected by ``NOTIFICATION_CHANNEL``:
+
+* ``file`` - append JSON lines to ``NOTIFICATION_FILE`` (default; development)
+* ``smtp`` - send e-mail through ``MAIL_SERVER``
+
+Notices triggered by a request (``notify``/``notify_many``) are built while
+the appointments are at hand and then sent by a background thread (see
+``Outbox``), so the request never waits for the channel. Reminders are sent
+by the ``send-reminders`` job itself.
+
+Each worker thread opens one channel connection and reuses it for its whole
+share of a batch. ``smtplib`` and ``email`` are imported by the SMTP channel
+itself, so web workers using the file channel do not load them on boot.
+"""
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from threading import Lock
+import click
+from flask import current_app, g
+from flask.cli import with_appcontext
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Appointment, Doctor, Notification, Patient
+from app.tenancy import current_tenant, for_each_tenant
+
+logger = logging.getLogger(__name__)
+
+Message = namedtuple('Message', 'key appointment_id kind doctor_id appointment_date recipient subject body')
+
+# Reminder kinds and how long before the appointment they are due, shortest first
+REMINDERS = (
+    ('reminder_1h', timedelta(hours=1)),
+    ('reminder_24h', timedelta(hours=24)),
+)
+
+
+# --- Channels ---
+
+class FileChannel:
+    """Writes each message as a JSON line to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+
+    def connect(self):
+        return _FileConnection(self)
+
+
+class _FileConnection:
+    def __init__(self, channel):
+        self.channel = channel
+        self.file = open(channel.path, 'a', encoding='utf-8')
+
+    def send(self, message):
+        line = json.dumps(message._asdict(), default=str) + '\n'
+        with self.channel._lock:
+            self.file.write(line)
+
+    def close(self):
+        with self.channel._lock:
+            self.file.close()
+
+
+class SMTPChannel:
+    """Sends e-mail; one SMTP session per connection, reused for many messages."""
+
+    def __init__(self, host, port, sender, username=None, password=None, use_tls=False, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def connect(self):
+        import smtplib
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return _SMTPConnection(self, smtp)
+
+
+class _SMTPConnection:
+    def __init__(self, channel, smtp):
+        self.channel = channel
+        self.smtp = smtp
+
+    def send(self, message):
+        from email.message import EmailMessage
+        email = EmailMessage()
+        email['From'] = self.channel.sender
+        email['To'] = message.recipient
+        email['Subject'] = message.subject
+        email.set_content(message.body)
+        self.smtp.send_message(email)
+
+    def close(self):
+        import smtplib
+        try:
+            self.smtp.quit()
+        except smtplib.SMTPException:
+            self.smtp.close()
+
+
+def make_channel(config):
+    if config['NOTIFICATION_CHANNEL'] == 'smtp':
+        return SMTPChannel(config['MAIL_SERVER'], config['MAIL_PORT'], config['MAIL_SENDER'],
+                           username=config['MAIL_USERNAME'], password=config['MAIL_PASSWORD'],
+                           use_tls=config['MAIL_USE_TLS'])
+    return FileChannel(config['NOTIFICATION_FILE'])
+
+
+# --- Dispatcher ---
+
+class Dispatcher:
+    def __init__(self, channel, concurrency=4):
+        self.channel = channel
+        self.concurrency = max(1, concurrency)
+
+    def send(self, messages):
+        """Claim, send and record ``messages``; return how many were sent.
+
+        Messages whose key was already claimed are skipped.
+        """
+        messages = self._claim(messages)
+        if not messages:
+            return 0
+
+        workers = min(self.concurrency, len(messages))
+        chunks = [messages[i::workers] for i in range(workers)]
+        failed = []
+        if workers == 1:
+            failed = self._send_chunk(messages)
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                for chunk_failed in pool.map(self._send_chunk, chunks):
+                    failed.extend(chunk_failed)
+
+        if failed:
+            # Release the claims so the next run retries these
+            db.session.execute(db.delete(Notification).where(Notification.key.in_(failed)))
+            db.session.commit()
+        return len(messages) - len(failed)
+
+    def _claim(self, messages):
+        unique = {message.key: message for message in messages}
+        claimed = set(db.session.scalars(
+            db.select(Notification.key).where(Notification.key.in_(list(unique)))
+        ))
+        fresh = [message for key, message in unique.items() if key not in claimed]
+        if not fresh:
+            return []
+        now = datetime.utcnow()
+        try:
+            # Core executemany: the ORM bulk path costs more than the insert itself here
+            db.session.connection().execute(Notification.__table__.insert(), [
+                {'key': m.key, 'appointment_id': m.appointment_id, 'kind': m.kind,
+                 'doctor_id': m.doctor_id, 'appointment_date': m.appointment_date,
+                 'recipient': m.recipient, 'sent_at': now}
+                for m in fresh
+            ])
+            db.session.commit()
+        except IntegrityError:
+            # Another run claimed some of these in the meantime; leave the batch to it
+            db.session.rollback()
+            return []
+        return fresh
+
+    def _send_chunk(self, chunk):
+        """Send through one channel connection; return the keys that failed."""
+        try:
+            connection = self.channel.connect()
+        except OSError:  # Including smtplib.SMTPException
+            logger.exception('Could not open notification channel')
+            return [message.key for message in chunk]
+
+        failed = []
+        try:
+            for message in chunk:
+                try:
+                    connection.send(message)
+                except OSError:
+                    failed.append(message.key)
+        finally:
+            connection.close()
+        return failed
+
+
+def get_dispatcher():
+    app = current_app._get_current_object()
+    if 'notifications' not in app.extensions:
+        app.extensions['notifications'] = Dispatcher(
+            make_channel(app.config), concurrency=app.config['NOTIFICATION_CONCURRENCY'])
+    return app.extensions['notifications']
+
+
+class Outbox:
+    """Sends notices from a small thread pool, in the caller's hospital.
+
+    With ``NOTIFICATION_WORKERS=0`` notices are sent by the calling thread.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='notifications') if workers else None
+        self._pending = set()
+        self._lock = Lock()
+
+    def submit(self, messages, kind):
+        if self._pool is None:
+            self._send(messages, kind)
+            return
+        future = self._pool.submit(self._send_as, current_tenant(), messages, kind)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def wait(self, timeout=None):
+        """Block until every notice submitted so far has been handled."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _send_as(self, tenant, messages, kind):
+        with self.app.app_context():
+            g.tenant = tenant
+            self._send(messages, kind)
+
+    def _send(self, messages, kind):
+        try:
+            get_dispatcher().send(messages)
+        except Exception:
+            db.session.rollback()
+            logger.exception('Failed to send %d %s notification(s)', len(messages), kind)
+
+
+def get_outbox():
+    app = current_app._get_current_object()
+    if 'notification_outbox' not in app.extensions:
+        app.extensions['notification_outbox'] = Outbox(app, app.config['NOTIFICATION_WORKERS'])
+    return app.extensions['notification_outbox']
+
+
+# --- Messages ---
+
+def notification_key(appointment_id, kind, doctor_id, when):
+    """``"<appointment id>:<kind>:<doctor id>:<YYYYMMDDHHMM>"``.
+
+    A reminder or notice is about one doctor and time, so moving the
+    appointment makes every kind due again.
+    """
+    return f'{appointment_id}:{kind}:{doctor_id}:{when:%Y%m%d%H%M}'
+
+
+def _message(appointment_id, kind, doctor_id, email, patient_name, doctor_name, when, subject, text):
+    body = (f"Dear {patient_name},\n\n{text}\n\n"
+            f"Doctor: Dr. {doctor_name}\nDate & time: {when:%A %d %B %Y, %H:%M}\n")
+    return Message(notification_key(appointment_id, kind, doctor_id, when), appointment_id, kind,
+                   doctor_id, when, email, subject, body)
+
+
+_EVENTS = {
+    'booked': ('Appointment confirmed', 'Your appointment has been booked.'),
+    'cancelled': ('Appointment cancelled', 'Your appointment has been cancelled.'),
+    'status_completed': ('Appointment completed', 'Your appointment has been marked as completed.'),
+    'status_cancelled': ('Appointment cancelled', 'Your appointment has been cancelled by the doctor.'),
+    'status_scheduled': ('Appointment rescheduled', 'Your appointment is scheduled again.'),
+    'rescheduled': ('Appointment moved', 'Your doctor is unavailable, so your appointment has been moved.'),
+}
+
+
+def notify(appointment, kind):
+    """Queue a one-off notice about ``appointment``; never raises.
+
+    ``kind`` is one of ``booked``, ``cancelled``, ``rescheduled`` or ``status_<status>``.
+    """
+    notify_many([appointment], kind)
+
+
+def notify_many(appointments, kind):
+    """Queue the same kind of notice about many appointments as one batch."""
+    subject, text = _EVENTS[kind]
+    messages = [
+        _message(a.id, kind, a.doctor_id, a.patient.email, a.patient.full_name, a.doctor.full_name,
+                 a.appointment_date, subject, text)
+        for a in appointments if a.patient.email
+    ]
+    if messages:
+        get_outbox().submit(messages, kind)
+
+
+def reminder_batches(now, batch_size=1000):
+    """Yield lists of reminder messages for Scheduled appointments coming up.
+
+    Each reminder kind covers the appointments between the previous kind's
+    lead time and its own, so an appointment gets the 24h reminder only if
+    it is more than an hour away. Uses the appointment_date index, and skips
+    appointments that already have this reminder recorded for their current
+    doctor and time.
+    """
+    lower = now
+    for kind, lead in REMINDERS:
+        upper = now + lead
+        after = None
+        while True:
+            query = (
+                db.select(Appointment.id, Appointment.doctor_id, Appointment.appointment_date, Patient.email,
+                          Patient.first_name, Patient.last_name,
+                          Doctor.first_name.label('doctor_first_name'),
+                          Doctor.last_name.label('doctor_last_name'))
+                .join(Patient, Appointment.patient_id == Patient.id)
+                .join(Doctor, Appointment.doctor_id == Doctor.id)
+                .where(Appointment.status == 'Scheduled',
+                       Appointment.appointment_date > lower,
+                       Appointment.appointment_date <= upper,
+                       Patient.email.isnot(None),
+                       # Cheap pre-filter for reruns; the key claim is what guarantees once-only
+                       ~db.exists().where(Notification.appointment_id == Appointment.id,
+                                          Notification.kind == kind,
+                                          Notification.doctor_id == Appointment.doctor_id,
+                                          Notification.appointment_date == Appointment.appointment_date))
+                # Keyset pagination in index order: every batch is a short range scan
+                .order_by(Appointment.appointment_date, Appointment.id)
+                .limit(batch_size)
+            )
+            if after is not None:
+                # The plain >= bound is what lets SQLite start the index scan at the cursor
+                query = query.where(Appointment.appointment_date >= after[0],
+                                    tuple_(Appointment.appointment_date, Appointment.id) > after)
+            rows = db.session.execute(query).all()
+            if not rows:
+                break
+            after = (rows[-1].appointment_date, rows[-1].id)
+            yield [
+                _message(row.id, kind, row.doctor_id, row.email, f'{row.first_name} {row.last_name}',
+                         f'{row.doctor_first_name} {row.doctor_last_name}', row.appointment_date,
+                         'Appointment reminder', 'This is a reminder of your upcoming appointment.')
+                for row in rows
+            ]
+        lower = upper
+
+
+def send_reminders(now=None, batch_size=1000):
+    """Send every due reminder; return the number sent."""
+    dispatcher = get_dispatcher()
+    now = datetime.now() if now is None else now
+    return sum(dispatcher.send(batch) for batch in reminder_batches(now, batch_size))
+
+
+@click.command('send-reminders')
+@click.option('--batch-size', default=None, type=int,
+              help='Appointments per batch (default NOTIFICATION_BATCH_SIZE).')
+@with_appcontext
+@for_each_tenant()
+def send_reminders_command(batch_size):
+    """Send due 24h and 1h appointment reminders. Safe to run repeatedly."""
+    sent = send_reminders(batch_size=batch_size or current_app.config['NOTIFICATION_BATCH_SIZE'])
+    click.echo(f'Sent {sent} reminders.')
@@ -0,0 +1,140 @@
+# app/ratelimit.py
+"""Request rate limiting for form submissions (login, registration, ...).
+
+Limits are declared in ``Config.RATELIMITS`` per endpoint (``'auth.login'``)
+or per blueprint (``'auth'``), each keyed by client IP and/or the submitted
+username::
+
+    RATELIMITS = {'auth.login': {'ip': '20/minute', 'username': '5/minute'}}
+
+They are checked in a ``before_request`` hook, before the view, its form or
+the database are touched, so a rejected request costs a dictionary lookup.
+Only POST requests are counted.
+
+The client IP is ``request.remote_addr``. Behind a load balancer set
+``PROXY_FIX_HOPS`` so that it is read from ``X-Forwarded-For``.
+"""
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import Response, request
+from werkzeug.utils import import_string
+from app.tenancy import current_tenant
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class Limit:
+    """``'5/minute'`` (token bucket) or ``'5/minute sliding'`` (sliding window)."""
+
+    __slots__ = ('spec', 'amount', 'period', 'algorithm')
+
+    def __init__(self, spec):
+        self.spec = spec
+        rate, _, algorithm = spec.partition(' ')
+        amount, _, period = rate.partition('/')
+        self.amount = int(amount)
+        self.period = PERIODS[period.rstrip('s')]
+        self.algorithm = algorithm or 'bucket'
+        if self.algorithm not in ('bucket', 'sliding'):
+            raise ValueError(f'Unknown rate limit algorithm in {spec!r}')
+
+    def __repr__(self):
+        return f'<Limit {self.spec}>'
+
+
+class MemoryStore:
+    """Per-process store with LRU eviction of idle keys.
+
+    Any class with the same ``hit`` method can be used instead (for example
+    one backed by a cache server so all workers share counters) by naming it
+    in ``RATELIMIT_STORAGE``.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._state = OrderedDict()
+        self._lock = Lock()
+
+    def hit(self, key, limit, now=None):
+        """Count one request; return 0 if allowed, else seconds until retry."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._state.pop(key, None)
+            if limit.algorithm == 'bucket':
+                state, retry_after = self._token_bucket(state, limit, now)
+            else:
+                state, retry_after = self._sliding_window(state, limit, now)
+            self._state[key] = state
+            if len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+            return retry_after
+
+    @staticmethod
+    def _token_bucket(state, limit, now):
+        # Bucket of ``amount`` tokens refilled evenly over ``period``
+        rate = limit.amount / limit.period
+        tokens, updated = state if state else (limit.amount, now)
+        tokens = min(limit.amount, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            return (tokens - 1, now), 0
+        return (tokens, now), (1 - tokens) / rate
+
+    @staticmethod
+    def _sliding_window(state, limit, now):
+        # Weighted sum of the previous and current fixed windows
+        window = int(now // limit.period)
+        current_window, current, previous = state if state else (window, 0, 0)
+        if window != current_window:
+            previous = current if window == current_window + 1 else 0
+            current = 0
+        elapsed = (now % limit.period) / limit.period
+        if previous * (1 - elapsed) + current < limit.amount:
+            return (window, current + 1, previous), 0
+        return (window, current, previous), limit.period * (1 - elapsed)
+
+    def __len__(self):
+        return len(self._state)
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = None
+        self.limits = {}
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE', 'app.ratelimit.MemoryStore')
+        app.config.setdefault('RATELIMIT_MAX_KEYS', 10000)
+        app.config.setdefault('RATELIMITS', {})
+
+        self.store = import_string(app.config['RATELIMIT_STORAGE'])(app.config['RATELIMIT_MAX_KEYS'])
+        # Parse once at startup so the request path does no string handling
+        self.limits = {
+            scope: [(key, Limit(spec)) for key, spec in keyed.items()]
+            for scope, keyed in app.config['RATELIMITS'].items()
+        }
+        app.extensions['ratelimit'] = self
+        if app.config['RATELIMIT_ENABLED'] and self.limits:
+            app.before_request(self._check)
+
+    def _check(self):
+        if request.method != 'POST' or request.endpoint is None:
+            return None
+        for scope in (request.endpoint, request.blueprint):
+            for key, limit in self.limits.get(scope, ()):
+                value = request.remote_addr if key == 'ip' else request.form.get(key)
+                if not value:
+                    continue
+                # Include the tenant so hospitals never share counters
+                retry_after = self.store.hit(f'{current_tenant()}|{scope}|{key}|{value}', limit)
+                if retry_after:
+                    self.rejected += 1
+                    return Response('Too many requests. Please try again later.\n', 429,
+                                    {'Retry-After': str(math.ceil(retry_after))},
+                                    mimetype='text/plain')
+        return None
@@ -0,0 +1,174 @@
+# app/rescheduling.py
+"""Bulk rescheduling of appointments booked with unavailable doctors.
+
+Free time is modelled as a boolean matrix per specialization: one row per
+available doctor, one column per bookable hour (weekdays, 8 AM - 6 PM, the
+same rules as ``BookAppointmentForm``). Displaced appointments are placed
+greedily, earliest first, into the free slot closest to their original
+time; each placement is a single vectorised ``argmin`` over the matrix.
+
+The plan is deterministic for a given ``now`` and database state, so the
+admin page can re-plan with the time of the preview and check the result
+against the preview's ``fingerprint`` before applying it.
+"""
+import hashlib
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+from app import db
+from app.models import Appointment, Doctor, Patient
+
+OPENING_HOUR = 8
+CLOSING_HOUR = 18
+
+Proposal = namedtuple('Proposal', 'appointment_id patient_name old_doctor old_date new_doctor_id new_doctor new_date')
+Unplaced = namedtuple('Unplaced', 'appointment_id patient_name old_doctor old_date specialization')
+
+
+def slot_grid(start, days):
+    """Bookable hourly slots from ``start`` for ``days`` days, as datetime64[s]."""
+    first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    slots = [
+        first_day + timedelta(days=day, hours=hour)
+        for day in range(days + 1)
+        for hour in range(OPENING_HOUR, CLOSING_HOUR)
+        if (first_day + timedelta(days=day)).weekday() < 5
+    ]
+    grid = np.array([slot for slot in slots if slot >= start], dtype='datetime64[s]')
+    return grid
+
+
+def _bucket(grid, dates):
+    """Index of the slot each date falls into, or -1 if outside the grid."""
+    dates = np.asarray(dates, dtype='datetime64[s]')
+    idx = np.searchsorted(grid, dates, side='right') - 1
+    inside = (idx >= 0) & (dates < grid[np.clip(idx, 0, None)] + np.timedelta64(3600, 's'))
+    return np.where(inside, idx, -1)
+
+
+def plan(doctor_id=None, now=None, horizon_days=28):
+    """Propose new doctors/times for Scheduled appointments of unavailable doctors.
+
+    ``doctor_id`` limits the plan to one doctor. New slots respect the 24-hour
+    booking notice, never double-book a doctor, and never give a patient two
+    appointments in the same hour. Returns ``(proposals, unplaced)``.
+    """
+    now = datetime.now() if now is None else now
+    earliest = now + timedelta(hours=24)
+    grid = slot_grid(earliest, horizon_days)
+
+    # Appointments to move (including those of soft-deleted doctors)
+    displaced_query = (
+        db.select(Appointment.id, Appointment.appointment_date, Appointment.patient_id,
+                  Doctor.id.label('doctor_id'), Doctor.first_name, Doctor.last_name,
+                  Doctor.specialization, Patient.first_name.label('patient_first_name'),
+                  Patient.last_name.label('patient_last_name'))
+        .join(Doctor, Appointment.doctor_id == Doctor.id)
+        .join(Patient, Appointment.patient_id == Patient.id)
+        .where(Appointment.status == 'Scheduled', Appointment.appointment_date > now,
+               Doctor.is_available == False,  # noqa: E712
+               Patient.deleted_at.is_(None))
+        .order_by(Appointment.appointment_date, Appointment.id)
+        .execution_options(include_deleted=True)
+    )
+    if doctor_id is not None:
+        displaced_query = displaced_query.where(Doctor.id == doctor_id)
+    displaced = db.session.execute(displaced_query).all()
+    if not displaced or len(grid) == 0:
+        return [], [_unplaced(row) for row in displaced]
+
+    specializations = {row.specialization for row in displaced}
+    doctors = db.session.execute(
+        db.select(Doctor.id, Doctor.first_name, Doctor.last_name, Doctor.specialization)
+        .where(Doctor.is_available == True, Doctor.specialization.in_(specializations))  # noqa: E712
+        .order_by(Doctor.id)
+    ).all()
+
+    # Occupancy matrix per specialization: doctors x slots
+    grid_end = grid[-1] + np.timedelta64(3600, 's')
+    rows = {}
+    by_specialization = defaultdict(list)
+    for doctor in doctors:
+        rows[doctor.id] = len(by_specialization[doctor.specialization])
+        by_specialization[doctor.specialization].append(doctor)
+    busy = {spec: np.zeros((len(group), len(grid)), dtype=bool) for spec, group in by_specialization.items()}
+
+    booked = db.session.execute(
+        db.select(Appointment.id, Appointment.doctor_id, Appointment.patient_id, Appointment.appointment_date)
+        .where(Appointment.status == 'Scheduled',
+               Appointment.appointment_date >= earliest,
+               Appointment.appointment_date < grid_end.astype(datetime))
+    ).all()
+    specialization_of = {doctor.id: doctor.specialization for doctor in doctors}
+    moving = {row.id for row in displaced}
+    patient_busy = defaultdict(set)
+    if booked:
+        slots = _bucket(grid, [row.appointment_date for row in booked])
+        for row, slot in zip(booked, slots):
+            if slot < 0:
+                continue
+            if row.id not in moving:  # A displaced visit may keep its own hour
+                patient_busy[row.patient_id].add(int(slot))
+            spec = specialization_of.get(row.doctor_id)
+            if spec is not None:
+                busy[spec][rows[row.doctor_id], slot] = True
+
+    # Distance (in seconds) of every slot from each original time
+    grid_seconds = grid.astype('int64')
+    original_seconds = np.array([row.appointment_date for row in displaced], dtype='datetime64[s]').astype('int64')
+
+    proposals, unplaced = [], []
+    for row, original in zip(displaced, original_seconds):
+        matrix = busy.get(row.specialization)
+        if matrix is None:
+            unplaced.append(_unplaced(row))
+            continue
+        cost = np.abs(grid_seconds - original).astype('float64')
+        if patient_busy[row.patient_id]:
+            cost[list(patient_busy[row.patient_id])] = np.inf
+        # Broadcast the slot cost over doctors and rule out busy cells
+        candidates = np.where(matrix, np.inf, cost)
+        best = int(np.argmin(candidates))
+        doctor_row, slot = divmod(best, len(grid))
+        if not np.isfinite(candidates[doctor_row, slot]):
+            unplaced.append(_unplaced(row))
+            continue
+
+        matrix[doctor_row, slot] = True
+        patient_busy[row.patient_id].add(slot)
+        doctor = by_specialization[row.specialization][doctor_row]
+        proposals.append(Proposal(
+            row.id, f'{row.patient_first_name} {row.patient_last_name}',
+            f'{row.first_name} {row.last_name}', row.appointment_date,
+            doctor.id, f'{doctor.first_name} {doctor.last_name}', grid[slot].astype(datetime),
+        ))
+    return proposals, unplaced
+
+
+def fingerprint(proposals):
+    """Short digest of the moves in ``proposals``, to tell whether two plans are the same."""
+    digest = hashlib.blake2b(digest_size=16)
+    for p in proposals:
+        digest.update(f'{p.appointment_id}:{p.new_doctor_id}:{p.new_date:%Y%m%d%H%M};'.encode())
+    return digest.hexdigest()
+
+
+def _unplaced(row):
+    return Unplaced(row.id, f'{row.patient_first_name} {row.patient_last_name}',
+                    f'{row.first_name} {row.last_name}', row.appointment_date, row.specialization)
+
+
+def apply(proposals):
+    """Move every proposed appointment in a single transaction.
+
+    Raises ``IntegrityError`` if a slot was booked since the plan was made;
+    nothing is moved then.
+    """
+    if not proposals:
+        return 0
+    db.session.execute(db.update(Appointment), [
+        {'id': p.appointment_id, 'doctor_id': p.new_doctor_id, 'appointment_date': p.new_date}
+        for p in proposals
+    ])
+    db.session.commit()
+    return len(proposals)
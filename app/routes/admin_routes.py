@@ -1,15 +1,20 @@
 # app/routes/admin_routes.py
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from collections import defaultdict
 import json
-from flask import render_template, redirect, url_for, flash
+from datetime import datetime, timedelta
+from flask import render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.routes import admin_bp
 from functools import wraps
 
 # --- Imports ---
-from app.models import User, Doctor, Patient, Appointment
+from app.models import AGE_BANDS, BLOOD_GROUPS, User, Doctor, Patient, Appointment, appointment_rows
+from app.notifications import notify_many
+from app.caching import cached
+from sqlalchemy.orm import joinedload
 from app.forms import AddDoctorForm, AddPatientForm, AddAppointmentForm
 
 # Imports needed to define forms directly in this file
@@ -71,9 +76,22 @@ def dashboard():
 @admin_bp.route('/doctors')
 @login_required
 @admin_required
+@cached(tables=('doctor', 'user'))
 def manage_doctors():
-    doctors = Doctor.query.all()
-    return render_template('admin/doctors.html', doctors=doctors)
+    query = Doctor.query
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(Doctor.full_name.ilike(f'%{q}%'))
+    if request.args.get('sort') == 'specialization':
+        query = query.order_by(Doctor.specialization, Doctor.last_name, Doctor.first_name)
+    elif request.args.get('sort') == 'name':
+        query = query.order_by(Doctor.last_name, Doctor.first_name)
+    doctors = query.all()
+    deleted_doctors = []
+    if request.args.get('show') == 'deleted':
+        deleted_doctors = Doctor.query.execution_options(include_deleted=True).filter(
+            Doctor.deleted_at.isnot(None)).order_by(Doctor.deleted_at.desc()).all()
+    return render_template('admin/doctors.html', doctors=doctors, deleted_doctors=deleted_doctors)
 
 @admin_bp.route('/doctor/add', methods=['GET', 'POST'])
 @login_required
@@ -102,6 +120,7 @@ def edit_doctor(doctor_id):
         form.user_id.choices.insert(0, (doctor.user_id, doctor.user.username))
 
     if form.validate_on_submit():
+        was_available = doctor.is_available
         # ** THE FIX: Explicitly setting each field to guarantee the data is saved. **
         doctor.first_name = form.first_name.data
         doctor.last_name = form.last_name.data
@@ -113,6 +132,10 @@ def edit_doctor(doctor_id):
         
         db.session.commit()
         flash(f'Profile for Dr. {doctor.full_name} updated successfully!', 'success')
+        if was_available and not doctor.is_available and doctor.appointments.filter(
+                Appointment.status == 'Scheduled', Appointment.appointment_date > datetime.now()).first():
+            flash(f'Dr. {doctor.full_name} has upcoming appointments. Review the proposed rescheduling below.', 'warning')
+            return redirect(url_for('admin.reschedule', doctor_id=doctor.id))
         return redirect(url_for('admin.manage_doctors'))
         
     return render_template('admin/edit_doctor.html', form=form, doctor=doctor)
@@ -122,12 +145,23 @@ def edit_doctor(doctor_id):
 @admin_required
 def delete_doctor(doctor_id):
     doctor = Doctor.query.get_or_404(doctor_id)
-    # Note: In a real app, you might want to handle existing appointments first
-    db.session.delete(doctor)
+    # Soft delete: existing appointments keep pointing at this row.
+    doctor.soft_delete()
+    doctor.is_available = False
     db.session.commit()
     flash(f'Dr. {doctor.full_name} has been deleted.', 'success')
     return redirect(url_for('admin.manage_doctors'))
 
+@admin_bp.route('/doctor/restore/<int:doctor_id>', methods=['POST'])
+@login_required
+@admin_required
+def restore_doctor(doctor_id):
+    doctor = Doctor.query.execution_options(include_deleted=True).filter_by(id=doctor_id).first_or_404()
+    doctor.restore()
+    db.session.commit()
+    flash(f'Dr. {doctor.full_name} has been restored.', 'success')
+    return redirect(url_for('admin.manage_doctors'))
+
 
 # --- Patient Management ---
 
@@ -135,8 +169,46 @@ def delete_doctor(doctor_id):
 @login_required
 @admin_required
 def manage_patients():
-    patients = Patient.query.all()
-    return render_template('admin/patients.html', patients=patients)
+    # Filtering, sorting and paging all happen in SQL; age bands become
+    # date_of_birth ranges so they can use its index.
+    filters = {key: request.args[key].strip() for key in ('q', 'blood_group', 'age', 'registered_from', 'registered_to')
+               if request.args.get(key, '').strip()}
+    query = Patient.query
+    if 'q' in filters:
+        query = query.filter(Patient.full_name.ilike(f"%{filters['q']}%"))
+    if 'blood_group' in filters:
+        query = query.filter(Patient.blood_group == filters['blood_group'])
+    for low, high, label in AGE_BANDS:
+        if filters.get('age') == label:
+            query = query.filter(Patient.aged(low, high))
+    registered_from = _parse_date(filters.get('registered_from'))
+    registered_to = _parse_date(filters.get('registered_to'))
+    if registered_from:
+        query = query.filter(Patient.registration_date >= registered_from)
+    if registered_to:
+        query = query.filter(Patient.registration_date < registered_to + timedelta(days=1))
+
+    sort = request.args.get('sort', 'name')
+    query = query.order_by(*PATIENT_SORTS.get(sort, PATIENT_SORTS['name']), Patient.id)
+    patients = query.paginate(page=request.args.get('page', 1, type=int), per_page=50, error_out=False)
+
+    deleted_patients = []
+    if request.args.get('show') == 'deleted':
+        deleted_patients = Patient.query.execution_options(include_deleted=True).filter(
+            Patient.deleted_at.isnot(None)).order_by(Patient.deleted_at.desc()).all()
+    return render_template('admin/patients.html', patients=patients, deleted_patients=deleted_patients,
+                           filters=filters, sort=sort, age_bands=[band[2] for band in AGE_BANDS],
+                           blood_groups=BLOOD_GROUPS)
+
+# "-" sorts descending; a younger patient has the later date of birth
+PATIENT_SORTS = {
+    'name': (Patient.last_name, Patient.first_name),
+    '-name': (Patient.last_name.desc(), Patient.first_name.desc()),
+    'age': (Patient.date_of_birth.desc(),),
+    '-age': (Patient.date_of_birth,),
+    'registered': (Patient.registration_date,),
+    '-registered': (Patient.registration_date.desc(),),
+}
 
 @admin_bp.route('/patient/add', methods=['GET', 'POST'])
 @login_required
@@ -170,11 +242,26 @@ def edit_patient(id):
 @admin_required
 def delete_patient(id):
     patient = Patient.query.get_or_404(id)
-    db.session.delete(patient)
+    # Soft delete: the patient's appointment history stays intact.
+    patient.soft_delete()
     db.session.commit()
     flash('Patient deleted successfully!', 'success')
     return redirect(url_for('admin.manage_patients'))
 
+@admin_bp.route('/patient/restore/<int:id>', methods=['POST'])
+@login_required
+@admin_required
+def restore_patient(id):
+    patient = Patient.query.execution_options(include_deleted=True).filter_by(id=id).first_or_404()
+    if patient.user_id is not None and Patient.query.filter(
+            Patient.user_id == patient.user_id, Patient.id != patient.id).first():
+        flash('This user already has another patient profile; restore is not possible.', 'danger')
+        return redirect(url_for('admin.manage_patients', show='deleted'))
+    patient.restore()
+    db.session.commit()
+    flash('Patient restored successfully!', 'success')
+    return redirect(url_for('admin.manage_patients'))
+
 
 # --- Appointment Management ---
 
@@ -195,7 +282,12 @@ def add_appointment():
         form.populate_obj(appointment)
         appointment.status = 'Scheduled'
         db.session.add(appointment)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('The doctor already has an appointment at that time.', 'danger')
+            return render_template('admin/appointment_form.html', form=form)
         flash('Appointment scheduled successfully!', 'success')
         return redirect(url_for('admin.manage_appointments'))
     return render_template('admin/appointment_form.html', form=form)
@@ -205,6 +297,7 @@ def add_appointment():
 @admin_bp.route('/appointment/view/<int:appointment_id>')
 @login_required
 @admin_required
+@cached(tables=('appointment', 'doctor', 'patient'))
 def view_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     return render_template('admin/view_appointment.html', appointment=appointment)
@@ -217,7 +310,12 @@ def edit_appointment(appointment_id):
     form = EditAppointmentForm(obj=appointment)
     if form.validate_on_submit():
         form.populate_obj(appointment)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('The doctor already has another appointment scheduled at that time.', 'danger')
+            return redirect(url_for('admin.edit_appointment', appointment_id=appointment_id))
         flash('Appointment updated successfully!', 'success')
         return redirect(url_for('admin.manage_appointments'))
     return render_template('admin/edit_appointment.html', form=form, appointment=appointment)
@@ -232,27 +330,95 @@ def delete_appointment(appointment_id):
     flash('Appointment deleted successfully!', 'success')
     return redirect(url_for('admin.manage_appointments'))
 
+@admin_bp.route('/reschedule', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def reschedule():
+    # NumPy is only needed here, so it is kept out of worker startup
+    from app import rescheduling
+    doctor_id = request.args.get('doctor_id', type=int)
+
+    if request.method == 'POST':
+        # Re-plan as of the preview and apply only if that gives exactly the moves shown
+        try:
+            planned_at = datetime.fromisoformat(request.form.get('planned_at', ''))
+        except ValueError:
+            planned_at = None
+        if planned_at is not None:
+            proposals, unplaced = rescheduling.plan(doctor_id, now=planned_at)
+        too_soon = datetime.now() + timedelta(hours=24)
+        if planned_at is None or rescheduling.fingerprint(proposals) != request.form.get('fingerprint') or \
+                any(p.new_date < too_soon for p in proposals):
+            flash('Appointments changed since the preview was shown. Nothing was moved; '
+                  'please review the updated changes and apply again.', 'warning')
+        else:
+            try:
+                moved = rescheduling.apply(proposals)
+            except IntegrityError:
+                db.session.rollback()
+                flash('A proposed slot was booked while you were reviewing. Nothing was moved; '
+                      'the changes below have been planned again, please review them and apply.', 'warning')
+            else:
+                moved_appointments = Appointment.query.options(
+                    joinedload(Appointment.patient), joinedload(Appointment.doctor)
+                ).filter(Appointment.id.in_([p.appointment_id for p in proposals])).all()
+                notify_many(moved_appointments, 'rescheduled')
+                flash(f'{moved} appointment(s) rescheduled.', 'success')
+                if unplaced:
+                    flash(f'{len(unplaced)} appointment(s) could not be placed and still need manual attention.', 'warning')
+                return redirect(url_for('admin.manage_appointments'))
+
+    planned_at = datetime.now().replace(microsecond=0)
+    proposals, unplaced = rescheduling.plan(doctor_id, now=planned_at)
+    doctor = Doctor.query.execution_options(include_deleted=True).filter_by(id=doctor_id).first() if doctor_id else None
+    return render_template('admin/reschedule.html', doctor=doctor,
+                           proposals=proposals, unplaced=unplaced, preview_limit=200,
+                           planned_at=planned_at.isoformat(), fingerprint=rescheduling.fingerprint(proposals))
+
 @admin_bp.route('/reports')
 @login_required
 @admin_required
 def reports():
+    # Only this page reads the snapshots, so it is kept out of worker startup
+    from app.analytics import compute_report, latest_snapshot, snapshot_root
+    # Optional date range (inclusive end date); only the partitions that can
+    # hold rows in the range are queried.
+    start = _parse_date(request.args.get('start'))
+    end = _parse_date(request.args.get('end'))
+    until = end + timedelta(days=1) if end else None
+
+    # Read the nightly snapshot when there is one: the all-time report is
+    # precomputed, a date range is aggregated from its memory-mapped columns.
+    snapshot = latest_snapshot(snapshot_root(current_app))
+    if snapshot is not None:
+        analytics = snapshot.report if start is None and end is None else compute_report(snapshot, start, until)
+        return render_template('admin/reports.html',
+                               status_labels=json.dumps(list(analytics['status'])),
+                               status_data=json.dumps(list(analytics['status'].values())),
+                               monthly_labels=json.dumps(list(analytics['monthly'])),
+                               monthly_data=json.dumps(list(analytics['monthly'].values())),
+                               analytics=analytics,
+                               start=start,
+                               end=end)
+
+    rows = appointment_rows(start, until)
+
     # --- Chart 1: Appointment Status Distribution ---
     status_counts = db.session.query(
-        Appointment.status, 
-        func.count(Appointment.status)
-    ).group_by(Appointment.status).all()
+        rows.c.status,
+        func.count(rows.c.status)
+    ).group_by(rows.c.status).all()
     
     # Prepare data for the doughnut chart
     status_labels = [status[0] for status in status_counts]
     status_data = [status[1] for status in status_counts]
 
     # --- Chart 2: Monthly Appointments (Last 12 Months) ---
+    month = func.strftime('%Y-%m', rows.c.appointment_date)
     monthly_counts = db.session.query(
-        func.strftime('%Y-%m', Appointment.appointment_date), 
-        func.count(Appointment.id)
-    ).group_by(func.strftime('%Y-%m', Appointment.appointment_date)).order_by(
-        func.strftime('%Y-%m', Appointment.appointment_date)
-    ).all()
+        month,
+        func.count(rows.c.id)
+    ).group_by(month).order_by(month).all()
     
     # Prepare data for the bar chart
     monthly_labels = [item[0] for item in monthly_counts]
@@ -262,7 +428,16 @@ def reports():
                            status_labels=json.dumps(status_labels),
                            status_data=json.dumps(status_data),
                            monthly_labels=json.dumps(monthly_labels),
-                           monthly_data=json.dumps(monthly_data))
+                           monthly_data=json.dumps(monthly_data),
+                           start=start,
+                           end=end)
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        flash(f'Ignoring invalid date "{value}"; use YYYY-MM-DD.', 'warning')
+        return None
     
 @admin_bp.route('/settings')
 @login_required
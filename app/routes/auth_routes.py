@@ -25,7 +25,7 @@ def login():
             if not next_page or urlparse(next_page).netloc != '':
                 if user.is_admin:
                     next_page = url_for('admin.dashboard')
-                elif user.doctor: # Add this check for doctors
+                elif user.doctor and not user.doctor.is_deleted: # Add this check for doctors
                     next_page = url_for('doctor.dashboard')
                 else:
                     next_page = url_for('patient.dashboard')
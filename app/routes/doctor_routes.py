@@ -2,15 +2,18 @@
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from app.models import Appointment, Patient
+from app.models import Appointment, Patient, appointment_history
+from app.notifications import notify
 from app.routes import doctor_bp # We will create this blueprint next
+from app.caching import cached
 from functools import wraps
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 
 def doctor_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or current_user.doctor is None:
+        if not current_user.is_authenticated or current_user.doctor is None or current_user.doctor.is_deleted:
             flash('You do not have permission to access this page.', 'danger')
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
@@ -28,10 +31,8 @@ def dashboard():
         Appointment.appointment_date >= now
     ).order_by(Appointment.appointment_date.asc()).all()
 
-    past_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.appointment_date < now
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # Past appointments may live in the archive partition as well
+    past_appointments = appointment_history(end=now, doctor_id=doctor.id)
     
     return render_template('doctor/dashboard.html', 
                            upcoming_appointments=upcoming_appointments,
@@ -40,6 +41,7 @@ def dashboard():
 @doctor_bp.route('/appointment/<int:appointment_id>', methods=['GET', 'POST'])
 @login_required
 @doctor_required
+@cached(tables=('appointment', 'doctor', 'patient'))
 def view_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     # Ensure the appointment belongs to the current doctor
@@ -48,9 +50,17 @@ def view_appointment(appointment_id):
         return redirect(url_for('doctor.dashboard'))
         
     if request.method == 'POST':
+        previous_status = appointment.status
         appointment.notes = request.form.get('notes')
         appointment.status = request.form.get('status', appointment.status)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('You already have another appointment scheduled at that time.', 'danger')
+            return redirect(url_for('doctor.view_appointment', appointment_id=appointment_id))
+        if appointment.status != previous_status:
+            notify(appointment, f'status_{appointment.status.lower()}')
         flash('Appointment details updated successfully.', 'success')
         return redirect(url_for('doctor.view_appointment', appointment_id=appointment.id))
         
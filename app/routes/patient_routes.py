@@ -2,10 +2,13 @@
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from app.models import Patient, Appointment, Doctor
+from app.models import Patient, Appointment, Doctor, appointment_history
 from app.forms import BookAppointmentForm, EditProfileForm
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app.notifications import notify
 from app.routes import patient_bp
+from app.caching import cached
 from functools import wraps
 
 # This is a helper decorator to ensure a patient profile exists for a route.
@@ -13,7 +16,9 @@ def profile_required(f):
     @wraps(f)
     @login_required
     def decorated_function(*args, **kwargs):
-        patient = Patient.query.filter_by(user_id=current_user.id).first()
+        patient = Patient.of_user(current_user.id)
+        if patient is not None and patient.is_deleted:
+            return _profile_deactivated()
         if not patient:
             flash('Please create your patient profile to access this page.', 'warning')
             return redirect(url_for('patient.edit_profile'))
@@ -21,6 +26,10 @@ def profile_required(f):
         return f(patient, *args, **kwargs)
     return decorated_function
 
+def _profile_deactivated():
+    flash('Your patient profile has been deactivated. Please contact the hospital.', 'danger')
+    return redirect(url_for('index'))
+
 # --- Patient Dashboard ---
 @patient_bp.route('/dashboard')
 @profile_required
@@ -30,10 +39,7 @@ def dashboard(patient):
         Appointment.patient_id == patient.id,
         Appointment.appointment_date > now
     ).order_by(Appointment.appointment_date.asc()).all()
-    past_appointments = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.appointment_date <= now
-    ).order_by(Appointment.appointment_date.desc()).all()
+    past_appointments = appointment_history(end=now, patient_id=patient.id)
     
     return render_template('patient/dashboard.html', 
                            patient=patient,
@@ -45,7 +51,10 @@ def dashboard(patient):
 @patient_bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    patient = Patient.of_user(current_user.id)
+    if patient is not None and patient.is_deleted:
+        # Never create a second profile next to a deleted one
+        return _profile_deactivated()
     form = EditProfileForm(obj=patient)
     
     if form.validate_on_submit():
@@ -75,6 +84,9 @@ def book_appointment(patient):
     form = BookAppointmentForm()
     # Query available doctors and pass to template
     available_doctors = Doctor.query.filter_by(is_available=True).all()
+    if request.method == 'GET' and request.args.get('doctor_id', type=int):
+        # Pre-select the doctor chosen on the dashboard
+        form.doctor_id.data = request.args.get('doctor_id', type=int)
     if form.validate_on_submit():
         appointment = Appointment(
             patient_id=patient.id,
@@ -84,7 +96,14 @@ def book_appointment(patient):
             status='Scheduled'
         )
         db.session.add(appointment)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Someone else booked this doctor's slot first
+            db.session.rollback()
+            flash('That time slot has just been booked. Please choose another time.', 'warning')
+            return render_template('patient/book_appointment.html', form=form, patient=patient, doctors=available_doctors)
+        notify(appointment, 'booked')
         # Debug print to confirm creation
         print(f"DEBUG: Created appointment: id={appointment.id}, patient_id={appointment.patient_id}, doctor_id={appointment.doctor_id}, date={appointment.appointment_date}, reason={appointment.reason}, status={appointment.status}")
         flash('Appointment booked successfully!', 'success')
@@ -98,6 +117,7 @@ def book_appointment(patient):
 
 @patient_bp.route('/view-appointment/<int:id>')
 @profile_required
+@cached(tables=('appointment', 'doctor', 'patient'))
 def view_appointment(patient, id):
     appointment = Appointment.query.get_or_404(id)
     if appointment.patient_id != patient.id:
@@ -120,6 +140,7 @@ def cancel_appointment(patient, id):
     
     appointment.status = 'Cancelled'
     db.session.commit()
+    notify(appointment, 'cancelled')
     flash('Appointment cancelled successfully.', 'success')
     return redirect(url_for('patient.dashboard'))
 
@@ -127,10 +148,8 @@ def cancel_appointment(patient, id):
 @patient_bp.route('/medical-history')
 @profile_required
 def medical_history(patient):
-    past_appointments = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.appointment_date < datetime.now()
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # Includes appointments that have been moved to the archive
+    past_appointments = appointment_history(end=datetime.now(), patient_id=patient.id)
     return render_template('patient/medical_history.html', patient=patient, past_appointments=past_appointments)
 
 @patient_bp.route('/request-records', methods=['GET', 'POST'])
@@ -148,6 +167,7 @@ def contact_support(patient):
 
 @patient_bp.route('/view-patient/<int:id>')
 @login_required
+@cached(tables=('patient',))
 def view_patient(id):
     patient = Patient.query.get_or_404(id)
     return render_template('patient/patient_view.html', patient=patient)
\ No newline at end of file
@@ -0,0 +1,72 @@
+# app/templating.py
+"""Ahead-of-time template compilation and ``url_for`` checks.
+
+With ``TEMPLATE_CACHE_DIR`` set, compiling every template once (at build
+time or worker start) means no request ever pays for Jinja compilation.
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import TemplateSyntaxError, nodes
+
+
+def warm_templates(app):
+    """Load every template into the environment (and bytecode cache)."""
+    env = app.jinja_env
+    for name in env.list_templates():
+        env.get_template(name)
+
+
+def compile_templates(app):
+    """Compile all templates; return a list of ``(template, error)`` failures."""
+    env = app.jinja_env
+    errors = []
+    for name in env.list_templates():
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError as e:
+            errors.append((name, f'line {e.lineno}: {e.message}'))
+    return errors
+
+
+def undefined_endpoints(app):
+    """Return ``(template, endpoint)`` pairs for ``url_for`` calls to unknown endpoints.
+
+    Only literal endpoint names can be checked; ``url_for(some_variable)`` is skipped.
+    Relative names (``.view``) are not used by this app's templates.
+    """
+    env = app.jinja_env
+    missing = []
+    for name in env.list_templates():
+        source, _, _ = env.loader.get_source(env, name)
+        try:
+            tree = env.parse(source)
+        except TemplateSyntaxError:
+            continue  # Reported by compile_templates
+        for call in tree.find_all(nodes.Call):
+            if not (isinstance(call.node, nodes.Name) and call.node.name == 'url_for'):
+                continue
+            if not call.args or not isinstance(call.args[0], nodes.Const):
+                continue
+            endpoint = call.args[0].value
+            if endpoint not in app.view_functions:
+                missing.append((name, endpoint))
+    return missing
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """Precompile all templates and fail on broken templates or endpoints."""
+    app = current_app._get_current_object()
+    errors = compile_templates(app)
+    errors.extend((name, f'url_for to undefined endpoint "{endpoint}"')
+                  for name, endpoint in undefined_endpoints(app))
+    for name, error in errors:
+        click.echo(f'{name}: {error}', err=True)
+    if errors:
+        raise click.ClickException(f'{len(errors)} template problem(s) found.')
+
+    count = len(app.jinja_env.list_templates())
+    where = app.config['TEMPLATE_CACHE_DIR'] or 'memory only; set TEMPLATE_CACHE_DIR to persist'
+    click.echo(f'Compiled {count} templates ({where}).')
@@ -0,0 +1,206 @@
+# app/tenancy.py
+"""Serve several hospitals (tenants) from one deployment.
+
+The tenant is resolved per request from the ``TENANT_HEADER`` header or the
+first label of the host name. Each tenant has its own database. Engines are
+created the first time a tenant is seen and kept in a small LRU, so memory
+and connection pools scale with *active* tenants instead of configured ones.
+
+With ``TENANT_DATABASES`` empty the app runs single-tenant exactly as before.
+Command-line jobs run once per tenant (see ``for_each_tenant``).
+"""
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+import click
+import sqlalchemy as sa
+from flask import abort, current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+
+
+class TenantSession(Session):
+    """Session that binds to the current tenant's engine when there is one."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = current_tenant_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class TenantEngines:
+    """Thread-safe LRU of per-tenant engines.
+
+    The shared lock only guards the LRU itself. A new engine is created (and
+    ``on_create`` run, which may create tables) under a lock of its tenant, so
+    requests for tenants that are already open never wait for it.
+    """
+
+    def __init__(self, max_engines, on_create=None):
+        self.max_engines = max_engines
+        self.on_create = on_create
+        self._engines = OrderedDict()
+        self._lock = Lock()
+        self._creating = {}  # tenant -> Lock held while its engine is created
+
+    def get(self, tenant, uri):
+        engine = self._cached(tenant)
+        if engine is not None:
+            return engine
+        with self._lock:
+            creating = self._creating.setdefault(tenant, Lock())
+        with creating:
+            # Another thread may have created it while this one waited
+            engine = self._cached(tenant)
+            if engine is not None:
+                return engine
+            engine = self._create(uri)
+            if self.on_create is not None:
+                try:
+                    self.on_create(engine)
+                except BaseException:
+                    self._dispose(engine)
+                    raise
+            evicted = []
+            with self._lock:
+                self._engines[tenant] = engine
+                del self._creating[tenant]
+                while len(self._engines) > self.max_engines:
+                    evicted.append(self._engines.popitem(last=False)[1])
+        for old in evicted:
+            # Connections still checked out finish normally; the pool is dropped
+            self._dispose(old)
+        return engine
+
+    def _cached(self, tenant):
+        with self._lock:
+            engine = self._engines.get(tenant)
+            if engine is not None:
+                self._engines.move_to_end(tenant)
+            return engine
+
+    def _create(self, uri):
+        return sa.create_engine(uri)
+
+    def _dispose(self, engine):
+        engine.dispose()
+
+    def items(self):
+        with self._lock:
+            return list(self._engines.items())
+
+    def __len__(self):
+        return len(self._engines)
+
+
+class Tenancy:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TENANT_DATABASES', {})
+        app.config.setdefault('TENANT_HEADER', 'X-Hospital')
+        app.config.setdefault('TENANT_MAX_ENGINES', 16)
+
+        from app import db
+        app.extensions['tenancy'] = TenantEngines(
+            app.config['TENANT_MAX_ENGINES'],
+            on_create=db.metadata.create_all if app.config.get('AUTO_CREATE_TABLES', True) else None,
+        )
+        if app.config['TENANT_DATABASES']:
+            app.before_request(_resolve_tenant)
+
+
+def current_tenant():
+    """Name of the tenant for this request, or ``None`` in single-tenant mode."""
+    return g.get('tenant') if has_app_context() else None
+
+
+def current_tenant_engine():
+    tenant = current_tenant()
+    if tenant is None:
+        return None
+    uri = current_app.config['TENANT_DATABASES'][tenant]
+    return current_app.extensions['tenancy'].get(tenant, uri)
+
+
+def scoped_user_id(user_id, tenant=None):
+    """The login id of a user: ``"<tenant>:<id>"``, or the plain id when single-tenant.
+
+    User ids are only unique within a tenant's database. Putting the tenant in
+    the id itself keeps the session and the "remember me" cookie of one
+    hospital from ever logging a user in at another.
+    """
+    return f'{tenant}:{user_id}' if tenant else str(user_id)
+
+
+def unscoped_user_id(login_id, tenant=None):
+    """The database id inside ``login_id`` if it was issued by ``tenant``, else ``None``."""
+    issuer, _, user_id = str(login_id).rpartition(':')
+    if (issuer or None) != tenant:
+        return None
+    try:
+        return int(user_id)
+    except ValueError:
+        return None
+
+
+def for_each_tenant(default_all=True):
+    """Run a CLI command once per tenant, with ``g.tenant`` set.
+
+    Adds a repeatable ``--tenant`` option. Without it the command runs for
+    every configured tenant, or, with ``default_all=False``, refuses to guess.
+    In single-tenant mode the command simply runs once. Place it below
+    ``with_appcontext``.
+    """
+    def decorator(command):
+        @click.option('--tenant', 'tenants', multiple=True, metavar='NAME',
+                      help='Hospital to run for (repeatable).' + (' Default: all.' if default_all else ''))
+        @wraps(command)
+        def wrapper(tenants, **kwargs):
+            from app import db
+            configured = current_app.config['TENANT_DATABASES']
+            if not configured:
+                if tenants:
+                    raise click.UsageError('--tenant needs TENANT_DATABASES to be configured.')
+                return command(**kwargs)
+            unknown = sorted(set(tenants) - set(configured))
+            if unknown:
+                raise click.BadParameter(f"unknown hospital(s): {', '.join(unknown)}", param_hint='--tenant')
+            if not tenants and not default_all:
+                raise click.UsageError('Pass --tenant to choose a hospital.')
+            for tenant in tenants or configured:
+                click.echo(f'[{tenant}]')
+                g.tenant = tenant
+                try:
+                    command(**kwargs)
+                finally:
+                    # Never carry objects from one hospital's database into the next
+                    db.session.remove()
+                    g.pop('tenant', None)
+        return wrapper
+    return decorator
+
+
+def tenant_optional(view):
+    """Let ``view`` run without a tenant (health checks, metrics).
+
+    A valid tenant in the request is still resolved; otherwise the view runs
+    against the default database.
+    """
+    view.tenant_optional = True
+    return view
+
+
+def _resolve_tenant():
+    tenants = current_app.config['TENANT_DATABASES']
+    tenant = request.headers.get(current_app.config['TENANT_HEADER'])
+    if not tenant:
+        tenant = request.host.split(':', 1)[0].split('.', 1)[0]
+    if tenant not in tenants:
+        if getattr(current_app.view_functions.get(request.endpoint), 'tenant_optional', False):
+            return
+        abort(404)
+    g.tenant = tenant
@@ -0,0 +1,171 @@
+# benchmarks/booking_concurrency.py
+"""Compare the async booking API (``app/asgi.py``) with the synchronous
+Flask booking page when many patients book at once.
+
+``--clients`` patients arrive together; each asks for a doctor's free slots
+and books one. The ASGI callable is driven in-process (no server needed),
+the Flask views through the test client on ``--threads`` threads. Latency is
+measured from the common start. A throwaway SQLite database is used::
+
+    python benchmarks/booking_concurrency.py --clients 500
+
+Also checks that when 50 patients race for the same slot exactly one wins.
+Under this much write contention an occasional synchronous request can wait
+out SQLite's 5-second busy timeout; it is listed as status 500.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DOCTORS = 200
+PATIENTS = 1000
+RACERS = 50
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def first_weekday(days_ahead):
+    day = date.today() + timedelta(days=days_ahead)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def slot(index, days_ahead):
+    """The ``index``-th bookable hour from ``days_ahead`` days out (ten a day, weekdays only)."""
+    day = first_weekday(days_ahead)
+    for _ in range(index // 10):
+        day = first_weekday((day - date.today()).days + 1)
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=8 + index % 10)
+
+
+def populate(flask_app):
+    from app import db
+    from app.models import Doctor, Patient, User
+    with flask_app.app_context():
+        db.session.execute(db.insert(User), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': '-'}
+            for i in range(1, PATIENTS + 1)])
+        db.session.execute(db.insert(Doctor), [
+            {'id': i, 'first_name': 'Doctor', 'last_name': str(i), 'specialization': 'Cardiology', 'is_available': True}
+            for i in range(1, DOCTORS + 1)])
+        db.session.execute(db.insert(Patient), [
+            {'id': i, 'user_id': i, 'first_name': 'Patient', 'last_name': str(i),
+             'date_of_birth': date(1980, 1, 1), 'email': f'patient{i}@example.com'}
+            for i in range(1, PATIENTS + 1)])
+        db.session.commit()
+
+
+class Client:
+    """Drives the ASGI callable directly, logged in as one user."""
+
+    def __init__(self, api, cookie):
+        self.api = api
+        self.cookie = cookie
+
+    async def call(self, method, path, body=None, query=''):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+                 'headers': [(b'host', b'localhost'), (b'cookie', f'session={self.cookie}'.encode()),
+                             (b'content-type', b'application/json')]}
+        data = json.dumps(body).encode() if body is not None else b''
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': data, 'more_body': False}
+
+        async def send(message):
+            sent.append((message, time.perf_counter()))
+
+        await self.api(scope, receive, send)
+        return sent[0][0]['status'], sent[1][1]
+
+
+async def run_async(api, cookie, clients, days_ahead):
+    async def race():
+        when = slot(0, days_ahead).strftime('%Y-%m-%dT%H:%M')
+        results = await asyncio.gather(*(
+            Client(api, cookie(user)).call('POST', '/api/appointments',
+                                           {'doctor_id': 1, 'appointment_date': when, 'reason': 'Race'})
+            for user in range(1, RACERS + 1)))
+        return sorted(status for status, _ in results)
+
+    async def patient(k, started):
+        client = Client(api, cookie(1 + k % PATIENTS))
+        doctor, when = 1 + k % DOCTORS, slot(k // DOCTORS, days_ahead + 7)
+        await client.call('GET', f'/api/doctors/{doctor}/availability', query=f'date={when.date()}')
+        status, done = await client.call('POST', '/api/appointments', {
+            'doctor_id': doctor, 'appointment_date': when.strftime('%Y-%m-%dT%H:%M'), 'reason': 'Check-up'})
+        return status, done - started
+
+    statuses = await race()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(patient(k, started) for k in range(clients)))
+    elapsed = time.perf_counter() - started
+    await api._engines.dispose_all()
+    return statuses, results, elapsed
+
+
+def run_sync(flask_app, cookie, clients, threads, days_ahead):
+    def patient(k):
+        client = flask_app.test_client()
+        client.set_cookie(flask_app.config['SESSION_COOKIE_NAME'], cookie(1 + k % PATIENTS))
+        doctor, when = 1 + k % DOCTORS, slot(k // DOCTORS, days_ahead)
+        client.get('/patient/book-appointment')
+        response = client.post('/patient/book-appointment', data={
+            'doctor_id': doctor, 'appointment_date': when.strftime('%Y-%m-%dT%H:%M'), 'reason': 'Check-up'})
+        return response.status_code, time.perf_counter() - started
+
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(threads) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(patient, range(clients)))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def report(label, results, elapsed):
+    latencies = [latency for _, latency in results]
+    statuses = sorted({status for status, _ in results})
+    print(f'{label:12s} {2 * len(results) / elapsed:7.0f} req/s   p50 {percentile(latencies, .5):5.2f} s   '
+          f'p99 {percentile(latencies, .99):5.2f} s   statuses {statuses}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=16, help='Threads serving the Flask requests.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Set before config.py is imported; never the configured database
+        os.environ.update(DATABASE_URL=f'sqlite:///{tmp}/bench.db', TENANT_DATABASES='', AUTO_CREATE_TABLES='1',
+                          NOTIFICATION_FILE=os.path.join(tmp, 'notifications.log'), RATELIMIT_ENABLED='0')
+        from app.asgi import application as api
+        flask_app = api.flask_app
+        flask_app.config['WTF_CSRF_ENABLED'] = False
+        populate(flask_app)
+        serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+        def cookie(user_id):
+            return serializer.dumps({'_user_id': str(user_id), '_fresh': True})
+
+        statuses, results, elapsed = asyncio.run(run_async(api, cookie, args.clients, days_ahead=3))
+        print(f'{RACERS} patients racing for one slot: {statuses.count(201)} x 201, {statuses.count(409)} x 409')
+        report('async API', results, elapsed)
+        report('sync Flask', *run_sync(flask_app, cookie, args.clients, args.threads, days_ahead=40))
+
+
+if __name__ == '__main__':
+    main()
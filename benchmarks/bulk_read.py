@@ -0,0 +1,110 @@
+# benchmarks/bulk_read.py
+"""Compare the ways of reading every appointment: the ORM against the
+streaming Core paths in ``app/bulk.py``.
+
+Builds a throwaway SQLite database, then runs each method in its own
+process so peak memory is measured separately::
+
+    python benchmarks/bulk_read.py --rows 1000000
+
+Prints the time and peak RSS growth of each method.
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+METHODS = ('orm', 'stream', 'list', 'columns')
+LABELS = {
+    'orm': 'Appointment.query.all()',
+    'stream': 'iter_appointments() streamed',
+    'list': 'list(iter_appointments())',
+    'columns': 'read_columns() (NumPy arrays)',
+}
+DOCTORS = 200
+PATIENTS = 50000
+
+
+def populate(rows):
+    from app import db
+    from app.models import Appointment, Doctor, Patient
+    db.session.execute(db.insert(Doctor), [
+        {'first_name': f'D{i}', 'last_name': 'Doctor', 'specialization': 'Cardiology', 'is_available': True}
+        for i in range(DOCTORS)])
+    db.session.execute(db.insert(Patient), [
+        {'first_name': f'P{i}', 'last_name': 'Patient', 'date_of_birth': date(1990, 1, 1),
+         'registration_date': datetime.now()}
+        for i in range(PATIENTS)])
+    # Completed visits spread over the past two years, one distinct minute each
+    rng = random.Random(0)
+    start = datetime.now() - timedelta(days=730)
+    minutes = rng.sample(range(730 * 24 * 60), rows)
+    for offset in range(0, rows, 100000):
+        db.session.execute(db.insert(Appointment), [
+            {'patient_id': rng.randint(1, PATIENTS), 'doctor_id': rng.randint(1, DOCTORS),
+             'appointment_date': start + timedelta(minutes=minute), 'status': 'Completed'}
+            for minute in minutes[offset:offset + 100000]])
+    db.session.commit()
+
+
+def measure(method):
+    import numpy as np
+    from app import bulk
+    from app.models import Appointment
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if method == 'orm':
+        count = len(Appointment.query.all())
+    elif method == 'stream':
+        count = sum(1 for _ in bulk.iter_appointments(partitions=False))
+    elif method == 'list':
+        count = len(list(bulk.iter_appointments(partitions=False)))
+    else:
+        columns = bulk.read_columns(bulk.appointment_select(partitions=False), {
+            'id': lambda v: np.array(v, dtype=np.int64),
+            'patient_id': lambda v: np.array(v, dtype=np.int32),
+            'doctor_id': lambda v: np.array(v, dtype=np.int32),
+            'appointment_date': lambda v: np.array(v, dtype='datetime64[s]'),
+            'status': lambda v: np.array(v, dtype='U9'),
+            'created_at': lambda v: np.array(v, dtype='datetime64[s]'),
+        })
+        count = len(columns['id'])
+    elapsed = time.perf_counter() - started
+    growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024  # KiB on Linux
+    print(f'{LABELS[method]:32s} {elapsed:6.1f} s  {growth:+7.0f} MB  ({count} rows)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--method', choices=METHODS, help=argparse.SUPPRESS)  # Child process
+    args = parser.parse_args()
+
+    if args.method:
+        from app import create_app
+        with create_app().app_context():
+            return measure(args.method)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Never the configured database; set before config.py is imported, and
+        # inherited by the child processes
+        os.environ.update(DATABASE_URL=f'sqlite:///{tmp}/bench.db', TENANT_DATABASES='', AUTO_CREATE_TABLES='1')
+        from app import create_app
+        with create_app().app_context():
+            print(f'Building {args.rows} appointments...')
+            populate(args.rows)
+
+        print(f'{"method":32s} {"time":>8s} {"peak RSS":>10s}')
+        for method in METHODS:
+            subprocess.run([sys.executable, __file__, '--method', method], check=True)
+
+
+if __name__ == '__main__':
+    main()
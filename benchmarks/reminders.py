@@ -0,0 +1,73 @@
+# benchmarks/reminders.py
+"""Measure reminder throughput: ``send_reminders`` over many appointments due
+within the next 24 hours.
+
+Builds a throwaway SQLite database and writes the messages to a throwaway
+file channel, so neither the configured database nor a mail server is used::
+
+    python benchmarks/reminders.py --appointments 100000
+
+Prints the time of the first run (every reminder due) and of a rerun
+(nothing left to send), and the reminders sent per second.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DOCTORS = 200
+PATIENTS = 20000
+
+
+def populate(appointments, now):
+    from app import db
+    from app.models import Appointment, Doctor, Patient
+    db.session.execute(db.insert(Doctor), [
+        {'first_name': f'D{i}', 'last_name': 'Doctor', 'specialization': 'Cardiology', 'is_available': True}
+        for i in range(DOCTORS)])
+    db.session.execute(db.insert(Patient), [
+        {'first_name': f'P{i}', 'last_name': 'Patient', 'date_of_birth': date(1990, 1, 1),
+         'email': f'p{i}@example.com', 'registration_date': now}
+        for i in range(PATIENTS)])
+    # Spread over the next 23 hours, so every appointment is due a reminder
+    step = timedelta(hours=23) / appointments
+    for offset in range(0, appointments, 50000):
+        db.session.execute(db.insert(Appointment), [
+            {'patient_id': i % PATIENTS + 1, 'doctor_id': i % DOCTORS + 1,
+             'appointment_date': now + timedelta(minutes=5) + step * i, 'status': 'Scheduled'}
+            for i in range(offset, min(offset + 50000, appointments))])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Never the configured database or channel; set before config.py is imported
+        os.environ.update(DATABASE_URL=f'sqlite:///{tmp}/bench.db', TENANT_DATABASES='', AUTO_CREATE_TABLES='1',
+                          NOTIFICATION_CHANNEL='file', NOTIFICATION_FILE=os.path.join(tmp, 'notifications.log'),
+                          NOTIFICATION_CONCURRENCY=str(args.concurrency))
+        from app import create_app
+        from app.notifications import send_reminders
+        with create_app().app_context():
+            now = datetime.now()
+            print(f'Building {args.appointments} appointments...')
+            populate(args.appointments, now)
+
+            for label in ('first run', 'rerun'):
+                started = time.perf_counter()
+                sent = send_reminders(now=now, batch_size=args.batch_size)
+                elapsed = time.perf_counter() - started
+                print(f'{label:10s} {elapsed:6.2f} s  {sent:7d} sent  ({sent / elapsed:8.0f} reminders/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/response_cache.py
+"""Measure cached-page throughput: ``/admin/doctors`` rendered on every
+request, served from the response cache, and revalidated with a 304.
+
+Builds a throwaway SQLite database and drives the app with Flask's test
+client, so no server or configured database is used::
+
+    python benchmarks/response_cache.py --doctors 500 --requests 500
+
+Prints the time and pages per second of each mode.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ('uncached', 'cached', 'revalidated')
+
+
+def populate(doctors):
+    from app import db
+    from app.models import Doctor, User
+    admin = User(username='admin', email='admin@example.com', is_admin=True)
+    admin.set_password('secret')
+    db.session.add(admin)
+    db.session.execute(db.insert(Doctor), [
+        {'first_name': f'D{i}', 'last_name': 'Doctor', 'specialization': 'Cardiology', 'is_available': True}
+        for i in range(doctors)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Never the configured database; set before config.py is imported
+        os.environ.update(DATABASE_URL=f'sqlite:///{tmp}/bench.db', TENANT_DATABASES='', AUTO_CREATE_TABLES='1',
+                          RATELIMIT_ENABLED='0')
+        from app import create_app
+        app = create_app()
+        app.config['WTF_CSRF_ENABLED'] = False  # log in with a plain POST
+        with app.app_context():
+            print(f'Building {args.doctors} doctors...')
+            populate(args.doctors)
+
+        cache = app.extensions['response_cache']
+        client = app.test_client()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'secret'})
+        etag = client.get('/admin/doctors').headers['ETag']
+
+        for mode in MODES:
+            cache.enabled = mode != 'uncached'
+            headers = {'If-None-Match': etag} if mode == 'revalidated' else {}
+            client.get('/admin/doctors', headers=headers)  # warm up
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                response = client.get('/admin/doctors', headers=headers)
+            elapsed = time.perf_counter() - started
+            print(f'{mode:12s} {elapsed:6.2f} s  status {response.status_code}  '
+                  f'({args.requests / elapsed:7.0f} pages/s)')
+
+
+if __name__ == '__main__':
+    main()
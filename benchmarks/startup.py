@@ -0,0 +1,68 @@
+# benchmarks/startup.py
+"""Measure worker boot time and first-request latency, with and without the
+compiled template cache (``TEMPLATE_CACHE_DIR``).
+
+Each run starts a fresh interpreter, so nothing is shared between runs::
+
+    python benchmarks/startup.py --runs 7
+
+Prints the median boot time (``create_app``), first and second
+``GET /auth/login`` for each configuration.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a child process: boot the app and time two requests
+WORKER = r'''
+import time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+boot = time.perf_counter() - started
+client = app.test_client()
+timings = [boot]
+for _ in range(2):
+    started = time.perf_counter()
+    client.get('/auth/login')
+    timings.append(time.perf_counter() - started)
+print(' '.join(f'{t * 1000:.2f}' for t in timings))
+'''
+
+
+def run(env, runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', WORKER], env=env, cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout
+        results.append([float(value) for value in out.split()])
+    return [statistics.median(column) for column in zip(*results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp}/bench.db', TENANT_DATABASES='',
+                   AUTO_CREATE_TABLES='1')
+        env.pop('TEMPLATE_CACHE_DIR', None)
+        cached = dict(env, TEMPLATE_CACHE_DIR=os.path.join(tmp, 'templates'))
+        # Build step: fill the bytecode cache once, as a deploy would
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'compile-templates'],
+                       env=cached, cwd=ROOT, capture_output=True, check=True)
+
+        print(f'median of {args.runs} runs     boot ms  first request ms  second request ms')
+        for label, run_env in (('no template cache', env), ('cache + warm-up', cached)):
+            boot, first, second = run(run_env, args.runs)
+            print(f'{label:24s} {boot:8.1f} {first:17.2f} {second:18.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,3 +9,78 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'hospital.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Multi-hospital mode: "name=uri,name=uri" maps each tenant to its own database.
+    # Leave unset to serve a single hospital from SQLALCHEMY_DATABASE_URI.
+    TENANT_DATABASES = dict(
+        item.split('=', 1) for item in (os.environ.get('TENANT_DATABASES') or '').split(',') if item
+    )
+    # Requests pick their tenant from this header, falling back to the subdomain
+    TENANT_HEADER = os.environ.get('TENANT_HEADER') or 'X-Hospital'
+    # Engines (and their connection pools) kept open for recently active tenants
+    TENANT_MAX_ENGINES = int(os.environ.get('TENANT_MAX_ENGINES') or 16)
+
+    # Create missing tables when the app starts. Set AUTO_CREATE_TABLES=0 in production
+    # and run `python setup_db.py` on deploy, so workers boot without touching the database.
+    # setup_db.py creates and upgrades the database of every hospital in TENANT_DATABASES.
+    AUTO_CREATE_TABLES = (os.environ.get('AUTO_CREATE_TABLES') or '1') == '1'
+
+    # Archived appointments are stored in one table per year, from this year up to
+    # the current one (older rows go into this year's table). Run
+    # `flask roll-partitions` before each new year when AUTO_CREATE_TABLES=0.
+    PARTITION_FIRST_YEAR = int(os.environ.get('PARTITION_FIRST_YEAR') or 2025)
+
+    # Directory where compiled Jinja templates are cached and shared between workers
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+
+    # Rate limits on form submissions, per endpoint or blueprint, keyed by client IP
+    # and/or submitted username. "N/period" is a token bucket; add " sliding" for a
+    # sliding window. See app/ratelimit.py.
+    RATELIMIT_ENABLED = (os.environ.get('RATELIMIT_ENABLED') or '1') == '1'
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE') or 'app.ratelimit.MemoryStore'
+    RATELIMIT_MAX_KEYS = int(os.environ.get('RATELIMIT_MAX_KEYS') or 10000)
+    RATELIMITS = {
+        'auth.login': {'ip': '20/minute', 'username': '5/minute'},
+        'auth.register': {'ip': '5/hour sliding'},
+    }
+    # Behind a load balancer or reverse proxy every request comes from the proxy's
+    # address, so all clients would share one "ip" limit. Set this to the number of
+    # proxies in front of the app to take the client IP (and scheme and host) from
+    # their X-Forwarded-* headers instead. Leave it at 0 when clients connect directly:
+    # the headers can be forged by anyone the app does not sit behind.
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS') or 0)
+
+    # Cached responses for pages that rarely change, invalidated when their tables
+    # are committed to. See app/caching.py.
+    RESPONSE_CACHE_ENABLED = (os.environ.get('RESPONSE_CACHE_ENABLED') or '1') == '1'
+    RESPONSE_CACHE_STORAGE = os.environ.get('RESPONSE_CACHE_STORAGE') or 'app.caching.MemoryCache'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES') or 1000)
+    RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT') or 300)
+
+    # /healthz, /readyz and /metrics (see app/metrics.py). With several worker processes,
+    # point METRICS_DIR at a directory they share so /metrics reports all of them.
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_WRITE_INTERVAL = int(os.environ.get('METRICS_WRITE_INTERVAL') or 5)
+    METRICS_SESSION_WINDOW = int(os.environ.get('METRICS_SESSION_WINDOW') or 900)
+    READINESS_TIMEOUT = float(os.environ.get('READINESS_TIMEOUT') or 2)
+
+    # Appointment notifications (see app/notifications.py): "file" or "smtp"
+    NOTIFICATION_CHANNEL = os.environ.get('NOTIFICATION_CHANNEL') or 'file'
+    NOTIFICATION_FILE = os.environ.get('NOTIFICATION_FILE') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'notifications.log')
+    NOTIFICATION_CONCURRENCY = int(os.environ.get('NOTIFICATION_CONCURRENCY') or 4)
+    # Background threads per worker that send the notices triggered by requests
+    # (0 sends them before the response, as the command-line jobs do)
+    NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS') or 2)
+    NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE') or 1000)
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') == '1'
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_SENDER = os.environ.get('MAIL_SENDER') or 'appointments@hospital.local'
+
+    # Columnar snapshots read by the admin reports (see app/analytics.py)
+    ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'analytics')
+    ANALYTICS_KEEP = int(os.environ.get('ANALYTICS_KEEP') or 3)
@@ -1,6 +1,54 @@
 # run.py - Application entry point
+import os
+import subprocess
+import sys
+import tempfile
 from app import create_app
 
+# Child process used by --profile-startup: a clean interpreter so that every
+# import is actually timed.
+_PROFILE_CODE = (
+    "import time; t = time.perf_counter(); "
+    "from app import create_app; create_app(); "
+    "print(f'{(time.perf_counter() - t) * 1000:.1f}')"
+)
+
+def profile_startup(target_ms=200, top=15):
+    """Print worker boot time and the slowest imports; exit 1 above target.
+
+    The worker boots as in production (``AUTO_CREATE_TABLES=0``) against a
+    throwaway database, so the configured one is never touched.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp}/profile.db', TENANT_DATABASES='',
+                   AUTO_CREATE_TABLES='0')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROFILE_CODE],
+                                capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        print(result.stderr)
+        return result.returncode
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append((int(self_us), int(cumulative_us), module.strip()))
+
+    boot_ms = float(result.stdout.strip().splitlines()[-1])
+    print(f"Worker boot: {boot_ms:.1f} ms (target {target_ms} ms)")
+    print("\nSlowest imports (self time):")
+    for self_us, cumulative_us, module in sorted(imports, reverse=True)[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms cumulative  {module}")
+    print("\nApplication modules (cumulative):")
+    for self_us, cumulative_us, module in imports:
+        if module == 'app' or module.startswith('app.'):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+    return 0 if boot_ms <= target_ms else 1
+
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    sys.exit(profile_startup())
+
 app = create_app()
 
 if __name__ == '__main__':
@@ -1,14 +1,200 @@
 import os
 import sys
+from datetime import datetime
 
 # Add current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from flask import g
+from sqlalchemy import Table, bindparam, delete, func, insert, inspect, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
 from app import create_app, db
-from app.models import User, Doctor, Patient, Appointment
+from app.archive import ARCHIVES
+from app.models import User, Doctor, Patient, Appointment, Notification, appointment_partitions, appointment_rows
+from app.notifications import notification_key
+from app.tenancy import current_tenant_engine
 
-def create_database():
-    app = create_app()
+def upgrade_schema(engine):
+    """Add columns introduced after a database was first created.
+
+    ``create_all()`` only creates missing tables, so older databases
+    need their new (nullable) columns added in place.
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} '
+                                  f'ADD COLUMN {preparer.quote(column.name)} {column_type}'))
+            print(f"Added column {table.name}.{column.name}.")
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except IntegrityError:
+                print(f"Could not create unique index {index.name}: existing rows violate it. "
+                      f"Resolve the duplicates and run this script again.")
+    upgrade_appointment_archive(engine)
+    upgrade_notification_keys(engine)
+    if engine.dialect.name == 'sqlite':
+        upgrade_sqlite_ids(engine)
+
+def upgrade_appointment_archive(engine):
+    """Move appointments archived before yearly partitions into them.
+
+    They used to share one ``appointment_archive`` table, which is dropped once
+    each row has been copied into the ``appointment_<yyyy>`` table of its year.
+    """
+    if not inspect(engine).has_table('appointment_archive'):
+        return
+    legacy = Table('appointment_archive', db.MetaData(), autoload_with=engine)
+    partitions = appointment_partitions(live=False)
+    with engine.begin() as conn:
+        for position, partition in enumerate(partitions):
+            table = partition.__table__
+            columns = [column.name for column in table.columns]
+            query = select(*(legacy.c[name] for name in columns))
+            # The first and last partitions also take rows dated before or after them
+            if position > 0:
+                query = query.where(legacy.c.appointment_date >= datetime(partition.year, 1, 1))
+            if position < len(partitions) - 1:
+                query = query.where(legacy.c.appointment_date < datetime(partition.year + 1, 1, 1))
+            conn.execute(insert(table).from_select(columns, query))
+        moved = conn.scalar(select(func.count()).select_from(legacy))
+        legacy.drop(conn)
+    print(f"Moved {moved} archived appointments into yearly partitions.")
+
+def upgrade_notification_keys(engine):
+    """Re-key notifications recorded before keys named the doctor and time.
+
+    Old keys were ``"<appointment id>:<kind>"``. Each is matched to the
+    appointment's current doctor and time so that reminders already sent are
+    not sent again.
+    """
+    table = Notification.__table__
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(table.c.id, table.c.appointment_id, table.c.kind,
+                   Appointment.doctor_id, Appointment.appointment_date)
+            .join(Appointment.__table__, Appointment.id == table.c.appointment_id)
+            .where(table.c.appointment_date.is_(None))
+        ).all()
+        if not rows:
+            return
+        rekeyed = [{'row_id': row.id, 'new_key': notification_key(row.appointment_id, row.kind, row.doctor_id,
+                                                                   row.appointment_date),
+                    'new_doctor_id': row.doctor_id, 'new_date': row.appointment_date} for row in rows]
+        existing = set()
+        for start in range(0, len(rekeyed), 500):
+            keys = [r['new_key'] for r in rekeyed[start:start + 500]]
+            existing.update(conn.scalars(select(table.c.key).where(table.c.key.in_(keys))))
+        duplicates = [r['row_id'] for r in rekeyed if r['new_key'] in existing]
+        if duplicates:
+            conn.execute(delete(table).where(table.c.id.in_(duplicates)))
+        rekeyed = [r for r in rekeyed if r['new_key'] not in existing]
+        if rekeyed:
+            conn.execute(update(table).where(table.c.id == bindparam('row_id')).values(
+                key=bindparam('new_key'), doctor_id=bindparam('new_doctor_id'),
+                appointment_date=bindparam('new_date')), rekeyed)
+    print(f"Re-keyed {len(rekeyed)} notifications.")
+
+def upgrade_sqlite_ids(engine):
+    """Stop SQLite from reusing the ids of archived rows.
+
+    Without AUTOINCREMENT, SQLite gives a new row the highest id in the table
+    plus one, so the id of the newest archived row is handed out again. Tables
+    created before ``sqlite_autoincrement`` was set are rebuilt, and every id
+    sequence is raised above the ids in the matching archive. Live rows that
+    already share an id with an archived row are renumbered, together with the
+    appointments and notifications that point at them.
+    """
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not table.dialect_options['sqlite']['autoincrement']:
+                continue
+            sql = conn.scalar(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {'name': table.name})
+            if sql is None or 'AUTOINCREMENT' in sql.upper():
+                continue
+            # SQLite cannot alter a primary key: copy into a new table and swap it in
+            name = preparer.format_table(table)
+            temp = preparer.quote(f'_new_{table.name}')
+            columns = ', '.join(preparer.quote(column.name) for column in table.columns)
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect)).strip()
+            conn.exec_driver_sql(ddl.replace(f'CREATE TABLE {name} ', f'CREATE TABLE {temp} ', 1))
+            conn.exec_driver_sql(f'INSERT INTO {temp} ({columns}) SELECT {columns} FROM {name}')
+            conn.exec_driver_sql(f'DROP TABLE {name}')
+            conn.exec_driver_sql(f'ALTER TABLE {temp} RENAME TO {name}')
+            for index in table.indexes:
+                index.create(conn)
+            print(f"Rebuilt {table.name} so that its ids are never reused.")
+
+        renumbered = {}
+        for model, archive in ARCHIVES.items():
+            live = model.__table__
+            archived = appointment_rows(live=False) if model is Appointment else archive.__table__
+            # Rows created while ids were still reused may share an id with an archived row
+            reused = conn.scalars(select(live.c.id).where(live.c.id.in_(select(archived.c.id)))).all()
+            highest = max(conn.scalar(select(func.max(live.c.id))) or 0,
+                          conn.scalar(select(func.max(archived.c.id))) or 0,
+                          conn.scalar(text('SELECT seq FROM sqlite_sequence WHERE name = :name'),
+                                      {'name': live.name}) or 0)
+            for old_id in reused:
+                highest += 1
+                conn.execute(update(live).where(live.c.id == old_id).values(id=highest))
+                renumbered.setdefault(model, {})[old_id] = highest
+            if reused:
+                print(f"Gave {len(reused)} {live.name} row(s) new ids that no archived row uses.")
+            conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': live.name})
+            conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                         {'name': live.name, 'seq': highest})
+        _follow_new_ids(conn, renumbered)
+
+def _follow_new_ids(conn, renumbered):
+    """Point appointments and notifications at the ids ``upgrade_sqlite_ids`` gave out."""
+    appointments, notifications = Appointment.__table__, Notification.__table__
+    archived = appointment_rows(live=False)
+    moved = set()
+    for old_id, new_id in renumbered.get(Appointment, {}).items():
+        # Notices about the archived appointment's doctor and time stay with it
+        gone = conn.execute(select(archived.c.doctor_id, archived.c.appointment_date)
+                            .where(archived.c.id == old_id)).one()
+        ids = conn.scalars(select(notifications.c.id).where(
+            notifications.c.appointment_id == old_id,
+            or_(notifications.c.doctor_id != gone.doctor_id,
+                notifications.c.appointment_date != gone.appointment_date))).all()
+        if ids:
+            conn.execute(update(notifications).where(notifications.c.id.in_(ids)).values(appointment_id=new_id))
+            moved.update(ids)
+    for old_id, new_id in renumbered.get(Doctor, {}).items():
+        conn.execute(update(appointments).where(appointments.c.doctor_id == old_id).values(doctor_id=new_id))
+        ids = conn.scalars(select(notifications.c.id).where(
+            notifications.c.doctor_id == old_id,
+            notifications.c.appointment_id.in_(select(appointments.c.id)
+                                               .where(appointments.c.doctor_id == new_id)))).all()
+        if ids:
+            conn.execute(update(notifications).where(notifications.c.id.in_(ids)).values(doctor_id=new_id))
+            moved.update(ids)
+    for old_id, new_id in renumbered.get(Patient, {}).items():
+        conn.execute(update(appointments).where(appointments.c.patient_id == old_id).values(patient_id=new_id))
+    if moved:
+        rows = conn.execute(select(notifications).where(notifications.c.id.in_(moved))).all()
+        conn.execute(update(notifications).where(notifications.c.id == bindparam('row_id')).values(
+            key=bindparam('new_key')),
+            [{'row_id': row.id, 'new_key': notification_key(row.appointment_id, row.kind, row.doctor_id,
+                                                             row.appointment_date)} for row in rows])
+
+def create_database(app=None):
+    """Create or upgrade the database, or every hospital's database with TENANT_DATABASES."""
+    app = app or create_app()
 
     # Ensure the instance directory exists
     instance_folder = 'instance'
@@ -17,35 +203,48 @@ def create_database():
         print(f"Created instance directory at: {instance_folder}")
 
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        print("Database and tables created successfully.")
-
-        # Check if admin already exists
-        if not User.query.filter_by(email='admin@example.com').first():
-            admin = User(username='admin', email='admin@example.com', is_admin=True)
-            admin.set_password('admin123')
-            db.session.add(admin)
-            print("Admin user created.")
-        else:
-            print("Admin user already exists. Skipping creation.")
-
-        # Check if doctors already exist to avoid duplicates
-        if not Doctor.query.first():
-            doctors = [
-                Doctor(first_name='John', last_name='Smith', specialization='Cardiology',
-                       contact_number='555-1234', email='john.smith@hospital.com'),
-                Doctor(first_name='Sarah', last_name='Johnson', specialization='Neurology',
-                       contact_number='555-5678', email='sarah.johnson@hospital.com'),
-                Doctor(first_name='Robert', last_name='Davis', specialization='Pediatrics',
-                       contact_number='555-9876', email='robert.davis@hospital.com')
-            ]
-            db.session.add_all(doctors)
-            print("Sample doctors added.")
-        else:
-            print("Doctors already exist. Skipping creation.")
-
-        db.session.commit()
+        for tenant in app.config['TENANT_DATABASES'] or [None]:
+            if tenant:
+                print(f"[{tenant}]")
+            g.tenant = tenant
+            try:
+                setup_tenant()
+            finally:
+                db.session.remove()
+
+def setup_tenant():
+    """Set up the database of the current tenant (``g.tenant``), or the default one."""
+    engine = current_tenant_engine() or db.engine
+    # Create all tables, then bring older tables up to date
+    db.metadata.create_all(engine)
+    upgrade_schema(engine)
+    print("Database and tables created successfully.")
+
+    # Check if admin already exists
+    if not User.query.filter_by(email='admin@example.com').first():
+        admin = User(username='admin', email='admin@example.com', is_admin=True)
+        admin.set_password('admin123')
+        db.session.add(admin)
+        print("Admin user created.")
+    else:
+        print("Admin user already exists. Skipping creation.")
+
+    # Check if doctors already exist to avoid duplicates
+    if not Doctor.query.first():
+        doctors = [
+            Doctor(first_name='John', last_name='Smith', specialization='Cardiology',
+                   contact_number='555-1234', email='john.smith@hospital.com'),
+            Doctor(first_name='Sarah', last_name='Johnson', specialization='Neurology',
+                   contact_number='555-5678', email='sarah.johnson@hospital.com'),
+            Doctor(first_name='Robert', last_name='Davis', specialization='Pediatrics',
+                   contact_number='555-9876', email='robert.davis@hospital.com')
+        ]
+        db.session.add_all(doctors)
+        print("Sample doctors added.")
+    else:
+        print("Doctors already exist. Skipping creation.")
+
+    db.session.commit()
 
 if __name__ == '__main__':
     create_database()
@@ -0,0 +1,110 @@
+# tests/conftest.py
+"""Fixtures and factories.
+
+The ``app`` fixture does not push an application context: a context left
+open across test-client requests would share ``g`` (the logged-in user, the
+tenant) between them. Factories push their own context and return detached,
+fully loaded objects; tests wrap their own queries in ``app.app_context()``.
+"""
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import pytest
+from flask import g
+from config import Config
+from app import create_app, db
+from app.models import Appointment, Doctor, Patient, User
+
+
+def make_config(tmp_path, **overrides):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "hospital.db"}'
+        TENANT_DATABASES = {}
+        RATELIMIT_ENABLED = False
+        NOTIFICATION_FILE = str(tmp_path / 'notifications.log')
+        ANALYTICS_DIR = str(tmp_path / 'analytics')
+        METRICS_DIR = None
+    for name, value in overrides.items():
+        setattr(TestConfig, name, value)
+    return TestConfig
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(make_config(tmp_path))
+    yield app
+    dispose(app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def dispose(app):
+    with app.app_context():
+        db.engine.dispose()
+    for _, engine in app.extensions['tenancy'].items():
+        engine.dispose()
+
+
+@contextmanager
+def context(app, tenant=None):
+    """An application context, for the tenant's database when ``tenant`` is given."""
+    with app.app_context():
+        if tenant is not None:
+            g.tenant = tenant
+        yield
+
+
+def _save(app, obj, tenant):
+    with context(app, tenant):
+        db.session.add(obj)
+        db.session.commit()
+        db.session.refresh(obj)  # Loaded now, so usable once the context is gone
+    return obj
+
+
+def make_user(app, username, password='secret', is_admin=False, tenant=None):
+    user = User(username=username, email=f'{username}@example.com', is_admin=is_admin)
+    user.set_password(password)
+    return _save(app, user, tenant)
+
+
+def make_doctor(app, first_name, last_name='Doctor', user=None, tenant=None, **fields):
+    return _save(app, Doctor(
+        first_name=first_name, last_name=last_name, specialization=fields.pop('specialization', 'Cardiology'),
+        email=f'{first_name.lower()}@hospital.com', user_id=user.id if user else None, **fields), tenant)
+
+
+def make_patient(app, first_name, last_name='Patient', user=None, tenant=None, **fields):
+    return _save(app, Patient(
+        first_name=first_name, last_name=last_name, date_of_birth=fields.pop('date_of_birth', date(1980, 5, 17)),
+        email=fields.pop('email', f'{first_name.lower()}@example.com'), user_id=user.id if user else None,
+        **fields), tenant)
+
+
+def make_appointment(app, patient, doctor, when, status='Scheduled', tenant=None, **fields):
+    return _save(app, Appointment(patient_id=patient.id, doctor_id=doctor.id, appointment_date=when,
+                                  reason=fields.pop('reason', 'Check-up'), status=status, **fields), tenant)
+
+
+def soft_delete(app, obj, tenant=None):
+    with context(app, tenant):
+        db.session.add(obj)
+        obj.soft_delete()
+        db.session.commit()
+        db.session.refresh(obj)
+    return obj
+
+
+def next_weekday(days_ahead=3, hour=10):
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=days_ahead)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def login(client, username, password='secret', **kwargs):
+    return client.post('/auth/login', data={'username': username, 'password': password}, **kwargs)
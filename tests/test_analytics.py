@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+import pytest
+from app.analytics import compute_report, export_snapshot, latest_snapshot
+from conftest import context, make_appointment, make_doctor, make_patient
+
+WEEK = (datetime(2020, 3, 2), datetime(2020, 3, 9))  # Monday to Monday: 5 weekdays
+
+
+def visit(app, patient, doctor, when, status, booked_before):
+    return make_appointment(app, patient, doctor, when, status=status, created_at=when - booked_before)
+
+
+@pytest.fixture
+def snapshot(app, tmp_path):
+    alba, bob = make_doctor(app, 'Alba'), make_doctor(app, 'Bob')
+    senior = make_patient(app, 'Sam', date_of_birth=date(1950, 6, 1), blood_group='O+')
+    adult = make_patient(app, 'Ada', date_of_birth=date(2000, 6, 1), blood_group='A-')
+    child = make_patient(app, 'Kim', date_of_birth=date(2020, 6, 1))
+    visit(app, senior, alba, datetime(2020, 3, 2, 9), 'Completed', timedelta(days=30))
+    visit(app, adult, alba, datetime(2020, 3, 3, 10), 'Scheduled', timedelta(hours=2))  # Never came
+    visit(app, child, bob, datetime(2020, 3, 4, 11), 'Cancelled', timedelta(days=5))
+    visit(app, senior, bob, datetime(2030, 1, 7, 9), 'Scheduled', timedelta(days=6))
+    with context(app):
+        return latest_snapshot(os.path.dirname(export_snapshot(str(tmp_path / 'analytics'))))
+
+
+def test_report_on_all_appointments(snapshot):
+    report = compute_report(snapshot)
+
+    assert report['total'] == 4
+    assert report['status'] == {'Scheduled': 2, 'Completed': 1, 'Cancelled': 1}
+    assert report['monthly'] == {'2020-03': 3, '2030-01': 1}
+    assert report['cancellation_rate'] == 0.25
+    assert report['no_show_rate'] == pytest.approx(1 / 3)  # One of three past appointments
+    assert report['lead_time']['histogram'] == {'< 1 day': 1, '1-6 days': 2, '1-4 weeks': 0, '1 month +': 1}
+    assert report['lead_time']['median_days'] == pytest.approx(5.5)
+    assert report['age_bands'] == {'0-17': 1, '18-34': 1, '35-49': 0, '50-64': 0, '65+': 1}
+    assert report['blood_groups'] == {**dict.fromkeys(('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'), 0),
+                                      'A-': 1, 'O+': 1}
+    # The stored all-time report is the same
+    assert snapshot.report == report
+
+
+def test_report_on_a_date_range(snapshot):
+    report = compute_report(snapshot, *WEEK)
+
+    assert report['total'] == 3
+    assert report['monthly'] == {'2020-03': 3}
+    # Booked (not cancelled) hours over 5 weekdays of 10 bookable hours
+    assert report['doctors'] == [
+        {'doctor': 'Alba Doctor', 'appointments': 2, 'utilization': 2 / 50},
+        {'doctor': 'Bob Doctor', 'appointments': 1, 'utilization': 0.0},
+    ]
+    assert report['age_bands']['65+'] == 1 and sum(report['age_bands'].values()) == 3
+
+
+def test_export_publishes_the_snapshot_and_keeps_the_latest(app, tmp_path):
+    root = tmp_path / 'analytics'
+    for old in ('20000101T000000', '20000102T000000', '20000103T000000'):
+        (root / old).mkdir(parents=True)
+    make_appointment(app, make_patient(app, 'Ann'), make_doctor(app, 'Alba'), datetime(2020, 3, 2, 9))
+
+    with context(app):
+        directory = export_snapshot(str(root), keep=2)
+
+    assert (root / 'LATEST').read_text() == os.path.basename(directory)
+    assert sorted(os.listdir(root)) == ['20000103T000000', os.path.basename(directory), 'LATEST']
+    assert {'appointment.id.npy', 'patient.date_of_birth.npy', 'doctors.json', 'report.json'} <= \
+        set(os.listdir(directory))
+    snapshot = latest_snapshot(str(root))
+    assert list(snapshot.column('appointment', 'doctor_id')) == [1]
+    assert json.loads((root / os.path.basename(directory) / 'doctors.json').read_text()) == {'1': 'Alba Doctor'}
+
+
+@pytest.fixture
+def far_east(monkeypatch):
+    # Well ahead of UTC, so that UTC and local time fall on either side of an appointment
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_no_shows_are_judged_in_local_time(app, tmp_path, far_east):
+    make_appointment(app, make_patient(app, 'Ann'), make_doctor(app, 'Alba'), datetime.now() - timedelta(hours=1))
+
+    with context(app):
+        snapshot = latest_snapshot(os.path.dirname(export_snapshot(str(tmp_path / 'analytics'))))
+
+    assert compute_report(snapshot)['no_show_rate'] == 1.0
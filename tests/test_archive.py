@@ -0,0 +1,113 @@
+from datetime import datetime
+from app import db
+from app.archive import ARCHIVES, archive_appointments, archive_deleted, find_archived, restore_archived
+from app.models import (Appointment, AppointmentArchive, Doctor, DoctorArchive, Notification, Patient, PatientArchive,
+                        partition_for)
+from app.notifications import notification_key
+from conftest import login, make_appointment, make_doctor, make_patient, make_user, soft_delete
+
+CUTOFF = datetime(2021, 1, 1)
+
+
+def test_archives_only_old_finished_appointments(app):
+    doctor, patient = make_doctor(app, 'Alba'), make_patient(app, 'Paula')
+    old_id = make_appointment(app, patient, doctor, datetime(2020, 3, 2, 9), status='Completed').id
+    make_appointment(app, patient, doctor, datetime(2020, 3, 3, 9), status='Scheduled')
+    make_appointment(app, patient, doctor, datetime(2022, 3, 2, 9), status='Completed')
+
+    with app.app_context():
+        assert archive_appointments(CUTOFF, batch_size=1) == 1
+        assert find_archived(Appointment, old_id) is not None
+        assert Appointment.query.count() == 2
+
+
+def test_archived_ids_are_not_reused(app):
+    doctor, patient = make_doctor(app, 'Alba'), make_patient(app, 'Paula')
+    newest_id = make_appointment(app, patient, doctor, datetime(2020, 3, 2, 9), status='Completed').id
+    with app.app_context():
+        archive_appointments(CUTOFF)
+
+    assert make_appointment(app, patient, doctor, datetime(2030, 3, 4, 9)).id > newest_id
+    with app.app_context():
+        assert archive_appointments(CUTOFF) == 0
+
+
+def test_reused_ids_are_renumbered_with_their_references(app):
+    from setup_db import upgrade_sqlite_ids
+
+    when = datetime(2030, 3, 4, 9)
+    appointment = make_appointment(app, make_patient(app, 'Paula'), make_doctor(app, 'Alba'), when)
+    with app.app_context():
+        # Archived before AUTOINCREMENT, so the live rows were given the same ids again
+        for model, archive in ARCHIVES.items():
+            rows = [dict(row._mapping, archived_at=CUTOFF) for row in db.session.execute(db.select(model.__table__))]
+            if archive is AppointmentArchive:
+                archive = partition_for(CUTOFF)
+                rows = [dict(row, appointment_date=CUTOFF) for row in rows]
+            db.session.execute(db.insert(archive), rows)
+        db.session.add_all([
+            Notification(key=notification_key(1, 'booked', 1, when), appointment_id=1, kind='booked',
+                         doctor_id=1, appointment_date=when),
+            Notification(key=notification_key(1, 'booked', 1, CUTOFF), appointment_id=1, kind='booked',
+                         doctor_id=1, appointment_date=CUTOFF),
+        ])
+        db.session.commit()
+
+        upgrade_sqlite_ids(db.engine)
+
+        moved = Appointment.query.one()
+        assert moved.id != appointment.id
+        assert (moved.doctor.first_name, moved.patient.first_name) == ('Alba', 'Paula')
+        assert moved.doctor_id != 1 and moved.patient_id != 1
+        notices = {n.appointment_date: n for n in Notification.query}
+        assert notices[when].key == notification_key(moved.id, 'booked', moved.doctor_id, when)
+        assert notices[CUTOFF].key == notification_key(1, 'booked', 1, CUTOFF)  # About the archived one
+
+
+def test_deleted_doctor_is_archived_after_its_appointments(app):
+    doctor, patient = make_doctor(app, 'Zedekiah'), make_patient(app, 'Paula')
+    appointment_id = make_appointment(app, patient, doctor, datetime(2020, 3, 2, 9), status='Completed').id
+    soft_delete(app, doctor)
+
+    with app.app_context():
+        # Still referenced by a live appointment
+        assert archive_deleted(Doctor, datetime.utcnow()) == 0
+        archive_appointments(CUTOFF)
+        assert archive_deleted(Doctor, datetime.utcnow()) == 1
+        assert Doctor.query.execution_options(include_deleted=True).count() == 0
+
+        archived = find_archived(Appointment, appointment_id)
+        assert archived.doctor.full_name == 'Zedekiah Doctor'
+
+
+def test_recently_deleted_rows_stay(app):
+    soft_delete(app, make_patient(app, 'Paula'))
+    with app.app_context():
+        assert archive_deleted(Patient, datetime(2000, 1, 1)) == 0
+
+
+def test_restoring_an_appointment_restores_its_doctor(app):
+    doctor, patient = make_doctor(app, 'Zedekiah'), make_patient(app, 'Paula')
+    appointment_id = make_appointment(app, patient, doctor, datetime(2020, 3, 2, 9), status='Completed').id
+    soft_delete(app, doctor)
+    with app.app_context():
+        archive_appointments(CUTOFF)
+        archive_deleted(Doctor, datetime.utcnow())
+
+        restored = restore_archived(Appointment, appointment_id)
+        assert restored.doctor.first_name == 'Zedekiah'
+        assert restored.doctor.is_deleted  # Back in the admin's deleted list
+        assert DoctorArchive.query.count() == 0
+
+
+def test_archived_patient_cannot_create_a_new_profile(app, client):
+    user = make_user(app, 'yolanda')
+    soft_delete(app, make_patient(app, 'Yolanda', user=user))
+    with app.app_context():
+        archive_deleted(Patient, datetime.utcnow())
+        assert PatientArchive.query.count() == 1
+    login(client, 'yolanda')
+
+    assert client.get('/patient/dashboard').location == '/'
+    with app.app_context():
+        assert Patient.of_user(user.id).is_deleted
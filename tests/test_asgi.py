@@ -0,0 +1,232 @@
+import asyncio
+import json
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import text
+from config import Config
+from app import create_app, db
+from app.models import Appointment, CacheVersion, Patient, User
+from app.tenancy import scoped_user_id
+from conftest import (context, dispose, login, make_appointment, make_config, make_doctor, make_patient,
+                      make_user, next_weekday, soft_delete)
+
+
+@pytest.fixture
+def asgi(tmp_path, monkeypatch):
+    # app.asgi builds its application on import; keep it off instance/hospital.db
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "hospital.db"}')
+    from app import asgi
+    return asgi
+
+
+def test_async_engines_are_bounded_and_evicted_ones_disposed(asgi, tmp_path):
+    async def main():
+        engines = asgi.AsyncTenantEngines(2)
+        first = engines.get('north', f'sqlite:///{tmp_path / "north.db"}')
+        async with first.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+        assert first.pool.checkedin() == 1
+
+        for tenant in ('south', 'east'):
+            engines.get(tenant, f'sqlite:///{tmp_path / tenant}.db')
+        assert [tenant for tenant, _ in engines.items()] == ['south', 'east']
+
+        await engines.dispose_all()
+        assert first.pool.checkedin() == 0  # The pooled connection was closed
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def api(asgi, app):
+    return asgi.BookingAPI(app)
+
+
+def run(api, coroutine):
+    """Run ``coroutine`` in a fresh event loop, closing the API's engines before it ends."""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await api._engines.dispose_all()
+    return asyncio.run(main())
+
+
+async def call(api, method, path, body=None, cookie=None, headers=None):
+    """Send one request through the ASGI interface; return ``(status, JSON payload)``."""
+    headers = {'host': 'localhost', **(headers or {})}
+    if cookie is not None:
+        headers['cookie'] = f"{api.config['SESSION_COOKIE_NAME']}={cookie}"
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+        headers.setdefault('content-type', 'application/json')
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': [(name.encode(), value.encode()) for name, value in headers.items()]}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body or b''}
+
+    async def send(message):
+        sent.append(message)
+
+    await api(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def session_cookie(app, username, tenant=None):
+    """The session cookie the site sets when ``username`` logs in."""
+    client = app.test_client()
+    login(client, username, headers={'X-Hospital': tenant} if tenant else None)
+    return client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+
+
+def booking(doctor, when, reason='Check-up'):
+    return {'doctor_id': doctor.id, 'appointment_date': when.strftime('%Y-%m-%dT%H:%M'), 'reason': reason}
+
+
+@pytest.fixture
+def alice(app):
+    make_patient(app, 'Alice', user=make_user(app, 'alice'))
+    return session_cookie(app, 'alice')
+
+
+def test_booking_a_slot_twice_conflicts(app, api, alice):
+    doctor = make_doctor(app, 'Bob')
+    when = next_weekday()
+
+    async def main():
+        return [await call(api, 'POST', '/api/appointments', booking(doctor, when), alice) for _ in range(2)]
+
+    (status, booked), (again, conflict) = run(api, main())
+    assert status == 201
+    assert booked['doctor_id'] == doctor.id and booked['status'] == 'Scheduled'
+    assert booked['appointment_date'] == when.strftime('%Y-%m-%dT%H:%M')
+    assert again == 409 and 'just been booked' in conflict['error']
+    with app.app_context():
+        assert Appointment.query.filter_by(doctor_id=doctor.id).count() == 1
+        assert db.session.get(Appointment, booked['id']).appointment_date == when
+        # Bumped once, by the booking that committed, so cached pages are refreshed
+        assert db.session.get(CacheVersion, 'appointment').version == 1
+
+
+def test_booking_requires_a_session_for_the_hospital(tmp_path, asgi):
+    tenants = {name: f'sqlite:///{tmp_path / name}.db' for name in ('north', 'south')}
+    app = create_app(make_config(tmp_path, TENANT_DATABASES=tenants))
+    api = asgi.BookingAPI(app)
+    doctor = make_doctor(app, 'Bob', tenant='south')
+    for tenant in tenants:
+        make_patient(app, 'Alice', user=make_user(app, 'alice', tenant=tenant), tenant=tenant)
+    north = session_cookie(app, 'alice', tenant='north')
+    body = booking(doctor, next_weekday())
+
+    async def main():
+        return [
+            await call(api, 'POST', '/api/appointments', body, headers={'X-Hospital': 'south'}),
+            await call(api, 'POST', '/api/appointments', body, 'forged', headers={'X-Hospital': 'south'}),
+            # The same user id exists at south, but the session was issued by north
+            await call(api, 'POST', '/api/appointments', body, north, headers={'X-Hospital': 'south'}),
+            await call(api, 'GET', f'/api/doctors/{doctor.id}/availability?date=2030-01-07', north,
+                       headers={'X-Hospital': 'south'}),
+        ]
+
+    assert [status for status, _ in run(api, main())] == [401, 401, 401, 401]
+    with context(app, 'south'):
+        assert Appointment.query.count() == 0
+    dispose(app)
+
+
+def test_deleted_profile_cannot_book(app, api):
+    soft_delete(app, make_patient(app, 'Alice', user=make_user(app, 'alice')))
+    make_user(app, 'carol')  # No profile at all
+    doctor = make_doctor(app, 'Bob')
+    body = booking(doctor, next_weekday())
+
+    async def main():
+        return [await call(api, 'POST', '/api/appointments', body, session_cookie(app, name))
+                for name in ('alice', 'carol')]
+
+    (deleted, refused), (missing, _) = run(api, main())
+    assert deleted == 403 and 'deactivated' in refused['error']
+    assert missing == 403
+
+
+def test_booking_is_validated(app, api, alice):
+    doctor = make_doctor(app, 'Bob')
+    absent = make_doctor(app, 'Dan', is_available=False)
+    when = next_weekday()
+    saturday = when + timedelta(days=5 - when.weekday())
+
+    async def main():
+        post = lambda body, **kwargs: call(api, 'POST', '/api/appointments', body, alice, **kwargs)  # noqa: E731
+        return [
+            await post(json.dumps(booking(doctor, when)).encode(), headers={'content-type': 'text/plain'}),
+            await post(json.dumps(booking(doctor, when)).encode(),
+                       headers={'content-type': 'application/json', 'origin': 'https://evil.example'}),
+            await post(b'{not json', headers={'content-type': 'application/json'}),
+            await post(b'[]', headers={'content-type': 'application/json'}),
+            await post({**booking(doctor, when), 'doctor_id': 'x'}),
+            await post({**booking(doctor, when), 'appointment_date': 'tomorrow'}),
+            await post(booking(doctor, when, reason='  ')),
+            await post(booking(doctor, when.replace(minute=30))),
+            await post(booking(doctor, when.replace(hour=19))),
+            await post(booking(doctor, saturday)),
+            await post(booking(doctor, when - timedelta(days=when.weekday() + 14))),
+            await post(booking(absent, when)),
+        ]
+
+    assert [status for status, _ in run(api, main())] == [415, 403, 400, 400, 400, 400, 400, 400, 400, 400, 400, 404]
+    with app.app_context():
+        assert Appointment.query.count() == 0
+
+
+def test_availability_lists_the_free_hours(app, api, alice):
+    doctor = make_doctor(app, 'Bob')
+    day = next_weekday(hour=0)
+    patient = make_patient(app, 'Carol')
+    make_appointment(app, patient, doctor, day.replace(hour=10))
+    make_appointment(app, patient, doctor, day.replace(hour=11), status='Cancelled')
+    saturday = day + timedelta(days=5 - day.weekday())
+
+    async def main():
+        get = lambda path: call(api, 'GET', path, cookie=alice)  # noqa: E731
+        return [
+            await get(f'/api/doctors/{doctor.id}/availability?date={day.date().isoformat()}'),
+            await get(f'/api/doctors/{doctor.id}/availability?date={saturday.date().isoformat()}'),
+            await get(f'/api/doctors/{doctor.id}/availability'),
+            await get(f'/api/doctors/{doctor.id + 1}/availability?date={day.date().isoformat()}'),
+        ]
+
+    (status, free), (_, weekend), (missing, _), (unknown, _) = run(api, main())
+    assert status == 200
+    assert free['doctor_id'] == doctor.id and free['date'] == day.date().isoformat()
+    # 8 AM to 5 PM, less the Scheduled 10 AM; the Cancelled 11 AM is free again
+    assert free['slots'] == [day.replace(hour=hour).strftime('%Y-%m-%dT%H:%M') for hour in range(8, 18) if hour != 10]
+    assert weekend['slots'] == []
+    assert (missing, unknown) == (400, 404)
+
+
+def test_only_one_of_many_racing_patients_gets_the_slot(app, api):
+    doctor = make_doctor(app, 'Bob')
+    when = next_weekday()
+    with app.app_context():
+        users = [User(username=f'racer{i}', email=f'racer{i}@example.com') for i in range(50)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all(Patient(first_name=f'Racer{user.id}', last_name='Patient', user_id=user.id,
+                                   date_of_birth=date(1980, 5, 17)) for user in users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+    # Cookies as the site signs them, without 50 password logins
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookies = [serializer.dumps({'_user_id': scoped_user_id(user_id)}) for user_id in user_ids]
+
+    async def main():
+        return await asyncio.gather(*(call(api, 'POST', '/api/appointments', booking(doctor, when), cookie)
+                                      for cookie in cookies))
+
+    statuses = sorted(status for status, _ in run(api, main()))
+    assert statuses == [201] + [409] * 49
+    with app.app_context():
+        assert Appointment.query.filter_by(doctor_id=doctor.id, appointment_date=when).count() == 1
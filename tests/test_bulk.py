@@ -0,0 +1,62 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from app import bulk
+from app.archive import archive_appointments
+from app.models import Appointment, appointment_history
+from conftest import context, make_appointment, make_doctor, make_patient
+
+COLUMNS = bulk.AppointmentRow.__slots__
+CONVERTERS = {
+    'id': lambda v: np.array(v, dtype=np.int64),
+    'patient_id': lambda v: np.array(v, dtype=np.int32),
+    'doctor_id': lambda v: np.array(v, dtype=np.int32),
+    'appointment_date': lambda v: np.array(v, dtype='datetime64[s]'),
+    'status': lambda v: np.array(v, dtype='U9'),
+    'created_at': lambda v: np.array(v, dtype='datetime64[s]'),
+}
+RANGES = [(None, None), (datetime(2020, 1, 1), datetime(2021, 1, 1)),
+          (None, datetime(2026, 1, 1)), (datetime(2029, 1, 1), None)]
+
+
+def as_tuples(rows):
+    return sorted(tuple(getattr(row, name) for name in COLUMNS) for row in rows)
+
+
+@pytest.fixture
+def archived_app(app):
+    doctor, patient = make_doctor(app, 'Alba'), make_patient(app, 'Paula')
+    for when, status in ((datetime(2020, 3, 2, 9), 'Completed'), (datetime(2020, 7, 1, 9), 'Cancelled'),
+                         (datetime(2020, 9, 1, 9), 'Scheduled'), (datetime(2025, 5, 5, 9), 'Completed'),
+                         (datetime(2030, 1, 7, 9), 'Scheduled')):
+        make_appointment(app, patient, doctor, when, status=status)
+    with context(app):
+        assert archive_appointments(datetime(2026, 1, 1)) == 3
+    return app
+
+
+@pytest.mark.parametrize('start, end', RANGES)
+def test_streamed_rows_match_the_orm_across_partitions(archived_app, start, end):
+    with context(archived_app):
+        expected = as_tuples(appointment_history(start, end))
+        assert as_tuples(bulk.iter_appointments(start, end, batch_size=2)) == expected
+
+        columns = bulk.read_columns(bulk.appointment_select(start, end), CONVERTERS, batch_size=2)
+        assert sorted(zip(*(columns[name].tolist() for name in COLUMNS))) == [
+            (row[0], row[1], row[2], row[3], row[4], row[5].replace(microsecond=0)) for row in expected]
+
+
+def test_live_rows_only_without_partitions(archived_app):
+    with context(archived_app):
+        expected = as_tuples(Appointment.query.all())
+        assert len(expected) == 2
+        assert as_tuples(bulk.iter_appointments(partitions=False)) == expected
+
+
+def test_empty_results(archived_app):
+    start, end = datetime(2027, 1, 1), datetime(2028, 1, 1)
+    with context(archived_app):
+        assert list(bulk.iter_appointments(start, end)) == []
+        columns = bulk.read_columns(bulk.appointment_select(start, end), CONVERTERS)
+    assert {name: (len(values), values.dtype) for name, values in columns.items()} == {
+        name: (0, convert(()).dtype) for name, convert in CONVERTERS.items()}
@@ -0,0 +1,130 @@
+from app import create_app, db
+from app.models import CacheVersion, Doctor
+from conftest import login, make_doctor, make_patient, make_user
+
+
+def another_worker(app):
+    """A second app instance on the same database, with its own response cache."""
+    return create_app(type('WorkerConfig', (), dict(app.config)))
+
+
+def rename_doctor(app, old, new):
+    with app.app_context():
+        Doctor.query.filter_by(first_name=old).one().first_name = new
+        db.session.commit()
+
+
+def test_page_is_served_from_cache_until_its_tables_change(app, client):
+    make_user(app, 'admin', is_admin=True)
+    make_doctor(app, 'Bob')
+    login(client, 'admin')
+    cache = app.extensions['response_cache']
+
+    assert 'Bob' in client.get('/admin/doctors').get_data(as_text=True)
+    hits = cache.hits
+    client.get('/admin/doctors')
+    assert cache.hits == hits + 1
+
+    rename_doctor(app, 'Bob', 'Robert')
+    assert 'Robert' in client.get('/admin/doctors').get_data(as_text=True)
+
+
+def test_change_committed_by_another_process_invalidates_the_cache(app, client):
+    make_user(app, 'admin', is_admin=True)
+    make_doctor(app, 'Bob')
+    login(client, 'admin')
+    assert 'Bob' in client.get('/admin/doctors').get_data(as_text=True)
+
+    rename_doctor(another_worker(app), 'Bob', 'Robert')
+
+    page = client.get('/admin/doctors').get_data(as_text=True)
+    assert 'Robert' in page and 'Bob' not in page
+    with app.app_context():
+        assert db.session.get(CacheVersion, 'doctor').version >= 1
+
+
+def test_revalidating_an_unchanged_page_gets_an_empty_304(app, client):
+    make_user(app, 'admin', is_admin=True)
+    make_doctor(app, 'Bob')
+    login(client, 'admin')
+
+    first = client.get('/admin/doctors')
+    assert first.status_code == 200 and first.headers['ETag']
+
+    again = client.get('/admin/doctors', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+
+    rename_doctor(app, 'Bob', 'Robert')
+    changed = client.get('/admin/doctors', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_public_page_is_shared_with_browsers_only_for_anonymous_visitors(app, client):
+    make_user(app, 'alice')
+
+    anonymous = client.get('/')
+    assert anonymous.cache_control.public and anonymous.cache_control.max_age == 60
+    assert 'Cookie' in anonymous.vary
+
+    login(client, 'alice')
+    logged_in = client.get('/')
+    assert logged_in.cache_control.private and logged_in.cache_control.no_cache
+    assert not logged_in.cache_control.public and logged_in.cache_control.max_age is None
+
+
+def test_user_page_is_private_to_the_browser(app, client):
+    make_user(app, 'admin', is_admin=True)
+    login(client, 'admin')
+
+    response = client.get('/admin/doctors')
+    assert response.cache_control.private and response.cache_control.no_cache
+    assert 'Cookie' in response.vary
+
+
+def test_two_users_never_share_a_cache_entry(app):
+    admin = make_user(app, 'admin', is_admin=True)
+    make_user(app, 'alice')
+    patient = make_patient(app, 'Carol', user=admin)
+    cache = app.extensions['response_cache']
+    admin_client, alice_client = app.test_client(), app.test_client()
+    login(admin_client, 'admin')
+    login(alice_client, 'alice')
+
+    admin_page = admin_client.get(f'/patient/view-patient/{patient.id}')
+    misses = cache.misses
+    alice_page = alice_client.get(f'/patient/view-patient/{patient.id}')
+    assert cache.misses == misses + 1
+    assert 'Admin Dashboard' in admin_page.get_data(as_text=True)
+    assert 'Admin Dashboard' not in alice_page.get_data(as_text=True)
+    assert alice_page.headers['ETag'] != admin_page.headers['ETag']
+
+    # Each user's second visit is their own hit
+    hits = cache.hits
+    admin_client.get(f'/patient/view-patient/{patient.id}')
+    alice_client.get(f'/patient/view-patient/{patient.id}')
+    assert cache.hits == hits + 2
+
+
+def doctor_version(app):
+    with app.app_context():
+        found = db.session.get(CacheVersion, 'doctor')
+        return found.version if found else 0
+
+
+def test_version_is_bumped_after_the_commit_and_not_on_rollback(app):
+    make_doctor(app, 'Bob')
+    before = doctor_version(app)
+
+    with app.app_context():
+        Doctor.query.filter_by(first_name='Bob').one().first_name = 'Robert'
+        db.session.flush()
+        db.session.rollback()
+    assert doctor_version(app) == before
+
+    with app.app_context():
+        Doctor.query.filter_by(first_name='Bob').one().first_name = 'Robert'
+        db.session.flush()
+        # Not written in the writer's transaction, so no row lock is held until commit
+        assert db.session.get(CacheVersion, 'doctor', populate_existing=True).version == before
+        db.session.commit()
+    assert doctor_version(app) == before + 1
@@ -0,0 +1,63 @@
+from threading import Thread, current_thread
+from sqlalchemy import event
+from app import create_app, db, monitoring
+from conftest import dispose, login, make_config, make_user
+
+
+def healthz_requests(app):
+    with app.app_context():
+        return sum(count for endpoint, method, status, count in monitoring.snapshot(app)['requests']
+                   if endpoint == 'healthz')
+
+
+def test_counters_of_finished_threads_are_kept_but_not_their_registry_entries(app):
+    before = healthz_requests(app)
+
+    def request():
+        app.test_client().get('/healthz')
+
+    for _ in range(50):
+        thread = Thread(target=request)
+        thread.start()
+        thread.join()
+
+    assert healthz_requests(app) == before + 50
+    assert [thread for thread, _, _ in monitoring._registry] == [current_thread()]
+
+
+def test_rejected_requests_are_counted(tmp_path):
+    app = create_app(make_config(tmp_path, TENANT_DATABASES={'north': f'sqlite:///{tmp_path / "north.db"}'},
+                                 RATELIMIT_ENABLED=True, RATELIMITS={'auth.login': {'ip': '1/hour'}}))
+    client = app.test_client()
+    client.get('/auth/login', headers={'X-Hospital': 'south'})
+    for _ in range(2):
+        client.post('/auth/login', data={}, headers={'X-Hospital': 'north'})
+
+    with app.app_context():
+        counted = {(endpoint, status): count for endpoint, method, status, count in monitoring.snapshot(app)['requests']}
+    assert counted.get(('auth.login', 404), 0) >= 1  # Unknown hospital
+    assert counted.get(('auth.login', 429), 0) >= 1
+    dispose(app)
+
+
+def test_requests_that_do_not_load_the_user_are_not_made_to(app, client):
+    user = make_user(app, 'alice')
+    login(client, 'alice')
+    queries = []
+
+    def record(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get('/static/style.css').status_code == 200
+        assert client.get('/healthz').status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert not [statement for statement in queries if 'FROM user' in statement]
+
+    client.get('/')  # Renders the navigation bar, which loads the user
+    with app.app_context():
+        assert f'None|{user.id}' in monitoring.snapshot(app)['sessions']
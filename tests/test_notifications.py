@@ -0,0 +1,112 @@
+import json
+import os
+from datetime import datetime, timedelta
+from threading import Event
+from app import db
+from app.models import Notification
+from app.notifications import Dispatcher, FileChannel, get_outbox, notify, send_reminders
+from conftest import login, make_appointment, make_doctor, make_patient, make_user
+
+NOW = datetime(2030, 1, 7, 9, 0)  # A Monday
+
+
+def sent(app):
+    with open(app.config['NOTIFICATION_FILE'], encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def booked(app, when, doctor=None):
+    doctor = doctor or make_doctor(app, 'Bob')
+    return make_appointment(app, make_patient(app, 'Ann'), doctor, when)
+
+
+def test_reminders_are_sent_once(app):
+    booked(app, NOW + timedelta(hours=5))
+
+    with app.app_context():
+        assert send_reminders(now=NOW) == 1
+        assert send_reminders(now=NOW) == 0
+    assert [m['kind'] for m in sent(app)] == ['reminder_24h']
+
+
+def test_moved_appointment_is_reminded_again(app):
+    appointment = booked(app, NOW + timedelta(hours=5))
+    cat = make_doctor(app, 'Cat')
+    with app.app_context():
+        assert send_reminders(now=NOW) == 1
+
+        appointment = db.session.merge(appointment)
+        appointment.appointment_date = NOW + timedelta(hours=8)
+        db.session.commit()
+        assert send_reminders(now=NOW) == 1
+
+        appointment.doctor_id = cat.id
+        db.session.commit()
+        assert send_reminders(now=NOW) == 1
+        assert send_reminders(now=NOW) == 0
+    assert [m['appointment_date'] for m in sent(app)] == [
+        str(NOW + timedelta(hours=5)), str(NOW + timedelta(hours=8)), str(NOW + timedelta(hours=8))]
+
+
+def test_notice_is_sent_again_for_a_new_time(app):
+    appointment = booked(app, NOW + timedelta(days=3))
+    with app.app_context():
+        appointment = db.session.merge(appointment)
+        notify(appointment, 'rescheduled')
+        notify(appointment, 'rescheduled')  # A resubmitted form
+        get_outbox().wait()
+
+        appointment.appointment_date += timedelta(days=1)
+        db.session.commit()
+        notify(appointment, 'rescheduled')
+        get_outbox().wait()
+
+        assert Notification.query.filter_by(appointment_id=appointment.id).count() == 2
+    assert len(sent(app)) == 2
+
+
+def test_setup_db_rekeys_legacy_notifications(app):
+    from setup_db import upgrade_notification_keys
+
+    appointment = booked(app, NOW + timedelta(hours=5))
+    with app.app_context():
+        db.session.add(Notification(key=f'{appointment.id}:reminder_24h', appointment_id=appointment.id,
+                                    kind='reminder_24h', recipient='ann@example.com'))
+        db.session.commit()
+
+        upgrade_notification_keys(db.engine)
+
+        # Already reminded before the upgrade, so not reminded again
+        assert send_reminders(now=NOW) == 0
+        notification = Notification.query.one()
+        assert notification.doctor_id == appointment.doctor_id
+        assert notification.appointment_date == appointment.appointment_date
+
+
+class HeldChannel(FileChannel):
+    """Connections wait until the test lets them through, like a slow mail server."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.release = Event()
+
+    def connect(self):
+        self.release.wait(5)
+        return super().connect()
+
+
+def test_request_does_not_wait_for_its_notice(app, client):
+    user = make_user(app, 'ann')
+    appointment = make_appointment(app, make_patient(app, 'Ann', user=user), make_doctor(app, 'Bob'),
+                                   NOW + timedelta(days=3))
+    channel = HeldChannel(app.config['NOTIFICATION_FILE'])
+    app.extensions['notifications'] = Dispatcher(channel)
+    login(client, 'ann')
+
+    assert client.post(f'/patient/cancel-appointment/{appointment.id}').status_code == 302
+    assert not os.path.exists(app.config['NOTIFICATION_FILE'])
+
+    channel.release.set()
+    with app.app_context():
+        get_outbox().wait(5)
+    assert [m['kind'] for m in sent(app)] == ['cancelled']
@@ -0,0 +1,86 @@
+from datetime import date, datetime
+import sqlalchemy as sa
+from app import db
+from app.archive import archive_appointments
+from app.models import Appointment, appointment_history, appointment_partition, appointment_partitions, appointment_rows
+from conftest import make_appointment, make_doctor, make_patient
+
+THIS_YEAR = date.today().year
+FIRST_YEAR = 2025  # PARTITION_FIRST_YEAR
+
+
+def years(partitions):
+    return [getattr(model, 'year', 'live') for model in partitions]
+
+
+def test_partitions_are_picked_from_both_bounds(app):
+    with app.app_context():
+        assert years(appointment_partitions(datetime(THIS_YEAR, 3, 1), datetime(THIS_YEAR, 4, 1))) == \
+            ['live', THIS_YEAR]
+        # The end is exclusive
+        assert years(appointment_partitions(datetime(FIRST_YEAR, 6, 1), datetime(FIRST_YEAR + 1, 1, 1))) == \
+            ['live', FIRST_YEAR]
+        assert years(appointment_partitions(end=datetime(FIRST_YEAR + 1, 1, 1))) == ['live', FIRST_YEAR]
+        assert years(appointment_partitions(start=datetime(THIS_YEAR, 1, 1))) == ['live', THIS_YEAR]
+        assert years(appointment_partitions()) == ['live', *range(FIRST_YEAR, THIS_YEAR + 1)]
+
+
+def test_dates_outside_the_partitions_go_to_the_first_and_last(app):
+    with app.app_context():
+        assert years(appointment_partitions(datetime(2001, 1, 1), datetime(2002, 1, 1))) == ['live', FIRST_YEAR]
+        assert years(appointment_partitions(start=datetime(THIS_YEAR + 5, 1, 1))) == ['live', THIS_YEAR]
+        assert years(appointment_partitions(live=False, end=datetime(FIRST_YEAR, 1, 1))) == [FIRST_YEAR]
+
+
+def test_history_reads_live_and_archived_rows(app):
+    doctor, patient = make_doctor(app, 'Alba'), make_patient(app, 'Paula')
+    dates = [datetime(2020, 5, 1, 9), datetime(FIRST_YEAR, 5, 1, 9), datetime(THIS_YEAR, 1, 2, 9)]
+    for when in dates:
+        make_appointment(app, patient, doctor, when, status='Completed')
+    make_appointment(app, make_patient(app, 'Ben'), doctor, datetime(FIRST_YEAR, 6, 1, 9), status='Completed')
+
+    with app.app_context():
+        assert archive_appointments(datetime(THIS_YEAR, 1, 1)) == 3
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(appointment_partition(FIRST_YEAR))) == 3
+
+        history = appointment_history(end=datetime(THIS_YEAR + 1, 1, 1), patient_id=patient.id)
+        assert [a.appointment_date for a in history] == sorted(dates, reverse=True)
+        assert [getattr(a, 'is_archived', False) for a in history] == [False, True, True]
+        assert history[1].doctor.first_name == 'Alba'
+
+        rows = appointment_rows(datetime(FIRST_YEAR, 1, 1), datetime(THIS_YEAR + 1, 1, 1))
+        counted = db.session.execute(sa.select(rows.c.patient_id, sa.func.count())
+                                     .group_by(rows.c.patient_id).order_by(rows.c.patient_id)).all()
+        # The 2020 row sits in the first partition but is outside the range
+        assert counted == [(patient.id, 2), (patient.id + 1, 1)]
+        assert appointment_history(start=datetime(THIS_YEAR + 1, 1, 1), patient_id=patient.id) == []
+
+
+def test_roll_partitions_creates_the_coming_year(app):
+    result = app.test_cli_runner().invoke(args=['roll-partitions', '--years', '2'])
+
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        tables = sa.inspect(db.engine).get_table_names()
+    assert {f'appointment_{year}' for year in range(THIS_YEAR, THIS_YEAR + 3)} <= set(tables)
+
+
+def test_setup_db_moves_the_old_archive_into_partitions(app):
+    from setup_db import upgrade_appointment_archive
+
+    columns = ', '.join(column.name for column in appointment_partition(FIRST_YEAR).__table__.columns)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('CREATE TABLE appointment_archive (id INTEGER PRIMARY KEY, patient_id INTEGER, '
+                                 'doctor_id INTEGER, appointment_date DATETIME, reason TEXT, notes TEXT, '
+                                 'status VARCHAR(20), created_at DATETIME, archived_at DATETIME)')
+            for row_id, year in ((1, 2019), (2, FIRST_YEAR), (3, THIS_YEAR)):
+                conn.exec_driver_sql(f"INSERT INTO appointment_archive ({columns}) VALUES "
+                                     f"({row_id}, 1, 1, '{year}-03-01 09:00:00', NULL, NULL, 'Completed', NULL, "
+                                     f"'{THIS_YEAR}-01-01 00:00:00')")
+
+        upgrade_appointment_archive(db.engine)
+
+        assert not sa.inspect(db.engine).has_table('appointment_archive')
+        for year, ids in ((FIRST_YEAR, [1, 2]), (THIS_YEAR, [3])):
+            assert db.session.scalars(sa.select(appointment_partition(year).id)).all() == ids
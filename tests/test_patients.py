@@ -0,0 +1,106 @@
+from datetime import date, datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app import db
+from app.models import Patient, _years_before
+from conftest import context, login, make_patient, make_user
+
+LEAP_BIRTHDAYS = [date(2000, 2, 28), date(2000, 2, 29), date(2000, 3, 1), date(2001, 2, 28), date(2001, 3, 1)]
+
+
+def age_on(born, today):
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def around_today(years):
+    """Birthdays from two days ago to two days ahead, ``years`` years back."""
+    today = date.today()
+    return [_years_before(today, years) + timedelta(days=offset) for offset in range(-2, 3)]
+
+
+def test_sql_age_matches_python_age(app):
+    births = [*around_today(17), *around_today(18), *around_today(65), *LEAP_BIRTHDAYS]
+    for number, born in enumerate(births):
+        make_patient(app, f'P{number}', date_of_birth=born)
+
+    with context(app):
+        ages = dict(db.session.execute(sa.select(Patient.date_of_birth, Patient.age)).all())
+        assert ages == {born: age_on(born, date.today()) for born in births}
+        assert {p.date_of_birth: p.age for p in Patient.query} == ages
+
+
+@pytest.mark.parametrize('today', [date(2028, 2, 28), date(2028, 2, 29), date(2027, 2, 28), date(2027, 3, 1)])
+def test_age_filter_around_29_february(app, today):
+    for number, born in enumerate(LEAP_BIRTHDAYS):
+        make_patient(app, f'P{number}', date_of_birth=born)
+
+    with context(app):
+        for low, high in ((26, 27), (27, 28), (28, 29), (26, None)):
+            found = {p.date_of_birth for p in Patient.query.filter(Patient.aged(low, high, today=today))}
+            assert found == {born for born in LEAP_BIRTHDAYS
+                             if low <= age_on(born, today) and (high is None or age_on(born, today) < high)}, \
+                (low, high)
+
+
+def test_age_is_rendered_for_each_dialect():
+    query = sa.select(Patient.age)
+    assert 'strftime' in str(query.compile(dialect=sqlite.dialect()))
+    assert 'age(patient.date_of_birth)' in str(query.compile(dialect=postgresql.dialect()))
+    # Any other database gets standard SQL rather than SQLite's functions
+    rendered = str(query.compile(dialect=mysql.dialect()))
+    assert 'EXTRACT(year FROM CURRENT_DATE)' in rendered and 'strftime' not in rendered
+
+
+# --- Admin patient list ---
+
+PEOPLE = [  # first name, last name, age, days since registration
+    ('Kit', 'Adams', 10, 3),
+    ('Tess', 'Baker', 17, 1),
+    ('Yul', 'Cole', 18, 5),
+    ('Mo', 'Diaz', 40, 0),
+    ('Fay', 'Evans', 55, 4),
+    ('Olga', 'Ford', 70, 2),
+]
+
+
+@pytest.fixture
+def admin_client(app, client):
+    make_user(app, 'admin', is_admin=True)
+    now = datetime.now()
+    for first, last, age, registered in PEOPLE:
+        # A 17-year-old whose birthday is tomorrow, an 18-year-old whose birthday is today
+        born = _years_before(date.today(), age + (first == 'Tess')) + timedelta(days=first == 'Tess')
+        make_patient(app, first, last, date_of_birth=born, registration_date=now - timedelta(days=registered))
+    login(client, 'admin')
+    return client
+
+
+def listed(client, **args):
+    page = client.get('/admin/patients', query_string=args).get_data(as_text=True)
+    names = [f'{first} {last}' for first, last, _, _ in PEOPLE]
+    found = [(page.index(name), name.split()[0]) for name in names if name in page]
+    return [first for _, first in sorted(found)]
+
+
+@pytest.mark.parametrize('sort, expected', [
+    ('name', ['Kit', 'Tess', 'Yul', 'Mo', 'Fay', 'Olga']),
+    ('-name', ['Olga', 'Fay', 'Mo', 'Yul', 'Tess', 'Kit']),
+    ('age', ['Kit', 'Tess', 'Yul', 'Mo', 'Fay', 'Olga']),
+    ('-age', ['Olga', 'Fay', 'Mo', 'Yul', 'Tess', 'Kit']),
+    ('registered', ['Yul', 'Fay', 'Kit', 'Olga', 'Tess', 'Mo']),
+    ('-registered', ['Mo', 'Tess', 'Olga', 'Kit', 'Fay', 'Yul']),
+])
+def test_patient_list_sorts(admin_client, sort, expected):
+    assert listed(admin_client, sort=sort) == expected
+
+
+@pytest.mark.parametrize('band, expected', [
+    ('0-17', ['Kit', 'Tess']),
+    ('18-34', ['Yul']),
+    ('35-49', ['Mo']),
+    ('50-64', ['Fay']),
+    ('65+', ['Olga']),
+])
+def test_patient_list_filters_by_age_band(admin_client, band, expected):
+    assert listed(admin_client, age=band, sort='age') == expected
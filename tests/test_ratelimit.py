@@ -0,0 +1,86 @@
+import pytest
+from app import create_app
+from app.ratelimit import Limit, MemoryStore
+from conftest import make_config
+
+
+def limited_app(tmp_path, hops=0, limits=None):
+    return create_app(make_config(tmp_path, RATELIMIT_ENABLED=True, PROXY_FIX_HOPS=hops,
+                                  RATELIMITS=limits or {'auth.register': {'ip': '2/hour sliding'}}))
+
+
+def register(client, forwarded_for):
+    return client.post('/auth/register', data={}, headers={'X-Forwarded-For': forwarded_for}).status_code
+
+
+def login(client, username):
+    return client.post('/auth/login', data={'username': username, 'password': 'wrong'}).status_code
+
+
+def test_clients_behind_a_trusted_proxy_have_their_own_limit(tmp_path):
+    client = limited_app(tmp_path, hops=1).test_client()
+    assert [register(client, '203.0.113.1') for _ in range(3)] == [200, 200, 429]
+    assert register(client, '203.0.113.2') == 200
+
+
+def test_forwarded_for_is_ignored_without_a_trusted_proxy(tmp_path):
+    client = limited_app(tmp_path, hops=0).test_client()
+    for _ in range(2):
+        register(client, '203.0.113.1')
+    # Forging the header does not get around the limit
+    assert register(client, '203.0.113.2') == 429
+
+
+def test_token_bucket_refills_evenly():
+    store, limit = MemoryStore(), Limit('2/minute')
+
+    assert [store.hit('k', limit, now=0) for _ in range(3)] == [0, 0, 30]
+    assert store.hit('k', limit, now=15) == pytest.approx(15)
+    # One token back every 30 seconds, never more than the bucket holds
+    assert store.hit('k', limit, now=30) == 0
+    assert store.hit('k', limit, now=30) == pytest.approx(30)
+    assert [store.hit('k', limit, now=600) for _ in range(3)] == [0, 0, 30]
+
+
+def test_sliding_window_weights_the_previous_window():
+    store, limit = MemoryStore(), Limit('10/minute sliding')
+
+    assert [store.hit('k', limit, now=30) for _ in range(11)] == [0] * 10 + [30]
+    # A quarter into the next window the previous one still counts for 7.5
+    assert [store.hit('k', limit, now=75) for _ in range(4)] == [0, 0, 0, 45]
+    # The previous window only counts when it directly precedes the current one
+    assert [store.hit('k', limit, now=185) for _ in range(11)] == [0] * 10 + [pytest.approx(55)]
+
+
+def test_usernames_have_their_own_limit(tmp_path):
+    client = limited_app(tmp_path, limits={'auth.login': {'username': '2/hour'}}).test_client()
+
+    assert [login(client, 'ann') for _ in range(3)] == [302, 302, 429]
+    assert login(client, 'bob') == 302
+    assert client.get('/auth/login').status_code == 200  # Only POSTs are counted
+
+
+def test_blueprint_limit_covers_all_its_endpoints(tmp_path):
+    app = limited_app(tmp_path, limits={'auth': {'ip': '2/hour'}})
+    client = app.test_client()
+    rejected = app.extensions['ratelimit'].rejected
+
+    assert login(client, 'ann') == 302
+    assert register(client, '203.0.113.1') == 200
+    response = client.post('/auth/login', data={})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 1800
+    assert app.extensions['ratelimit'].rejected == rejected + 1
+
+
+def test_memory_store_evicts_the_least_recently_used_key():
+    store, limit = MemoryStore(max_keys=2), Limit('1/hour')
+    store.hit('a', limit, now=0)
+    store.hit('b', limit, now=0)
+    assert store.hit('a', limit, now=1) > 0  # Used again, so b is now the oldest
+
+    store.hit('c', limit, now=2)
+
+    assert len(store) == 2
+    assert store.hit('b', limit, now=3) == 0  # Forgotten, so it starts afresh
+    assert store.hit('c', limit, now=3) > 0
@@ -0,0 +1,73 @@
+import re
+from app import db, rescheduling
+from app.models import Appointment
+from conftest import login, make_appointment, make_doctor, make_patient, make_user, next_weekday
+
+
+def preview(client):
+    page = client.get('/admin/reschedule').get_data(as_text=True)
+    return {name: re.search(rf'name="{name}" value="([^"]*)"', page).group(1)
+            for name in ('planned_at', 'fingerprint')}
+
+
+def setup_move(app):
+    """An appointment with an unavailable doctor, and a colleague free at the same hour."""
+    make_user(app, 'admin', is_admin=True)
+    away = make_doctor(app, 'Away', is_available=False)
+    colleague = make_doctor(app, 'Free')
+    when = next_weekday(days_ahead=5)
+    appointment = make_appointment(app, make_patient(app, 'Ann'), away, when)
+    return appointment.id, colleague, when
+
+
+def doctor_of(app, appointment_id):
+    with app.app_context():
+        return db.session.get(Appointment, appointment_id).doctor.first_name
+
+
+def test_apply_moves_what_was_previewed(app, client):
+    appointment_id, colleague, when = setup_move(app)
+    login(client, 'admin')
+
+    response = client.post('/admin/reschedule', data=preview(client))
+
+    assert response.status_code == 302
+    with app.app_context():
+        moved = db.session.get(Appointment, appointment_id)
+        assert (moved.doctor_id, moved.appointment_date) == (colleague.id, when)
+
+
+def test_changed_plan_is_shown_again_instead_of_applied(app, client):
+    appointment_id, colleague, when = setup_move(app)
+    login(client, 'admin')
+    form = preview(client)
+    # The previewed slot is taken in the meantime, so the plan moves elsewhere
+    make_appointment(app, make_patient(app, 'Ben'), colleague, when)
+
+    response = client.post('/admin/reschedule', data=form)
+
+    assert response.status_code == 200
+    assert 'Appointments changed since the preview' in response.get_data(as_text=True)
+    assert doctor_of(app, appointment_id) == 'Away'
+
+
+def test_slot_booked_during_apply_is_replanned(app, client, monkeypatch):
+    appointment_id, colleague, when = setup_move(app)
+    login(client, 'admin')
+    form = preview(client)
+    apply = rescheduling.apply
+
+    def racing_apply(proposals):
+        # Another request books the slot between planning and applying
+        make_appointment(app, make_patient(app, 'Ben'), colleague, when)
+        return apply(proposals)
+
+    monkeypatch.setattr(rescheduling, 'apply', racing_apply)
+    response = client.post('/admin/reschedule', data=form)
+
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'A proposed slot was booked while you were reviewing' in page
+    with app.app_context():
+        assert rescheduling.fingerprint(rescheduling.plan()[0]) in page
+    assert doctor_of(app, appointment_id) == 'Away'
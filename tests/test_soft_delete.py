@@ -0,0 +1,106 @@
+# tests/test_soft_delete.py
+"""Soft-deleted doctors and patients are hidden everywhere, but history still resolves."""
+from datetime import datetime
+from app import db
+from app.models import Appointment, Doctor, Patient
+from conftest import login, make_appointment, make_doctor, make_patient, make_user, next_weekday, soft_delete
+
+
+def test_deleted_rows_are_hidden_from_queries(app):
+    make_doctor(app, 'Alba')
+    gone = soft_delete(app, make_doctor(app, 'Zedekiah'))
+
+    with app.app_context():
+        assert [d.first_name for d in Doctor.query.all()] == ['Alba']
+        assert Doctor.query.filter_by(id=gone.id).first() is None
+        assert Doctor.query.execution_options(include_deleted=True).count() == 2
+
+
+def test_relationship_loads_keep_deleted_rows(app):
+    doctor, patient = make_doctor(app, 'Zedekiah'), make_patient(app, 'Paula')
+    appointment = make_appointment(app, patient, doctor, datetime(2020, 3, 2, 9), status='Completed')
+    soft_delete(app, doctor)
+
+    with app.app_context():
+        assert db.session.get(Appointment, appointment.id).doctor.first_name == 'Zedekiah'
+
+
+def test_admin_lists_hide_deleted_rows(app, client):
+    make_user(app, 'admin', is_admin=True)
+    make_doctor(app, 'Alba')
+    make_patient(app, 'Quentin')
+    soft_delete(app, make_doctor(app, 'Zedekiah'))
+    soft_delete(app, make_patient(app, 'Yolanda'))
+    login(client, 'admin')
+
+    page = client.get('/admin/doctors').get_data(as_text=True)
+    assert 'Alba' in page and 'Zedekiah' not in page
+    assert 'Zedekiah' in client.get('/admin/doctors?show=deleted').get_data(as_text=True)
+
+    page = client.get('/admin/patients').get_data(as_text=True)
+    assert 'Quentin' in page and 'Yolanda' not in page
+    assert 'Yolanda' in client.get('/admin/patients?show=deleted').get_data(as_text=True)
+
+    page = client.get('/admin/appointment/add').get_data(as_text=True)
+    assert 'Alba' in page and 'Quentin' in page
+    assert 'Zedekiah' not in page and 'Yolanda' not in page
+
+
+def test_patient_cannot_book_deleted_doctor(app, client):
+    user = make_user(app, 'paula')
+    make_patient(app, 'Paula', user=user)
+    make_doctor(app, 'Alba')
+    gone = soft_delete(app, make_doctor(app, 'Zedekiah'))
+    login(client, 'paula')
+
+    page = client.get('/patient/book-appointment').get_data(as_text=True)
+    assert 'Alba' in page and 'Zedekiah' not in page
+
+    response = client.post('/patient/book-appointment', data={
+        'doctor_id': gone.id, 'appointment_date': next_weekday().strftime('%Y-%m-%dT%H:%M'), 'reason': 'x'})
+    assert response.status_code == 200  # Form re-rendered with an error
+    with app.app_context():
+        assert Appointment.query.count() == 0
+
+
+def test_patient_history_shows_deleted_doctor(app, client):
+    user = make_user(app, 'paula')
+    patient = make_patient(app, 'Paula', user=user)
+    doctor = make_doctor(app, 'Zedekiah')
+    make_appointment(app, patient, doctor, datetime(2020, 3, 2, 9), status='Completed')
+    soft_delete(app, doctor)
+    login(client, 'paula')
+
+    assert 'Zedekiah' in client.get('/patient/medical-history').get_data(as_text=True)
+
+
+def test_deleted_doctor_loses_doctor_access(app, client):
+    user = make_user(app, 'zed')
+    soft_delete(app, make_doctor(app, 'Zedekiah', user=user))
+
+    response = login(client, 'zed')
+    assert response.location != '/doctor/dashboard'
+    assert client.get('/doctor/dashboard').location.startswith('/auth/login')
+
+
+def test_deleted_patient_cannot_create_second_profile(app, client):
+    user = make_user(app, 'yolanda')
+    soft_delete(app, make_patient(app, 'Yolanda', user=user))
+    login(client, 'yolanda')
+
+    assert client.get('/patient/dashboard').location == '/'
+    response = client.post('/patient/profile', data={
+        'first_name': 'Yolanda', 'last_name': 'Again', 'date_of_birth': '1990-01-01', 'gender': 'Female',
+        'blood_group': 'A+', 'contact_number': '555', 'email': 'y@example.com', 'address': 'Main St'})
+    assert response.location == '/'
+    with app.app_context():
+        assert Patient.query.execution_options(include_deleted=True).count() == 1
+
+
+def test_anonymous_client_is_sent_to_login(app, client):
+    # Each request gets its own context, so no user can leak in from a previous one
+    make_user(app, 'paula')
+    login(client, 'paula')
+    anonymous = app.test_client()
+
+    assert anonymous.get('/patient/dashboard').location.startswith('/auth/login')
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = '''
+import sys
+from app import create_app
+create_app()
+print(' '.join(sorted(m for m in ('app.archive', 'app.analytics', 'app.templating', 'smtplib', 'numpy',
+                                  'sqlalchemy.dialects.postgresql')
+                      if m in sys.modules)))
+'''
+
+
+def test_worker_boot_skips_maintenance_modules(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path / "boot.db"}', TENANT_DATABASES='',
+               AUTO_CREATE_TABLES='0')
+    env.pop('TEMPLATE_CACHE_DIR', None)
+    result = subprocess.run([sys.executable, '-c', BOOT], env=env, cwd=ROOT, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+    assert not (tmp_path / 'boot.db').exists()
+
+
+def test_commands_are_loaded_when_run(app):
+    runner = app.test_cli_runner()
+
+    assert 'roll-partitions' in runner.invoke(args=['--help']).output
+    result = runner.invoke(args=['roll-partitions'])
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,161 @@
+from datetime import date, datetime, timedelta
+import sqlite3
+from threading import Event, Thread
+import pytest
+import sqlalchemy as sa
+from app import create_app, db
+from app.models import Appointment, Doctor, appointment_rows
+from app.tenancy import TenantEngines
+from conftest import context, dispose, make_appointment, make_config, make_doctor, make_patient, make_user
+
+TENANTS = ('north', 'south')
+
+
+def tenant_config(tmp_path, **overrides):
+    return make_config(tmp_path, SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "default.db"}',
+                       TENANT_DATABASES={name: f'sqlite:///{tmp_path / name}.db' for name in TENANTS}, **overrides)
+
+
+@pytest.fixture
+def tenant_app(tmp_path):
+    app = create_app(tenant_config(tmp_path))
+    yield app
+    dispose(app)
+
+
+def add_old_appointment(tenant_app, tenant):
+    patient = make_patient(tenant_app, 'Ann', tenant=tenant)
+    doctor = make_doctor(tenant_app, 'Bob', tenant=tenant)
+    return make_appointment(tenant_app, patient, doctor, datetime.utcnow() - timedelta(days=400),
+                            status='Completed', tenant=tenant).id
+
+
+def count(tenant_app, tenant, model):
+    with context(tenant_app, tenant):
+        return db.session.scalar(sa.select(sa.func.count()).select_from(model))
+
+
+def test_cli_job_runs_for_every_tenant(tenant_app):
+    for tenant in TENANTS:
+        add_old_appointment(tenant_app, tenant)
+
+    result = tenant_app.test_cli_runner().invoke(args=['archive-appointments'])
+
+    assert result.exit_code == 0, result.output
+    assert '[north]' in result.output and '[south]' in result.output
+    for tenant in TENANTS:
+        assert count(tenant_app, tenant, Appointment) == 0
+        assert count(tenant_app, tenant, appointment_rows(live=False)) == 1
+
+
+def test_cli_job_runs_for_chosen_tenant(tenant_app):
+    for tenant in TENANTS:
+        add_old_appointment(tenant_app, tenant)
+
+    result = tenant_app.test_cli_runner().invoke(args=['archive-appointments', '--tenant', 'south'])
+
+    assert result.exit_code == 0, result.output
+    assert count(tenant_app, 'north', Appointment) == 1
+    assert count(tenant_app, 'south', appointment_rows(live=False)) == 1
+
+
+def test_cli_job_rejects_unknown_tenant(tenant_app):
+    result = tenant_app.test_cli_runner().invoke(args=['archive-appointments', '--tenant', 'east'])
+    assert result.exit_code != 0
+    assert 'east' in result.output
+
+
+def test_restore_needs_a_tenant(tenant_app):
+    appointment_id = add_old_appointment(tenant_app, 'north')
+    runner = tenant_app.test_cli_runner()
+    runner.invoke(args=['archive-appointments', '--tenant', 'north'])
+
+    result = runner.invoke(args=['restore-appointment', str(appointment_id)])
+    assert result.exit_code != 0
+    assert '--tenant' in result.output
+
+    result = runner.invoke(args=['restore-appointment', str(appointment_id), '--tenant', 'north'])
+    assert result.exit_code == 0, result.output
+    assert count(tenant_app, 'north', Appointment) == 1
+
+
+def test_setup_db_upgrades_every_tenant(tenant_app, tmp_path):
+    from setup_db import create_database
+
+    # A hospital database created before the soft-delete column existed
+    with sqlite3.connect(tmp_path / 'south.db') as conn:
+        conn.execute('CREATE TABLE doctor (id INTEGER PRIMARY KEY, first_name VARCHAR(50) NOT NULL, '
+                     'last_name VARCHAR(50) NOT NULL, specialization VARCHAR(100) NOT NULL, '
+                     'contact_number VARCHAR(20), email VARCHAR(120), is_available BOOLEAN, user_id INTEGER)')
+
+    create_database(tenant_app)
+
+    for tenant in TENANTS:
+        columns = {c['name'] for c in sa.inspect(sa.create_engine(tenant_app.config['TENANT_DATABASES'][tenant]))
+                   .get_columns('doctor')}
+        assert 'deleted_at' in columns
+        assert count(tenant_app, tenant, Doctor) == 3
+
+
+def test_setup_db_creates_every_tenant_without_auto_create(tmp_path):
+    from setup_db import create_database
+
+    app = create_app(tenant_config(tmp_path, AUTO_CREATE_TABLES=False))
+    assert not (tmp_path / 'north.db').exists()
+
+    create_database(app)
+
+    for tenant in TENANTS:
+        tables = sa.inspect(sa.create_engine(app.config['TENANT_DATABASES'][tenant])).get_table_names()
+        assert {'user', 'doctor', 'patient', 'appointment', f'appointment_{date.today().year}'} <= set(tables)
+        assert count(app, tenant, Doctor) == 3
+    dispose(app)
+
+
+@pytest.mark.parametrize('drop_session', [False, True])
+def test_login_is_only_valid_for_its_tenant(tenant_app, drop_session):
+    for tenant in TENANTS:
+        make_user(tenant_app, 'admin', is_admin=True, tenant=tenant)  # Same user id in both hospitals
+    client = tenant_app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'secret', 'remember_me': 'y'},
+                headers={'X-Hospital': 'north'})
+    if drop_session:
+        # A restored browser session: only the "remember me" cookie is left
+        client.delete_cookie(tenant_app.config['SESSION_COOKIE_NAME'])
+
+    assert client.get('/admin/dashboard', headers={'X-Hospital': 'north'}).status_code == 200
+    assert client.get('/admin/dashboard', headers={'X-Hospital': 'south'}).status_code == 302
+
+
+def test_new_engine_does_not_hold_up_other_tenants(tmp_path):
+    uris = {name: f'sqlite:///{tmp_path / name}.db' for name in TENANTS}
+    started, release = Event(), Event()
+    created = []
+
+    def create_tables(engine):
+        created.append(engine.url.database)
+        if engine.url.database.endswith('north.db'):
+            started.set()
+            release.wait(5)
+
+    engines = TenantEngines(4, on_create=create_tables)
+    south = engines.get('south', uris['south'])
+    results = []
+    openers = [Thread(target=lambda: results.append(engines.get('north', uris['north']))) for _ in range(2)]
+    for opener in openers:
+        opener.start()
+    assert started.wait(5)
+
+    # Still creating north's tables, yet south is served at once
+    other = Thread(target=lambda: results.append(engines.get('south', uris['south'])))
+    other.start()
+    other.join(1)
+    assert not other.is_alive() and results == [south]
+
+    release.set()
+    for opener in openers:
+        opener.join(5)
+    assert results[1] is results[2]
+    assert sum(name.endswith('north.db') for name in created) == 1
+    for _, engine in engines.items():
+        engine.dispose()